@@ -0,0 +1,243 @@
+"""Time crud functions and REST endpoints in-process against a seeded database.
+
+    python -m bench.seed --scale small --reset
+    python -m bench.run                      # check against bench/budgets.json
+    python -m bench.run --update-baseline    # re-record budgets on this machine
+    python -m bench.run -k messages --iterations 50
+
+Run from backend/ with the same DATABASE_URL used for seeding. Endpoints go
+through the ASGI app via httpx (no server, no Redis), so the numbers are app +
+database time. Exits non-zero if a case runs more statements than its query
+budget or its median latency exceeds the recorded baseline by more than
+--tolerance. Latency baselines are machine- and dataset-specific: re-record
+them with --update-baseline (query budgets are portable).
+"""
+import os
+
+# Must be set before the app (and database engine) is imported
+os.environ["SQL_INSTRUMENTATION"] = "true"
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import gc  # noqa: E402
+import json  # noqa: E402
+import re  # noqa: E402
+import statistics  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+from typing import Awaitable, Callable, Dict, List, NamedTuple  # noqa: E402
+
+import httpx  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import changes  # noqa: E402
+import crud  # noqa: E402
+import database  # noqa: E402
+import instrumentation  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+from bench.seed import BENCH_USERNAME  # noqa: E402
+from security import create_access_token  # noqa: E402
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), "budgets.json")
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class Case(NamedTuple):
+    name: str
+    # Runs one iteration; returns the number of SQL statements executed
+    run: Callable[[], Awaitable[int]]
+
+
+class Fixtures(NamedTuple):
+    user: models.User
+    workspace_id: str
+    channel_id: str
+    thread_parent_id: str
+    deep_skip: int
+    cursor: int  # Change-log head: /sync from here is the idle reconnect
+
+
+async def load_fixtures() -> Fixtures:
+    """Pick representative rows: the bench user, its busiest channel and thread"""
+    async with database.async_session_maker() as db:
+        user = await crud.get_user_by_username(db, BENCH_USERNAME)
+        if user is None:
+            sys.exit(f"{BENCH_USERNAME} not found; seed first with: python -m bench.seed --reset")
+        workspace_id = (await db.execute(
+            select(models.WorkspaceMember.workspace_id)
+            .filter(models.WorkspaceMember.user_id == user.id)
+            .order_by(models.WorkspaceMember.workspace_id)
+            .limit(1)
+        )).scalar_one()
+        channel_id, top_level = (await db.execute(
+            select(models.Message.channel_id, func.count(models.Message.id))
+            .join(models.Channel, models.Channel.id == models.Message.channel_id)
+            .filter(models.Channel.workspace_id == workspace_id, models.Channel.type == "public")
+            .filter(models.Message.parent_id.is_(None))
+            .group_by(models.Message.channel_id)
+            .order_by(func.count(models.Message.id).desc())
+            .limit(1)
+        )).one()
+        thread_parent_id = (await db.execute(
+            select(models.Message.parent_id)
+            .filter(models.Message.channel_id == channel_id, models.Message.parent_id.is_not(None))
+            .group_by(models.Message.parent_id)
+            .order_by(func.count(models.Message.id).desc())
+            .limit(1)
+        )).scalar()
+        cursor = await changes.head(db)
+    return Fixtures(
+        user, str(workspace_id), str(channel_id), str(thread_parent_id), max(top_level - 50, 0), cursor
+    )
+
+
+def build_cases(client: httpx.AsyncClient, fx: Fixtures) -> List[Case]:
+    user_id, ws, ch, parent = fx.user.id, fx.workspace_id, fx.channel_id, fx.thread_parent_id
+
+    def http(method: str, path: str, **kwargs) -> Case:
+        async def run() -> int:
+            response = await client.request(method, path, **kwargs)
+            response.raise_for_status()
+            match = _QUERIES_RE.search(response.headers.get("server-timing", ""))
+            return int(match.group(1)) if match else 0
+        name = f"{method} {re.sub(r'[0-9a-f]{8}-[0-9a-f-]{27}', '{id}', path)}"
+        if kwargs.get("params"):
+            name += "?" + "&".join(kwargs["params"])
+        return Case(name, run)
+
+    def db_call(name: str, call: Callable) -> Case:
+        async def run() -> int:
+            with instrumentation.scope(f"bench:{name}") as stats:
+                async with database.async_session_maker() as db:
+                    await call(db)
+            return stats.statements
+        return Case(name, run)
+
+    ws_uuid, ch_uuid, parent_uuid = uuid.UUID(ws), uuid.UUID(ch), uuid.UUID(parent)
+    return [
+        db_call("crud.get_user_workspaces", lambda db: crud.get_user_workspaces(db, user_id)),
+        db_call("crud.get_channels", lambda db: crud.get_channels(db, ws_uuid, user_id)),
+        db_call("crud.get_workspace_members", lambda db: crud.get_workspace_members(db, ws_uuid)),
+        db_call("crud.get_messages", lambda db: crud.get_messages(db, ch_uuid)),
+        db_call("crud.get_messages (deep page)", lambda db: crud.get_messages(db, ch_uuid, skip=fx.deep_skip)),
+        db_call("crud.get_thread_messages", lambda db: crud.get_thread_messages(db, parent_uuid)),
+        db_call("crud.get_notifications", lambda db: crud.get_notifications(db, user_id)),
+        db_call("crud.get_mentions", lambda db: crud.get_mentions(db, user_id)),
+        http("GET", "/users/me"),
+        http("GET", "/workspaces/"),
+        http("GET", f"/workspaces/{ws}"),
+        http("GET", f"/workspaces/{ws}/members"),
+        http("GET", "/channels/", params={"workspace_id": ws}),
+        http("GET", f"/channels/{ch}/messages"),
+        http("GET", f"/channels/{ch}/messages", params={"skip": fx.deep_skip}),
+        http("GET", f"/channels/{ch}/messages", params={"skip": fx.deep_skip, "format": "compact"}),
+        http("GET", f"/channels/{ch}/messages", params={"parent_id": parent}),
+        http("GET", "/notifications/"),
+        http("GET", "/users/me/mentions"),
+        http("GET", "/boot", params={"workspace_id": ws, "channel_id": ch}),
+        http("GET", "/sync", params={"workspace_id": ws, "since": fx.cursor, "channel_id": ch}),
+        http("POST", f"/channels/{ch}/messages", json={"content": "bench message", "channel_id": ch}),
+    ]
+
+
+async def measure(case: Case, iterations: int, warmup: int) -> Dict:
+    for _ in range(warmup):
+        await case.run()
+    # Like timeit: collect up front and keep the GC out of the timed runs
+    gc.collect()
+    gc.disable()
+    timings, queries = [], 0
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            statements = await case.run()
+            timings.append((time.perf_counter() - start) * 1000)
+            queries = max(queries, statements)
+    finally:
+        gc.enable()
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "max_ms": round(timings[-1], 2),
+        "queries": queries,
+    }
+
+
+def check(name: str, result: Dict, budget: Dict, tolerance: float) -> List[str]:
+    problems = []
+    if "max_queries" in budget and result["queries"] > budget["max_queries"]:
+        problems.append(f"{result['queries']} queries > budget {budget['max_queries']}")
+    # Gate on the median: p95 over a few dozen in-process runs is mostly noise
+    if "p50_ms" in budget and result["p50_ms"] > budget["p50_ms"] * (1 + tolerance):
+        problems.append(f"p50 {result['p50_ms']}ms > baseline {budget['p50_ms']}ms +{tolerance:.0%}")
+    return problems
+
+
+def load_budgets() -> Dict:
+    if not os.path.exists(BUDGETS_FILE):
+        return {}
+    with open(BUDGETS_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def run(args) -> int:
+    fixtures = await load_fixtures()
+    token = create_access_token({"sub": fixtures.user.username})
+    budgets = load_budgets()
+
+    transport = httpx.ASGITransport(app=main.app)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        cases = [case for case in build_cases(client, fixtures) if not args.k or args.k in case.name]
+        results, failures = {}, 0
+        print(f"{'case':<52} {'p50':>9} {'p95':>9} {'max':>9} {'queries':>8}  status")
+        for case in cases:
+            try:
+                result = results[case.name] = await measure(case, args.iterations, args.warmup)
+            except Exception as e:
+                failures += 1
+                print(f"{case.name:<52} ERROR: {e!r}")
+                continue
+            budget = budgets.get(case.name)
+            problems = check(case.name, result, budget, args.tolerance) if budget else []
+            status = "FAIL: " + "; ".join(problems) if problems else ("ok" if budget else "no baseline")
+            failures += bool(problems)
+            print(f"{case.name:<52} {result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms "
+                  f"{result['max_ms']:>7.2f}ms {result['queries']:>8}  {status}")
+
+    if args.update_baseline:
+        for name, result in results.items():
+            budgets[name] = {"max_queries": result["queries"], "p50_ms": result["p50_ms"], "p95_ms": result["p95_ms"]}
+        with open(BUDGETS_FILE, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(budgets.items())), f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Baselines written to {BUDGETS_FILE}")
+        failures = 0
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    await database.dispose()
+    return 1 if failures else 0
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--tolerance", type=float, default=float(os.getenv("BENCH_LATENCY_TOLERANCE", 0.5)),
+                        help="allowed median slowdown over baseline (0.5 = +50%%)")
+    parser.add_argument("-k", help="only run cases whose name contains this string")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main_cli()
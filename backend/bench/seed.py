@@ -0,0 +1,209 @@
+"""Bulk-seed a synthetic large-workspace dataset for the benchmark suite.
+
+    python -m bench.seed --scale small          # ~20k messages, seconds
+    python -m bench.seed --scale large          # ~2M messages
+    python -m bench.seed --messages 500000 --reset
+
+Run from backend/; targets DATABASE_URL (SQLite or Postgres). Rows go in
+through Core executemany batches, bypassing the ORM and bcrypt, so millions
+of rows take minutes rather than hours. Deterministic for a given --seed.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from database import engine
+import migrations
+import models
+from security import get_password_hash
+
+SCALES = {
+    "small": dict(workspaces=2, users=200, channels=60, messages=20_000),
+    "medium": dict(workspaces=4, users=2_000, channels=500, messages=200_000),
+    "large": dict(workspaces=8, users=5_000, channels=2_000, messages=2_000_000),
+}
+BATCH_SIZE = 5_000
+BENCH_PASSWORD = "bench-password"
+EMOJIS = ["👍", "🎉", "❤️", "😂", "👀", "🚀"]
+WORDS = ("deploy review lunch standup ticket merge sprint design outage patch "
+         "release budget meeting roadmap customer metrics latency cache query").split()
+
+# The benchmark logs in as this user; it belongs to every workspace
+BENCH_USERNAME = "bench_user_0"
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+async def _insert(conn, table, rows) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        await conn.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+async def seed(workspaces: int, users: int, channels: int, messages: int, seed: int = 42, reset: bool = False) -> dict:
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+
+    if reset:
+        await migrations.reset(engine)
+    await migrations.upgrade(engine)
+
+    password_hash = get_password_hash(BENCH_PASSWORD)  # One bcrypt for all users
+    user_rows = [{
+        "id": _uuid(rng),
+        "email": f"bench_user_{i}@example.com",
+        "username": f"bench_user_{i}",
+        "hashed_password": password_hash,
+        "full_name": f"Bench User {i}",
+        "role": "admin" if i == 0 else "user",
+        "created_at": now - timedelta(days=365),
+    } for i in range(users)]
+    user_ids = [row["id"] for row in user_rows]
+    usernames = {row["id"]: row["username"] for row in user_rows}
+
+    workspace_rows = [{
+        "id": _uuid(rng),
+        "name": f"Bench Workspace {i}",
+        "owner_id": user_ids[0],
+        "invite_code": f"bench{i}-{rng.getrandbits(32):08x}",
+        "created_at": now - timedelta(days=365),
+    } for i in range(workspaces)]
+
+    # Every user joins one or two workspaces; the bench user joins all
+    member_rows, members_by_workspace = [], {row["id"]: [] for row in workspace_rows}
+    for i, user_id in enumerate(user_ids):
+        joined = [row["id"] for row in workspace_rows] if i == 0 else rng.sample(
+            [row["id"] for row in workspace_rows], k=min(len(workspace_rows), rng.choice((1, 1, 2)))
+        )
+        for workspace_id in joined:
+            member_rows.append({
+                "workspace_id": workspace_id, "user_id": user_id,
+                "role": "admin" if i == 0 else "member", "joined_at": now - timedelta(days=300),
+            })
+            members_by_workspace[workspace_id].append(user_id)
+
+    channel_rows, channel_member_rows = [], []
+    for i in range(channels):
+        workspace_id = workspace_rows[i % len(workspace_rows)]["id"]
+        kind = rng.choices(("public", "private", "dm", "voice"), weights=(70, 15, 10, 5))[0]
+        channel_id = _uuid(rng)
+        channel_rows.append({
+            "id": channel_id, "name": f"{kind}-{i}", "description": None, "type": kind,
+            "owner_id": user_ids[0], "workspace_id": workspace_id, "created_at": now - timedelta(days=300),
+        })
+        if kind in ("private", "dm"):
+            pool = members_by_workspace[workspace_id]
+            chosen = {user_ids[0], *rng.sample(pool, k=min(len(pool), 2 if kind == "dm" else 25))}
+            channel_member_rows.extend({"channel_id": channel_id, "user_id": u, "joined_at": now} for u in chosen)
+
+    async with engine.begin() as conn:
+        await _insert(conn, models.User.__table__, user_rows)
+        await _insert(conn, models.Workspace.__table__, workspace_rows)
+        await _insert(conn, models.WorkspaceMember.__table__, member_rows)
+        await _insert(conn, models.Channel.__table__, channel_rows)
+        await _insert(conn, models.ChannelMember.__table__, channel_member_rows)
+
+    # Messages follow a skewed distribution: a few hot channels hold most
+    # of the history, like real workspaces.
+    text_channels = [row for row in channel_rows if row["type"] != "voice"]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(text_channels))))
+    start_time = now - timedelta(days=180)
+    step = timedelta(days=180) / max(messages, 1)
+    recent_parents = {}  # channel_id -> recent top-level message ids (thread targets)
+    counts = {"messages": 0, "reactions": 0, "mentions": 0, "notifications": 0}
+
+    done = 0
+    while done < messages:
+        batch = min(BATCH_SIZE * 4, messages - done)
+        message_rows, reaction_rows, mention_rows, notification_rows = [], [], [], []
+        for n in range(batch):
+            channel = rng.choices(text_channels, cum_weights=cum_weights)[0]
+            channel_id, workspace_id = channel["id"], channel["workspace_id"]
+            authors = members_by_workspace[workspace_id]
+            author = rng.choice(authors)
+            message_id = _uuid(rng)
+            parents = recent_parents.setdefault(channel_id, [])
+            parent_id = rng.choice(parents) if parents and rng.random() < 0.15 else None
+            content = " ".join(rng.choices(WORDS, k=rng.randint(3, 20)))
+
+            if rng.random() < 0.05:
+                mentioned = rng.choice(authors)
+                if mentioned != author:
+                    content += f" @{usernames[mentioned]}"
+                    mention_rows.append({
+                        "message_id": message_id, "user_id": mentioned, "created_at": start_time + step * (done + n),
+                    })
+                    notification_rows.append({
+                        "id": _uuid(rng), "user_id": mentioned, "content": "You were mentioned in a message",
+                        "type": "mention", "is_read": rng.random() < 0.7, "related_id": message_id,
+                        "created_at": start_time + step * (done + n),
+                    })
+
+            message_rows.append({
+                "id": message_id, "content": content, "channel_id": channel_id, "user_id": author,
+                "parent_id": parent_id, "created_at": start_time + step * (done + n),
+            })
+            if parent_id is None:
+                parents.append(message_id)
+                if len(parents) > 20:
+                    parents.pop(0)
+
+            if rng.random() < 0.1:
+                for emoji in rng.sample(EMOJIS, k=rng.randint(1, 3)):
+                    reaction_rows.append({
+                        "id": _uuid(rng), "message_id": message_id, "user_id": rng.choice(authors),
+                        "emoji": emoji, "created_at": start_time + step * (done + n),
+                    })
+
+        async with engine.begin() as conn:
+            await _insert(conn, models.Message.__table__, message_rows)
+            await _insert(conn, models.Reaction.__table__, reaction_rows)
+            await _insert(conn, models.message_mentions, mention_rows)
+            await _insert(conn, models.Notification.__table__, notification_rows)
+
+        done += batch
+        counts["messages"] += len(message_rows)
+        counts["reactions"] += len(reaction_rows)
+        counts["mentions"] += len(mention_rows)
+        counts["notifications"] += len(notification_rows)
+        print(f"  {done}/{messages} messages ({time.perf_counter() - started:.0f}s)", flush=True)
+
+    summary = {
+        "workspaces": len(workspace_rows), "users": len(user_rows), "channels": len(channel_rows),
+        **counts, "seconds": round(time.perf_counter() - started, 1),
+    }
+    print(f"Seeded {summary}")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--workspaces", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--messages", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="drop all tables first")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    async def run():
+        await seed(**sizes, seed=args.seed, reset=args.reset)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
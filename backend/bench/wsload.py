@@ -0,0 +1,506 @@
+"""WebSocket load generator for the realtime paths.
+
+    python -m bench.seed --scale small --reset
+    python -m bench.wsload --spawn --scenario chat --clients 500
+    python -m bench.wsload --url http://localhost:8001 --scenario typing --clients 2000 --duration 30
+
+Scenarios: chat (message bursts), typing (typing storms), reactions
+(add/remove floods on one message per channel), signaling (WebRTC offer /
+ICE fan-out), reconnect (every client drops and reconnects at once, in
+waves). --notifications also opens /ws/notifications for every user and
+mentions a channel member in each chat message.
+
+Clients are bench_user_* accounts from bench.seed, spread over the busiest
+public channels; tokens are minted locally, so the server must share
+SECRET_KEY and DATABASE_URL. All clients run in this process, so
+end-to-end latency is measured on one clock from send to each delivery.
+With --spawn a local uvicorn worker is started and its CPU / RSS sampled
+from /proc; event-loop lag comes from the server's /metrics either way
+(scraped with METRICS_TOKEN when set).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+from sqlalchemy import func, select
+
+import database
+import models
+from security import create_access_token
+
+SCENARIOS = ("chat", "typing", "reactions", "signaling", "reconnect")
+EMOJIS = ["👍", "🎉", "🚀"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.expected = 0
+        self.latencies: List[float] = []  # ms, send -> each delivery
+        self.notification_latencies: List[float] = []
+        self.notifications_expected = 0
+        self.connect_times: List[float] = []
+        self.connect_failures = 0
+        self.errors = 0
+
+    def summary(self, elapsed: float) -> Dict:
+        latencies = sorted(self.latencies)
+        notif = sorted(self.notification_latencies)
+        connects = sorted(self.connect_times)
+        return {
+            "connections": len(self.connect_times),
+            "connect_failures": self.connect_failures,
+            "connect_ms": {f"p{p}": round(percentile(connects, p), 1) for p in (50, 95, 99)},
+            "sent": self.sent,
+            "delivered": self.received,
+            "expected": self.expected,
+            "delivery_ratio": round(self.received / self.expected, 4) if self.expected else None,
+            "deliveries_per_s": round(self.received / elapsed, 1) if elapsed else 0,
+            "latency_ms": {
+                **{f"p{p}": round(percentile(latencies, p), 2) for p in (50, 90, 95, 99)},
+                "max": round(latencies[-1], 2) if latencies else 0,
+            },
+            "notifications": {
+                "delivered": len(notif),
+                "expected": self.notifications_expected,
+                **{f"p{p}_ms": round(percentile(notif, p), 2) for p in (50, 95, 99)},
+            } if self.notifications_expected else None,
+            "errors": self.errors,
+        }
+
+
+class Client:
+    """One simulated user connected to one channel"""
+
+    def __init__(self, harness: "Harness", username: str, user_id: str, channel_id: str):
+        self.harness = harness
+        self.username = username
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.token = create_access_token({"sub": username})
+        self.ws = None
+        self.reader: Optional[asyncio.Task] = None
+
+    async def connect(self) -> bool:
+        url = f"{self.harness.ws_base}/ws/{self.channel_id}/{self.token}"
+        start = time.perf_counter()
+        try:
+            self.ws = await websockets.connect(url, max_size=None, open_timeout=30)
+        except Exception:
+            self.harness.stats.connect_failures += 1
+            return False
+        self.harness.stats.connect_times.append((time.perf_counter() - start) * 1000)
+        self.reader = asyncio.create_task(self._read())
+        return True
+
+    async def close(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.ws is not None:
+            await self.ws.close()
+            self.ws = None
+
+    async def _read(self) -> None:
+        try:
+            async for raw in self.ws:
+                self.harness.on_delivery(json.loads(raw))
+        except (asyncio.CancelledError, websockets.ConnectionClosed):
+            pass
+
+    async def send(self, payload: Dict, key: str) -> None:
+        self.harness.sent_at[key] = time.perf_counter()
+        self.harness.stats.sent += 1
+        self.harness.stats.expected += len(self.harness.channels[self.channel_id])
+        try:
+            await self.ws.send(json.dumps(payload))
+        except Exception:
+            self.harness.stats.errors += 1
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.ws_base = args.url.replace("http", "ws", 1).rstrip("/")
+        self.stats = Stats()
+        self.sent_at: Dict[str, float] = {}  # event key -> perf_counter at send
+        self.message_sent_at: Dict[str, float] = {}  # message id -> send time (for notifications)
+        self.early_notifications: Dict[str, List[float]] = defaultdict(list)
+        self.channels: Dict[str, List[Client]] = defaultdict(list)
+        self.clients: List[Client] = []
+        self.notification_sockets = []
+        self.members: Dict[str, List[tuple]] = {}  # channel id -> [(username, user id)]
+        self.target_messages: Dict[str, str] = {}  # channel id -> message id for reaction floods
+
+    # --- Deliveries ---------------------------------------------------------
+
+    def on_delivery(self, data: Dict) -> None:
+        now = time.perf_counter()
+        kind = data.get("type")
+        if kind == "typing":
+            key = data.get("parent_id")
+        elif kind in ("reaction_add", "reaction_remove"):
+            key = f"{kind}:{data.get('message_id')}:{data.get('emoji')}:{data.get('user_id')}"
+        elif kind in ("call_offer", "ice_candidate"):
+            key = (data.get("payload") or {}).get("key")
+        elif "content" in data:
+            key = data["content"].split(" ", 1)[0]
+            if key in self.sent_at:
+                message_id = str(data.get("id"))
+                if message_id not in self.message_sent_at:
+                    self.message_sent_at[message_id] = self.sent_at[key]
+                    # The notification can overtake the channel broadcast
+                    for arrived in self.early_notifications.pop(message_id, ()):
+                        self.stats.notification_latencies.append((arrived - self.sent_at[key]) * 1000)
+                self.target_messages.setdefault(str(data.get("channel_id")), message_id)
+        else:
+            return
+        sent = self.sent_at.get(key)
+        if sent is not None:
+            self.stats.received += 1
+            self.stats.latencies.append((now - sent) * 1000)
+
+    def on_notification(self, data: Dict) -> None:
+        now = time.perf_counter()
+        related = str((data.get("data") or {}).get("related_id"))
+        sent = self.message_sent_at.get(related)
+        if sent is not None:
+            self.stats.notification_latencies.append((now - sent) * 1000)
+        else:
+            self.early_notifications[related].append(now)
+
+    # --- Setup --------------------------------------------------------------
+
+    async def load_topology(self) -> None:
+        """Busiest public channels and their workspace members, from the seeded DB"""
+        async with database.async_session_maker() as db:
+            rows = (await db.execute(
+                select(models.Channel.id, models.Channel.workspace_id)
+                .join(models.Message, models.Message.channel_id == models.Channel.id)
+                .filter(models.Channel.type == "public")
+                .group_by(models.Channel.id, models.Channel.workspace_id)
+                .order_by(func.count(models.Message.id).desc())
+                .limit(self.args.channels)
+            )).all()
+            if not rows:
+                sys.exit("No seeded channels found; run: python -m bench.seed --reset")
+            for channel_id, workspace_id in rows:
+                members = (await db.execute(
+                    select(models.User.username, models.User.id)
+                    .join(models.WorkspaceMember, models.WorkspaceMember.user_id == models.User.id)
+                    .filter(models.WorkspaceMember.workspace_id == workspace_id)
+                    .filter(models.User.username.like("bench_user_%"))
+                )).all()
+                self.members[str(channel_id)] = [(name, str(uid)) for name, uid in members]
+
+    async def connect_all(self) -> None:
+        channel_ids = list(self.members)
+        for i in range(self.args.clients):
+            channel_id = channel_ids[i % len(channel_ids)]
+            username, user_id = self.members[channel_id][(i // len(channel_ids)) % len(self.members[channel_id])]
+            client = Client(self, username, user_id, channel_id)
+            self.clients.append(client)
+            self.channels[channel_id].append(client)
+        await self._ramp(self.clients)
+
+        if self.args.notifications:
+            users = {client.username for client in self.clients}
+            await asyncio.gather(*(self._connect_notifications(username) for username in users))
+
+    async def _ramp(self, clients: List[Client]) -> None:
+        gate = asyncio.Semaphore(self.args.ramp)
+
+        async def one(client):
+            async with gate:
+                await client.connect()
+
+        await asyncio.gather(*(one(client) for client in clients))
+        # Drop clients that never connected from the fan-out expectations
+        for channel_id, members in self.channels.items():
+            self.channels[channel_id] = [c for c in members if c.ws is not None]
+
+    async def _connect_notifications(self, username: str) -> None:
+        token = create_access_token({"sub": username})
+        try:
+            ws = await websockets.connect(f"{self.ws_base}/ws/notifications/{token}", open_timeout=30)
+        except Exception:
+            self.stats.connect_failures += 1
+            return
+        self.notification_sockets.append(ws)
+
+        async def read():
+            try:
+                async for raw in ws:
+                    self.on_notification(json.loads(raw))
+            except (asyncio.CancelledError, websockets.ConnectionClosed):
+                pass
+
+        asyncio.create_task(read())
+
+    async def close_all(self) -> None:
+        await asyncio.gather(*(client.close() for client in self.clients), return_exceptions=True)
+        await asyncio.gather(*(ws.close() for ws in self.notification_sockets), return_exceptions=True)
+
+    # --- Scenarios ----------------------------------------------------------
+
+    def _chat_payload(self, client: Client) -> tuple:
+        key = uuid.uuid4().hex
+        content = f"{key} load test message"
+        if self.args.notifications:
+            # Mention someone with an open notification socket
+            others = [c for c in self.channels[client.channel_id] if c.user_id != client.user_id]
+            if others:
+                content += f" @{random.choice(others).username}"
+                self.stats.notifications_expected += 1
+        return {"content": content}, key
+
+    async def _drive(self, client: Client, make_payload, interval: float, deadline: float) -> None:
+        # Randomised start so clients don't send in lockstep
+        await asyncio.sleep(random.random() * interval)
+        while time.perf_counter() < deadline and client.ws is not None:
+            payload, key = make_payload(client)
+            await client.send(payload, key)
+            await asyncio.sleep(interval)
+
+    async def run_scenario(self) -> float:
+        args = self.args
+        scenario = args.scenario
+        interval = 1 / args.rate
+        start = time.perf_counter()
+        deadline = start + args.duration
+        senders = [c for c in self.clients if c.ws is not None][:max(1, int(len(self.clients) * args.senders))]
+
+        if scenario == "chat":
+            await asyncio.gather(*(self._drive(c, self._chat_payload, interval, deadline) for c in senders))
+
+        elif scenario == "typing":
+            def typing(client):
+                key = uuid.uuid4().hex
+                return {"type": "typing", "parent_id": key}, key
+            await asyncio.gather(*(self._drive(c, typing, interval, deadline) for c in senders))
+
+        elif scenario == "signaling":
+            def signal(client):
+                key = uuid.uuid4().hex
+                kind = random.choice(("call_offer", "ice_candidate", "ice_candidate", "ice_candidate"))
+                return {"type": kind, "payload": {"key": key, "candidate": "candidate:0 1 UDP 2122252543 10.0.0.1 54400 typ host"}}, key
+            await asyncio.gather(*(self._drive(c, signal, interval, deadline) for c in senders))
+
+        elif scenario == "reactions":
+            # One target message per channel, then add/remove floods on it
+            for channel_id, members in self.channels.items():
+                if members:
+                    payload, key = self._chat_payload(members[0])
+                    await members[0].send(payload, key)
+            for _ in range(100):
+                if len(self.target_messages) >= len([m for m in self.channels.values() if m]):
+                    break
+                await asyncio.sleep(0.1)
+            # Only the flood itself counts towards delivery stats
+            self.stats = self._reset_delivery_stats()
+            added = set()
+
+            def reaction(client):
+                message_id = self.target_messages.get(client.channel_id)
+                emoji = random.choice(EMOJIS)
+                state = (message_id, emoji, client.user_id)
+                kind = "reaction_remove" if state in added else "reaction_add"
+                (added.discard if kind == "reaction_remove" else added.add)(state)
+                key = f"{kind}:{message_id}:{emoji}:{client.user_id}"
+                return {"type": kind, "message_id": message_id, "emoji": emoji}, key
+            senders = [c for c in senders if c.channel_id in self.target_messages]
+            await asyncio.gather(*(self._drive(c, reaction, interval, deadline) for c in senders))
+
+        elif scenario == "reconnect":
+            # Waves of every client dropping and reconnecting at once
+            waves = max(1, args.waves)
+            for wave in range(waves):
+                await asyncio.gather(*(c.close() for c in self.clients))
+                for channel_id in self.channels:
+                    self.channels[channel_id] = []
+                for client in self.clients:
+                    self.channels[client.channel_id].append(client)
+                await self._ramp(self.clients)
+                await asyncio.sleep(max(start + args.duration * (wave + 1) / waves - time.perf_counter(), 0))
+
+        # Let in-flight deliveries land
+        await asyncio.sleep(args.drain)
+        return time.perf_counter() - start
+
+    def _reset_delivery_stats(self) -> Stats:
+        fresh = Stats()
+        fresh.connect_times = self.stats.connect_times
+        fresh.connect_failures = self.stats.connect_failures
+        return fresh
+
+
+# --- Server process ---------------------------------------------------------
+
+class ServerMonitor:
+    """Samples CPU and RSS of a local server process from /proc (Linux)"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.cpu: List[float] = []
+        self.rss: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        rss_pages = int(fields[21])
+        return ticks / os.sysconf("SC_CLK_TCK"), rss_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+    async def _sample(self) -> None:
+        last_cpu, _ = self._read()
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(1)
+            cpu, rss = self._read()
+            now = time.perf_counter()
+            self.cpu.append((cpu - last_cpu) / (now - last) * 100)
+            self.rss.append(rss)
+            last_cpu, last = cpu, now
+
+    def start(self) -> None:
+        if self.pid and os.path.exists(f"/proc/{self.pid}/stat"):
+            self._task = asyncio.create_task(self._sample())
+
+    def stop(self) -> Optional[Dict]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        if not self.cpu:
+            return None
+        return {
+            "cpu_percent_avg": round(sum(self.cpu) / len(self.cpu), 1),
+            "cpu_percent_max": round(max(self.cpu), 1),
+            "rss_mb_max": round(max(self.rss), 1),
+        }
+
+
+async def scrape_loop_lag(url: str) -> Optional[Dict]:
+    """Event-loop lag sum/count from the server's /metrics, summed over workers"""
+    try:
+        token = os.getenv("METRICS_TOKEN")
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.get(f"{url}/metrics", headers={"Authorization": f"Bearer {token}"} if token else {})
+        response.raise_for_status()
+        text = response.text
+    except Exception:
+        return None
+    values = {}
+    for line in text.splitlines():
+        for name in ("diligental_event_loop_lag_seconds_sum", "diligental_event_loop_lag_seconds_count",
+                     "diligental_event_loop_stalls_total"):
+            if line.startswith((name + " ", name + "{")):
+                values[name] = values.get(name, 0.0) + float(line.rsplit(" ", 1)[1])
+    return values
+
+
+def spawn_server(port: int, workers: int) -> subprocess.Popen:
+    # A throwaway local server: its /metrics may go without a token
+    env = {**os.environ, "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"), "METRICS_PUBLIC": "true"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--ws-max-queue", "1024"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env
+    )
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get(f"{url}/")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    sys.exit(f"Server at {url} did not come up")
+
+
+async def main(args) -> None:
+    server = None
+    if args.spawn:
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.port, args.workers)
+    try:
+        await wait_ready(args.url)
+        harness = Harness(args)
+        await harness.load_topology()
+        await database.dispose()
+
+        monitor = ServerMonitor(server.pid if server else args.server_pid)
+        lag_before = await scrape_loop_lag(args.url)
+        monitor.start()
+
+        await harness.connect_all()
+        print(f"Connected {len(harness.stats.connect_times)}/{args.clients} clients "
+              f"across {len(harness.members)} channels; running '{args.scenario}' for {args.duration}s")
+        elapsed = await harness.run_scenario()
+
+        resources = monitor.stop()
+        lag_after = await scrape_loop_lag(args.url)
+        await harness.close_all()
+
+        report = {"scenario": args.scenario, "clients": args.clients, "duration_s": round(elapsed, 1),
+                  **harness.stats.summary(elapsed)}
+        if resources:
+            report["server"] = resources
+        if lag_before and lag_after:
+            count = lag_after.get("diligental_event_loop_lag_seconds_count", 0) - lag_before.get("diligental_event_loop_lag_seconds_count", 0)
+            total = lag_after.get("diligental_event_loop_lag_seconds_sum", 0) - lag_before.get("diligental_event_loop_lag_seconds_sum", 0)
+            report["server_loop_lag_ms_avg"] = round(total / count * 1000, 2) if count else None
+            report["server_loop_stalls"] = lag_after.get("diligental_event_loop_stalls_total", 0) - lag_before.get("diligental_event_loop_stalls_total", 0)
+        print(json.dumps(report, indent=2))
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="chat")
+    parser.add_argument("--url", default="http://localhost:8001", help="server base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start a local uvicorn server for the run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--server-pid", type=int, help="sample CPU/RSS of an already running server")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--senders", type=float, default=0.1, help="fraction of clients that send")
+    parser.add_argument("--rate", type=float, default=1.0, help="events per second per sender")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--waves", type=int, default=3, help="reconnect waves (reconnect scenario)")
+    parser.add_argument("--ramp", type=int, default=100, help="concurrent connection attempts")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for in-flight deliveries")
+    parser.add_argument("--notifications", action="store_true", help="open notification sockets and mention users")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    asyncio.run(main(args))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,147 @@
+import asyncio
+import functools
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import logs
+import models
+
+log = logs.get_logger("changes")
+
+# Change log for delta sync (GET /sync). Writes a connected client would
+# otherwise refetch for add a row in their own transaction (record(), from
+# crud); a client keeps the id it has seen up to (its cursor) and asks for
+# the rows after it. Rows are scoped to a workspace, or to one user when only
+# they care (their read markers and notifications).
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", 1000))  # More pending than this: cheaper to reload
+SYNC_RETENTION_HOURS = int(os.getenv("SYNC_RETENTION_HOURS", 72))  # Older cursors are told to reload
+SYNC_GAP_GRACE_SECONDS = int(os.getenv("SYNC_GAP_GRACE_SECONDS", 10))  # How long a missing id may be an uncommitted write
+SYNC_PRUNE_INTERVAL = int(os.getenv("SYNC_PRUNE_INTERVAL", 600))  # Seconds
+
+_PRUNE_CHUNK = 5000
+
+
+def record(db: AsyncSession, kind: str, entity_id: uuid.UUID, *, workspace_id: uuid.UUID = None,
+           channel_id: uuid.UUID = None, user_id: uuid.UUID = None, deleted: bool = False) -> None:
+    """Log a change in the caller's transaction (the caller commits)"""
+    db.add(models.Change(
+        kind=kind, entity_id=entity_id, workspace_id=workspace_id, channel_id=channel_id, user_id=user_id,
+        deleted=deleted
+    ))
+
+
+async def record_many(db: AsyncSession, rows: List[dict]) -> None:
+    """record() for a batch of changes, as dicts of its keyword arguments"""
+    if rows:
+        defaults = {"workspace_id": None, "channel_id": None, "user_id": None, "deleted": False}
+        await db.execute(insert(models.Change), [{**defaults, **row} for row in rows])
+
+
+async def head(db: AsyncSession) -> int:
+    """Cursor for a client about to read current state: the newest id with no
+    change below it still uncommitted.
+
+    Ids are handed out before commit, so on Postgres a later one can become
+    visible before an earlier one; a gap younger than SYNC_GAP_GRACE_SECONDS
+    counts as a write in flight, an older one as rolled back.
+    """
+    return (await db.execute(_head(), {"cutoff": datetime.now(timezone.utc) - timedelta(seconds=SYNC_GAP_GRACE_SECONDS)})).scalar()
+
+
+@functools.cache
+def _head():
+    """One statement whatever the data's age: from the newest change older than
+    the grace period (every id after it is newer, so both walks below stay
+    within the grace period's changes), the first id whose successor is missing.
+    Only that one id comes back."""
+    change, older, successor = models.Change, aliased(models.Change), aliased(models.Change)
+    settled = func.coalesce(
+        select(older.id).filter(older.created_at < bindparam("cutoff")).order_by(older.id.desc()).limit(1)
+        .scalar_subquery(),
+        select(func.min(older.id) - 1).scalar_subquery(),
+        0,
+    )
+    first_gap = (
+        select(change.id)
+        .filter(change.id >= settled, ~select(successor.id).filter(successor.id == change.id + 1).exists())
+        .order_by(change.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(func.coalesce(first_gap, settled))
+
+
+class Pending(NamedTuple):
+    changes: list  # models.Change rows after the client's cursor, oldest first
+    cursor: int  # Where the client continues from
+
+
+async def pending(db: AsyncSession, cursor: int, workspace_id: uuid.UUID, user_id: uuid.UUID) -> Optional[Pending]:
+    """The workspace's and the user's changes after `cursor`; None when the
+    client has to reload instead (cursor pruned or unknown, or too much changed)"""
+    change = models.Change
+    result = await db.execute(select(func.min(change.id), func.max(change.id)))
+    first, last = result.one()
+    if cursor > (last or 0) or (first is not None and cursor < first - 1):
+        return None
+    new_cursor = max(cursor, await head(db))
+    result = await db.execute(
+        select(change)
+        .filter(change.id > cursor)
+        .filter(or_(
+            change.workspace_id == workspace_id,  # ix_changes_workspace_id_id
+            and_(change.workspace_id.is_(None), change.user_id == user_id),  # ix_changes_user_id_id
+        ))
+        .order_by(change.id)
+        .limit(SYNC_MAX_CHANGES + 1)
+    )
+    changes = result.scalars().all()
+    if len(changes) > SYNC_MAX_CHANGES:
+        return None
+    # Rows past the cursor (a gap still open below them) come again next time
+    return Pending(changes, new_cursor)
+
+
+async def prune() -> int:
+    """Drop changes older than SYNC_RETENTION_HOURS, a chunk per transaction.
+    The newest row always stays: it's what tells a current cursor from a stale one."""
+    change = models.Change
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=SYNC_RETENTION_HOURS)
+    async with database.async_session_maker() as db:
+        result = await db.execute(select(func.max(change.id)))
+        last = result.scalar()
+        if last is None:
+            return 0
+        result = await db.execute(
+            select(change.id).filter(change.created_at >= cutoff).order_by(change.id).limit(1)
+        )
+        keep_from = min(result.scalar() or last, last)
+    pruned = 0
+    while True:
+        async with database.async_session_maker() as db:
+            chunk = select(change.id).filter(change.id < keep_from).order_by(change.id).limit(_PRUNE_CHUNK)
+            result = await db.execute(delete(change).filter(change.id.in_(chunk)))
+            await db.commit()
+        pruned += result.rowcount
+        if result.rowcount < _PRUNE_CHUNK:
+            break
+    if pruned:
+        log.info("changes_pruned", rows=pruned, kept_from=keep_from)
+    return pruned
+
+
+async def run_pruner() -> None:
+    """Background task (app lifespan): prune every SYNC_PRUNE_INTERVAL seconds"""
+    while True:
+        try:
+            await prune()
+        except Exception as e:
+            log.error("changes_prune_failed", error=str(e))
+        await asyncio.sleep(SYNC_PRUNE_INTERVAL)
@@ -1,27 +1,48 @@
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import Boolean, String, Uuid, and_, bindparam, delete, exists, insert, literal, or_, tuple_, type_coerce, union_all, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 from models import User, Channel, Message, Notification
+from datetime import datetime, timezone
+import changes
+import functools
 import models
 import re
 from schemas import UserCreate, ChannelCreate, MessageCreate
 import schemas
 from security import get_password_hash
+from cache import TTLCache
+import mention_fanout
+import message_cache
+import notify
+import read_models
+import tracing
+
+# Statements on the hot paths are built once (functools.cache) with bound
+# parameters: building one and computing its cache key costs more per call
+# than SQLAlchemy's compiled cache saves. One SQL string each also keeps
+# asyncpg's per-connection prepared statements warm (database.py).
+_user_id_param = bindparam("user_id", type_=Uuid)  # Shared by the statements scoped to one user
+
+@functools.cache
+def _user_by(column: str):
+    return select(User).filter(getattr(User, column) == bindparam(column), User.deleted_at.is_(None))
 
 async def get_user_by_username(db: AsyncSession, username: str):
-    result = await db.execute(select(User).filter(User.username == username))
+    result = await db.execute(_user_by("username"), {"username": username})
     return result.scalars().first()
 
 async def get_user_by_email(db: AsyncSession, email: str):
-    result = await db.execute(select(User).filter(User.email == email))
+    result = await db.execute(select(User).filter(User.email == email, User.deleted_at.is_(None)))
     return result.scalars().first()
 
 async def get_user_by_id(db: AsyncSession, user_id: str):
     import uuid
     try:
         user_uuid = uuid.UUID(user_id)
-        result = await db.execute(select(User).filter(User.id == user_uuid))
+        result = await db.execute(_user_by("id"), {"id": user_uuid})
         return result.scalars().first()
     except ValueError:
         return None
@@ -42,7 +63,7 @@ async def create_user(db: AsyncSession, user: UserCreate):
     return db_user
 
 async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
-   result = await db.execute(select(User).offset(skip).limit(limit))
+   result = await db.execute(select(User).filter(User.deleted_at.is_(None)).offset(skip).limit(limit))
    return result.scalars().all()
 
 # Channels
@@ -52,15 +73,19 @@ from sqlalchemy.orm import joinedload, selectinload
 import uuid
 
 async def get_channel_by_name(db: AsyncSession, name: str):
-    result = await db.execute(select(Channel).filter(Channel.name == name))
+    result = await db.execute(select(Channel).filter(Channel.name == name, Channel.deleted_at.is_(None)))
     return result.scalars().first()
 
-async def get_channel(db: AsyncSession, channel_id: uuid.UUID):
-    result = await db.execute(
+@functools.cache
+def _channel_by_id():
+    return (
         select(Channel)
         .options(joinedload(Channel.members).joinedload(models.ChannelMember.user))
-        .filter(Channel.id == channel_id)
+        .filter(Channel.id == bindparam("channel_id"), Channel.deleted_at.is_(None))
     )
+
+async def get_channel(db: AsyncSession, channel_id: uuid.UUID):
+    result = await db.execute(_channel_by_id(), {"channel_id": channel_id})
     return result.scalars().first()
 
 async def create_channel(db: AsyncSession, channel: ChannelCreate, owner_id: uuid.UUID, workspace_id: uuid.UUID):
@@ -72,6 +97,8 @@ async def create_channel(db: AsyncSession, channel: ChannelCreate, owner_id: uui
         workspace_id=workspace_id
     )
     db.add(db_channel)
+    await db.flush()
+    changes.record(db, "channel", db_channel.id, workspace_id=workspace_id, channel_id=db_channel.id)
     await db.commit()
     
     # Eagerly load members relationship to avoid lazy load issues
@@ -83,21 +110,19 @@ async def create_channel(db: AsyncSession, channel: ChannelCreate, owner_id: uui
     )
     return result.scalars().first()
 
-async def get_channels(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID, skip: int = 0, limit: int = 100):
+@functools.cache
+def _channels_page(by_ids: bool):
     # Filter channels:
     # 1. Public/Voice channels are visible to all (or logic to be refined)
     # 2. Private/DM channels are visible ONLY if user is a member
-    
-    from sqlalchemy import or_, and_
-    
+    user_id = bindparam("user_id")
     stmt = (
-        select(Channel)
-        .options(joinedload(Channel.members).joinedload(models.ChannelMember.user))
+        read_models.select_channels()
         .outerjoin(models.ChannelMember, and_(
             models.ChannelMember.channel_id == Channel.id,
             models.ChannelMember.user_id == user_id
         ))
-        .filter(Channel.workspace_id == workspace_id)
+        .filter(Channel.workspace_id == bindparam("workspace_id"), Channel.deleted_at.is_(None))
         .filter(
             or_(
                 Channel.type.in_(['public', 'voice']),
@@ -107,12 +132,57 @@ async def get_channels(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.
                 )
             )
         )
-        .offset(skip)
-        .limit(limit)
+        .offset(bindparam("skip"))
+        .limit(bindparam("limit"))
     )
-    
-    result = await db.execute(stmt)
-    return result.scalars().unique().all()
+    if by_ids:
+        stmt = stmt.filter(Channel.id.in_(bindparam("channel_ids", expanding=True)))
+    return read_models.with_members(stmt)
+
+async def get_channels(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID, skip: int = 0, limit: int = 100,
+                       channel_ids: list[uuid.UUID] = None):
+    params = {"workspace_id": workspace_id, "user_id": user_id, "skip": skip, "limit": limit}
+    if channel_ids is not None:
+        params["channel_ids"] = channel_ids
+    return await read_models.load_channels(db, _channels_page(channel_ids is not None), params)
+
+@functools.cache
+def _channel_read_states():
+    # Correlated max per channel: one descent of ix_messages_channel_id_created_at each
+    latest = (
+        select(func.max(Message.created_at))
+        .filter(Message.channel_id == Channel.id)
+        .correlate(Channel)
+        .scalar_subquery()
+    )
+    member = models.ChannelMember
+    return (
+        select(Channel.id, latest.label("last_message_at"), member.joined_at, member.last_read_at)
+        .outerjoin(member, and_(member.channel_id == Channel.id, member.user_id == _user_id_param))
+        .filter(Channel.id.in_(bindparam("channel_ids", expanding=True)))
+    )
+
+async def get_channel_read_states(db: AsyncSession, channel_ids: list[uuid.UUID], user_id: uuid.UUID):
+    """Per channel: newest message time, and the user's membership joined_at /
+    last_read_at (None where they aren't a member)"""
+    if not channel_ids:
+        return {}
+    result = await db.execute(_channel_read_states(), {"channel_ids": channel_ids, "user_id": user_id})
+    return {row.id: row for row in result}
+
+async def mark_channel_read(db: AsyncSession, channel_id: uuid.UUID, user_id: uuid.UUID):
+    """Move the user's read marker to now; False when they aren't a member"""
+    member = models.ChannelMember
+    result = await db.execute(
+        update(member)
+        .filter(member.channel_id == channel_id, member.user_id == user_id)
+        .values(last_read_at=func.now())
+    )
+    if result.rowcount:
+        # Only the reader's other sessions care
+        changes.record(db, "channel_member", channel_id, channel_id=channel_id, user_id=user_id)
+    await db.commit()
+    return result.rowcount > 0
 
 async def get_or_create_dm_channel(db: AsyncSession, workspace_id: uuid.UUID, user1_id: uuid.UUID, user2_id: uuid.UUID):
     # Check for existing DM
@@ -130,6 +200,7 @@ async def get_or_create_dm_channel(db: AsyncSession, workspace_id: uuid.UUID, us
         .filter(
             models.Channel.workspace_id == workspace_id,
             models.Channel.type == 'dm',
+            models.Channel.deleted_at.is_(None),
             models.ChannelMember.user_id == user1_id
         )
     )
@@ -164,6 +235,7 @@ async def get_or_create_dm_channel(db: AsyncSession, workspace_id: uuid.UUID, us
     member2 = models.ChannelMember(channel_id=new_channel.id, user_id=user2_id)
     db.add(member1)
     db.add(member2)
+    changes.record(db, "channel", new_channel.id, workspace_id=workspace_id, channel_id=new_channel.id)
     
     await db.commit()
     
@@ -178,6 +250,9 @@ async def get_or_create_dm_channel(db: AsyncSession, workspace_id: uuid.UUID, us
 
 
 # Messages
+BROADCAST_MENTIONS = {"channel", "here"}  # @channel / @here, never usernames
+
+@tracing.traced("crud.create_message")
 async def create_message(db: AsyncSession, message: MessageCreate, user_id: uuid.UUID):
     db_message = Message(
         content=message.content,
@@ -187,12 +262,13 @@ async def create_message(db: AsyncSession, message: MessageCreate, user_id: uuid
     )
     db.add(db_message)
     await db.flush() # Ensure ID is generated
+    workspace_id = await get_channel_workspace_id(db, db_message.channel_id)
+    changes.record(db, "message", db_message.id, workspace_id=workspace_id, channel_id=db_message.channel_id)
     
-    # Link Attachments
+    # Link Attachments (only the sender's own, confirmed and not yet posted;
+    # callers reject anything else with get_unlinkable_attachment_ids)
     if message.attachment_ids:
-        from models import Attachment
-        stmt = select(Attachment).filter(Attachment.id.in_(message.attachment_ids))
-        result = await db.execute(stmt)
+        result = await db.execute(_linkable_attachments(models.Attachment, message.attachment_ids, user_id))
         attachments = result.scalars().all()
         for attachment in attachments:
             attachment.message_id = db_message.id
@@ -206,31 +282,67 @@ async def create_message(db: AsyncSession, message: MessageCreate, user_id: uuid
     # 2. If no explicit mentions, parse from content (fallback)
     if not mentioned_user_ids:
         mentions = re.findall(r"@(\w+)", message.content)
-        # Deduplicate mentions
-        mentions = list(set(mentions))
+        # Deduplicate mentions (@channel/@here are handled below, not as usernames)
+        mentions = list(set(mentions) - BROADCAST_MENTIONS)
         
         for username in mentions:
             user = await get_user_by_username(db, username)
-            if user and user.id != user_id:
+            if user:
                 mentioned_user_ids.append(user.id)
-    
+
+    # Each mentioned user once, never the author
+    mentioned_user_ids = [mentioned_id for mentioned_id in dict.fromkeys(mentioned_user_ids) if mentioned_id != user_id]
+
     # Add mentioned users to message relationship and create notifications
     if mentioned_user_ids:
-        from sqlalchemy import insert
-        for mentioned_id in mentioned_user_ids:
-            if mentioned_id != user_id:  # Don't mention yourself
-                stmt = insert(models.message_mentions).values(message_id=db_message.id, user_id=mentioned_id)
-                await db.execute(stmt)
-                
-                notif = models.Notification(
-                    user_id=mentioned_id,
-                    content=f"You were mentioned in a message",
-                    type="mention",
-                    related_id=db_message.id
-                )
-                db.add(notif)
-                new_notifications.append(notif)
+        # One INSERT ... SELECT for all of them. created_at is the server-side
+        # default, so it's copied from the flushed row. The ids are a UNION ALL
+        # of one-row selects, as SQLite can't name the columns of a VALUES list.
+        mentions = models.message_mentions
+        mentioned = union_all(*(
+            select(literal(mentioned_id, Uuid).label("user_id")) for mentioned_id in mentioned_user_ids
+        )).subquery("mentioned")
+        await db.execute(insert(mentions).from_select(
+            [mentions.c.message_id, mentions.c.user_id, mentions.c.created_at],
+            select(Message.id, mentioned.c.user_id, Message.created_at).filter(Message.id == db_message.id)
+        ))
+
+        notifications = [
+            models.Notification(
+                id=uuid.uuid4(),
+                user_id=mentioned_id,
+                content="You were mentioned in a message",
+                type="mention",
+                related_id=db_message.id
+            )
+            for mentioned_id in mentioned_user_ids
+        ]
+        db.add_all(notifications)
+        for notif in notifications:
+            changes.record(db, "notification", notif.id, user_id=notif.user_id)
+        new_notifications.extend(notifications)
             
+    # @channel/@here: one row for the whole channel instead of one per member;
+    # members get it lazily in get_notifications and online ones by a background push
+    broadcast = None
+    broadcast_kinds = BROADCAST_MENTIONS.intersection(re.findall(r"@(\w+)", message.content))
+    if broadcast_kinds:
+        broadcast = models.BroadcastMention(
+            id=uuid.uuid4(), message_id=db_message.id, channel_id=db_message.channel_id, user_id=user_id,
+            kind="channel" if "channel" in broadcast_kinds else "here"
+        )
+        broadcasts = models.BroadcastMention.__table__
+        await db.execute(insert(broadcasts).from_select(
+            ["id", "message_id", "channel_id", "user_id", "kind", "created_at"],
+            select(
+                literal(broadcast.id, Uuid), Message.id, Message.channel_id, Message.user_id,
+                literal(broadcast.kind, String), Message.created_at
+            ).filter(Message.id == db_message.id)
+        ))
+        if broadcast.kind == "channel":
+            # Everyone's notification (@here is only pushed)
+            changes.record(db, "notification", broadcast.id, workspace_id=workspace_id, channel_id=broadcast.channel_id)
+
     # 3. Replies
     if message.parent_id:
         parent_msg = await db.get(Message, message.parent_id)
@@ -239,12 +351,14 @@ async def create_message(db: AsyncSession, message: MessageCreate, user_id: uuid
             already_mentioned = parent_msg.user_id in mentioned_user_ids
             if not already_mentioned:
                 notif = models.Notification(
+                    id=uuid.uuid4(),
                     user_id=parent_msg.user_id,
                     content="New reply to your message",
                     type="reply",
                     related_id=db_message.id
                 )
                 db.add(notif)
+                changes.record(db, "notification", notif.id, user_id=parent_msg.user_id)
                 new_notifications.append(notif)
 
     await db.commit()
@@ -252,17 +366,23 @@ async def create_message(db: AsyncSession, message: MessageCreate, user_id: uuid
     # Reload message with attachments and mentions eagerly loaded to prevent greenlet error in WS
     result = await db.execute(
         select(Message)
+        .options(joinedload(Message.user))
         .options(selectinload(Message.attachments))
         .options(selectinload(Message.mentioned_users))
         .filter(Message.id == db_message.id)
     )
     db_message = result.scalars().unique().first()
+    set_committed_value(db_message, "reactions", [])  # Brand new message, nothing to load
 
-    # Refresh notifications to get IDs
-    for n in new_notifications:
-        await db.refresh(n)
+    # Write-through to the hot-channel first-page cache
+    await message_cache.message_created(db_message)
+
+    # Everything else (pushes to recipients) runs on the job queue
+    await notify.enqueue(new_notifications)
+    if broadcast is not None:
+        await mention_fanout.enqueue(broadcast, db_message.created_at)
         
-    return db_message, new_notifications
+    return db_message
 
 # Workspace CRUD
 async def create_workspace(db: AsyncSession, workspace: schemas.WorkspaceCreate, user_id: uuid.UUID):
@@ -277,57 +397,91 @@ async def create_workspace(db: AsyncSession, workspace: schemas.WorkspaceCreate,
     await db.commit()
     return db_workspace
 
-async def get_user_workspaces(db: AsyncSession, user_id: uuid.UUID):
+@functools.cache
+def _user_workspaces():
     # Join WorkspaceMember to find workspaces the user belongs to
-    result = await db.execute(
+    return (
         select(models.Workspace)
         .join(models.WorkspaceMember)
-        .filter(models.WorkspaceMember.user_id == user_id)
+        .filter(models.WorkspaceMember.user_id == _user_id_param, models.Workspace.deleted_at.is_(None))
     )
+
+async def get_user_workspaces(db: AsyncSession, user_id: uuid.UUID):
+    result = await db.execute(_user_workspaces(), {"user_id": user_id})
     return result.scalars().all()
 
 async def get_workspace(db: AsyncSession, workspace_id: uuid.UUID):
-    result = await db.execute(select(models.Workspace).filter(models.Workspace.id == workspace_id))
+    result = await db.execute(select(models.Workspace).filter(
+        models.Workspace.id == workspace_id, models.Workspace.deleted_at.is_(None)
+    ))
     return result.scalars().first()
 
-async def get_workspace_member(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID):
-    result = await db.execute(
-        select(models.WorkspaceMember).filter(
-            models.WorkspaceMember.workspace_id == workspace_id,
-            models.WorkspaceMember.user_id == user_id
+@functools.cache
+def _workspace_member():
+    # Members of a deleted workspace lose access before their rows are removed
+    return (
+        select(models.WorkspaceMember)
+        .join(models.Workspace)
+        .filter(
+            models.WorkspaceMember.workspace_id == bindparam("workspace_id"),
+            models.WorkspaceMember.user_id == _user_id_param,
+            models.Workspace.deleted_at.is_(None)
         )
     )
+
+async def get_workspace_member(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID):
+    result = await db.execute(_workspace_member(), {"workspace_id": workspace_id, "user_id": user_id})
     return result.scalars().first()
 
 async def get_workspace_members(db: AsyncSession, workspace_id: uuid.UUID):
-    result = await db.execute(
-        select(models.WorkspaceMember)
-        .options(joinedload(models.WorkspaceMember.user))
-        .filter(models.WorkspaceMember.workspace_id == workspace_id)
-    )
-    return result.scalars().all()
+    return await read_models.load_workspace_members(db, workspace_id)
 
 
 from sqlalchemy.orm import joinedload
 
-async def get_messages(db: AsyncSession, channel_id: uuid.UUID, skip: int = 0, limit: int = 50, parent_id: uuid.UUID = None):
-    query = select(Message).options(
-        joinedload(Message.user),
-        selectinload(Message.reactions).joinedload(models.Reaction.user),
-        selectinload(Message.attachments)
-    ).filter(Message.channel_id == channel_id)
-    
-    if parent_id:
-        query = query.filter(Message.parent_id == parent_id)
+@functools.cache
+def _messages_page(in_thread: bool):
+    query = read_models.select_messages().filter(Message.channel_id == bindparam("channel_id"))
+
+    if in_thread:
+        # Threads read from the first reply
+        query = query.filter(Message.parent_id == bindparam("parent_id")).order_by(Message.created_at.asc())
     else:
-        query = query.filter(Message.parent_id == None)
+        # Channel history pages back from the newest message
+        query = query.filter(Message.parent_id == None).order_by(Message.created_at.desc())
 
-    result = await db.execute(
-        query.order_by(Message.created_at.asc())
-        .offset(skip)
-        .limit(limit)
+    return query.offset(bindparam("skip")).limit(bindparam("limit"))
+
+async def get_messages(db: AsyncSession, channel_id: uuid.UUID, skip: int = 0, limit: int = 50, parent_id: uuid.UUID = None):
+    """A page of a thread's replies, or of channel history counted back from the
+    newest message (skip=0 is the latest `limit`); either way oldest first"""
+    params = {"channel_id": channel_id, "skip": skip, "limit": limit}
+    if parent_id:
+        params["parent_id"] = parent_id
+    messages = await read_models.load_messages(db, _messages_page(bool(parent_id)), params)
+    if not parent_id:
+        messages.reverse()
+    return messages
+
+async def get_messages_by_ids(db: AsyncSession, message_ids: list[uuid.UUID]):
+    """Top-level messages loaded as get_messages does: the given ones, and the
+    thread roots of any replies among them"""
+    roots, messages = _messages_by_ids()
+    result = await db.execute(roots, {"ids": message_ids})
+    root_ids = set(result.scalars())
+    if not root_ids:
+        return []
+    return await read_models.load_messages(db, messages, {"ids": list(root_ids)})
+
+@functools.cache
+def _messages_by_ids():
+    """Thread roots of the messages in :ids (themselves when top-level), and messages by :ids"""
+    ids = bindparam("ids", expanding=True)
+    return (
+        select(func.coalesce(Message.parent_id, Message.id)).filter(Message.id.in_(ids)),
+        read_models.select_messages().filter(Message.id.in_(ids)).order_by(Message.created_at.asc()),
     )
-    return result.scalars().all()
+
 async def add_workspace_member(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID, role: str = "member"):
     db_member = models.WorkspaceMember(workspace_id=workspace_id, user_id=user_id, role=role)
     db.add(db_member)
@@ -335,42 +489,206 @@ async def add_workspace_member(db: AsyncSession, workspace_id: uuid.UUID, user_i
     await db.refresh(db_member)
     return db_member
 
-async def delete_channel(db: AsyncSession, channel_id: uuid.UUID):
-    db_channel = await get_channel(db, channel_id)
-    if db_channel:
-        await db.delete(db_channel)
-        await db.commit()
-    return db_channel
+# Deletion. These only hide the target (no commit); deletions.py records the
+# Deletion in the same transaction and removes the rows in the background.
+async def hide_channel(db: AsyncSession, channel: models.Channel):
+    channel.deleted_at = datetime.now(timezone.utc)
+    changes.record(db, "channel", channel.id, workspace_id=channel.workspace_id, channel_id=channel.id, deleted=True)
+    return [channel.id]
+
+async def hide_workspace(db: AsyncSession, workspace: models.Workspace):
+    """Hide the workspace and its channels; returns the channel ids"""
+    now = datetime.now(timezone.utc)
+    workspace.deleted_at = now
+    result = await db.execute(
+        update(models.Channel)
+        .filter(models.Channel.workspace_id == workspace.id, models.Channel.deleted_at.is_(None))
+        .values(deleted_at=now)
+        .returning(models.Channel.id)
+    )
+    channel_ids = result.scalars().all()
+    await changes.record_many(db, [
+        {"kind": "channel", "entity_id": channel_id, "workspace_id": workspace.id, "channel_id": channel_id,
+         "deleted": True}
+        for channel_id in channel_ids
+    ])
+    return channel_ids
+
+async def hide_user(db: AsyncSession, user: models.User):
+    """Hide the user, free their username and email, and drop their memberships
+    so they leave member lists (and their tokens stop resolving) right away"""
+    user.deleted_at = datetime.now(timezone.utc)
+    user.username = f"deleted-{user.id}"
+    user.email = f"{user.id}@deleted.invalid"
+    result = await db.execute(
+        select(Channel.id, Channel.workspace_id)
+        .join(models.ChannelMember, models.ChannelMember.channel_id == Channel.id)
+        .filter(models.ChannelMember.user_id == user.id, Channel.deleted_at.is_(None))
+    )
+    # Their channels' member lists change
+    await changes.record_many(db, [
+        {"kind": "channel_member", "entity_id": row.id, "workspace_id": row.workspace_id, "channel_id": row.id,
+         "user_id": user.id, "deleted": True}
+        for row in result
+    ])
+    await db.execute(delete(models.ChannelMember).filter(models.ChannelMember.user_id == user.id))
+    await db.execute(delete(models.WorkspaceMember).filter(models.WorkspaceMember.user_id == user.id))
+    return []
 
 async def update_channel(db: AsyncSession, channel_id: uuid.UUID, name: str):
     db_channel = await get_channel(db, channel_id)
     if db_channel:
         db_channel.name = name
+        changes.record(db, "channel", db_channel.id, workspace_id=db_channel.workspace_id, channel_id=db_channel.id)
         await db.commit()
         await db.refresh(db_channel)
     return db_channel
     return db_channel
 
 # Notifications
+def _broadcast_notifications():
+    """@channel mentions as per-user notification rows (for :user_id), computed at read time.
+
+    Same visibility rule as can_access_channel, limited to mentions made since
+    the user joined, and excluding their own. Read state comes from
+    broadcast_mention_reads.
+    """
+    broadcast = models.BroadcastMention
+    workspace_member = models.WorkspaceMember
+    channel_member = models.ChannelMember
+    read = models.BroadcastMentionRead
+    return (
+        select(
+            broadcast.id,
+            _user_id_param.label("user_id"),
+            (literal("@") + broadcast.kind + " in #" + Channel.name).label("content"),
+            literal("mention").label("type"),
+            type_coerce(read.user_id.is_not(None), Boolean).label("is_read"),
+            broadcast.created_at,
+            broadcast.message_id.label("related_id"),
+        )
+        .join(Channel, Channel.id == broadcast.channel_id)
+        .join(workspace_member, and_(
+            workspace_member.workspace_id == Channel.workspace_id, workspace_member.user_id == _user_id_param
+        ))
+        .outerjoin(channel_member, and_(
+            channel_member.channel_id == Channel.id, channel_member.user_id == _user_id_param
+        ))
+        .outerjoin(read, and_(read.broadcast_id == broadcast.id, read.user_id == _user_id_param))
+        .filter(broadcast.user_id != _user_id_param, Channel.deleted_at.is_(None))
+        .filter(broadcast.created_at >= workspace_member.joined_at)
+        .filter(or_(
+            Channel.type.in_(("public", "voice")),
+            and_(channel_member.user_id.is_not(None), broadcast.created_at >= channel_member.joined_at)
+        ))
+    )
+
+@functools.cache
+def _notifications_page():
+    """Notification rows merged with @channel mentions, newest first. Built once:
+    composing the union costs more than running it."""
+    window = bindparam("window")  # skip + limit; neither source can contribute more to the page
+    own = (
+        select(
+            Notification.id, Notification.user_id, Notification.content, Notification.type,
+            Notification.is_read, Notification.created_at, Notification.related_id
+        )
+        .filter(Notification.user_id == _user_id_param)
+        .order_by(Notification.created_at.desc())
+        .limit(window)
+    )
+    broadcasts = (
+        _broadcast_notifications()
+        .filter(models.BroadcastMention.kind == "channel")
+        .order_by(models.BroadcastMention.created_at.desc())
+        .limit(window)
+    )
+    merged = union_all(select(own.subquery()), select(broadcasts.subquery())).subquery()
+    return (
+        select(merged).order_by(merged.c.created_at.desc())
+        .offset(bindparam("skip")).limit(bindparam("limit"))
+    )
+
 async def get_notifications(db: AsyncSession, user_id: uuid.UUID, skip: int = 0, limit: int = 50):
+    """The user's notification rows merged with their @channel mentions, newest first"""
     result = await db.execute(
-        select(Notification)
-        .filter(Notification.user_id == user_id)
-        .order_by(Notification.created_at.desc())
-        .offset(skip)
-        .limit(limit)
+        _notifications_page(), {"user_id": user_id, "window": skip + limit, "skip": skip, "limit": limit}
     )
-    return result.scalars().all()
+    return result.all()
+
+async def get_notifications_by_ids(db: AsyncSession, user_id: uuid.UUID, notification_ids: list[uuid.UUID]):
+    """The user's notifications and @channel mentions among the ids, newest first"""
+    result = await db.execute(
+        select(
+            Notification.id, Notification.user_id, Notification.content, Notification.type,
+            Notification.is_read, Notification.created_at, Notification.related_id
+        ).filter(Notification.id.in_(notification_ids), Notification.user_id == user_id)
+    )
+    rows = result.all()
+    result = await db.execute(
+        _broadcast_notifications().filter(
+            models.BroadcastMention.id.in_(notification_ids), models.BroadcastMention.kind == "channel"
+        ),
+        {"user_id": user_id}
+    )
+    rows += result.all()
+    return sorted(rows, key=lambda row: row.created_at, reverse=True)
+
+@functools.cache
+def _unread_notifications():
+    cap = bindparam("cap")
+    own = (
+        select(Notification.id)
+        .filter(Notification.user_id == _user_id_param, ~Notification.is_read)  # ix_notifications_user_unread
+        .limit(cap)
+    )
+    broadcasts = (
+        _broadcast_notifications()
+        .filter(models.BroadcastMention.kind == "channel", models.BroadcastMentionRead.user_id.is_(None))
+        .limit(cap)
+    )
+    return select(
+        select(func.count()).select_from(own.subquery()).scalar_subquery(),
+        select(func.count()).select_from(broadcasts.subquery()).scalar_subquery(),
+    )
+
+async def count_unread_notifications(db: AsyncSession, user_id: uuid.UUID, cap: int = 100):
+    """Unread notifications and @channel mentions, counted up to `cap` (a badge shows "99+")"""
+    result = await db.execute(_unread_notifications(), {"user_id": user_id, "cap": cap})
+    return min(sum(result.one()), cap)
 
 async def mark_notification_read(db: AsyncSession, notification_id: uuid.UUID, user_id: uuid.UUID):
     notif = await db.get(Notification, notification_id)
     if notif and notif.user_id == user_id:
         notif.is_read = True
+        changes.record(db, "notification", notif.id, user_id=user_id)
         await db.commit()
         await db.refresh(notif)
-    return notif
+    if notif:
+        return notif
+
+    # Broadcast mention: record the read for this user only (@here included, it's pushed too)
+    result = await db.execute(
+        _broadcast_notifications().filter(models.BroadcastMention.id == notification_id), {"user_id": user_id}
+    )
+    row = result.first()
+    if row is None:
+        return None
+    if not row.is_read:
+        db.add(models.BroadcastMentionRead(user_id=user_id, broadcast_id=notification_id))
+        changes.record(db, "notification", notification_id, user_id=user_id)
+        await db.commit()
+    return {**row._mapping, "is_read": True}
 
 # Thread functions
+@functools.cache
+def _replies_counts():
+    return (
+        select(Message.parent_id, func.count(Message.id))
+        .filter(Message.parent_id.in_(bindparam("parent_ids", expanding=True)))
+        .group_by(Message.parent_id)
+    )
+
 async def get_thread_replies_count(db: AsyncSession, parent_id: uuid.UUID):
     """Get count of replies for a thread"""
     result = await db.execute(
@@ -378,21 +696,91 @@ async def get_thread_replies_count(db: AsyncSession, parent_id: uuid.UUID):
     )
     return result.scalar() or 0
 
+async def get_thread_replies_counts(db: AsyncSession, parent_ids: list[uuid.UUID]):
+    """Get reply counts for many threads in one grouped query"""
+    if not parent_ids:
+        return {}
+    result = await db.execute(_replies_counts(), {"parent_ids": parent_ids})
+    return dict(result.all())
+
+@functools.cache
+def _mentions_page(by_workspace: bool, by_channel: bool, after_cursor: bool):
+    mentions = models.message_mentions
+    query = (
+        read_models.select_messages(with_channel=True)
+        .join(mentions, mentions.c.message_id == Message.id)
+        .join(Channel, Channel.id == Message.channel_id)
+        .filter(mentions.c.user_id == _user_id_param, Channel.deleted_at.is_(None))
+        # Same visibility rule as can_access_channel
+        .filter(Channel.workspace_id.in_(
+            select(models.WorkspaceMember.workspace_id).filter(models.WorkspaceMember.user_id == _user_id_param)
+        ))
+        .filter(or_(
+            Channel.type.in_(("public", "voice")),
+            exists().where(models.ChannelMember.channel_id == Channel.id, models.ChannelMember.user_id == _user_id_param)
+        ))
+    )
+    if by_workspace:
+        query = query.filter(Channel.workspace_id == bindparam("workspace_id"))
+    if by_channel:
+        query = query.filter(Message.channel_id == bindparam("channel_id"))
+    if after_cursor:
+        # The cursor row's own created_at, compared in the database: a value bound
+        # back from Python can differ from the stored one (SQLite keeps text). An
+        # unknown `before` gives NULL, so an empty page.
+        before = bindparam("before", type_=Uuid)
+        cursor = models.message_mentions.alias("cursor")
+        cursor_created_at = select(cursor.c.created_at).filter(
+            cursor.c.user_id == _user_id_param, cursor.c.message_id == before
+        ).scalar_subquery()
+        query = query.filter(tuple_(mentions.c.created_at, mentions.c.message_id) < tuple_(cursor_created_at, before))
+    return query.order_by(mentions.c.created_at.desc(), mentions.c.message_id.desc()).limit(bindparam("limit"))
+
+async def get_mentions(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    workspace_id: uuid.UUID = None,
+    channel_id: uuid.UUID = None,
+    before: uuid.UUID = None,
+    limit: int = 50,
+):
+    """Messages mentioning a user, newest first, in channels the user can still see.
+
+    Keyset-paginated: pass the id of the last message of the previous page as
+    `before`. Reads walk ix_message_mentions_user_id_created_at, so a page costs
+    the same for a user with ten mentions or ten thousand.
+    """
+    params = {"user_id": user_id, "limit": limit}
+    if workspace_id:
+        params["workspace_id"] = workspace_id
+    if channel_id:
+        params["channel_id"] = channel_id
+    if before:
+        params["before"] = before
+
+    messages = await read_models.load_messages(
+        db, _mentions_page(bool(workspace_id), bool(channel_id), bool(before)), params, with_channel=True
+    )
+    counts = await get_thread_replies_counts(db, [msg.id for msg in messages if msg.parent_id is None])
+    for msg in messages:
+        msg.reply_count = counts.get(msg.id, 0)
+    return messages
+
 async def get_thread_messages(db: AsyncSession, parent_id: uuid.UUID, skip: int = 0, limit: int = 50):
     """Get all replies in a thread with user info"""
-    result = await db.execute(
-        select(Message)
-        .options(
-            joinedload(Message.user),
-            selectinload(Message.reactions).joinedload(models.Reaction.user),
-            selectinload(Message.attachments)
-        )
-        .filter(Message.parent_id == parent_id)
+    return await read_models.load_messages(
+        db, _thread_page(), {"parent_id": parent_id, "skip": skip, "limit": limit}
+    )
+
+@functools.cache
+def _thread_page():
+    return (
+        read_models.select_messages()
+        .filter(Message.parent_id == bindparam("parent_id"))
         .order_by(Message.created_at.asc())
-        .offset(skip)
-        .limit(limit)
+        .offset(bindparam("skip"))
+        .limit(bindparam("limit"))
     )
-    return result.scalars().all()
 
 async def get_message_with_user(db: AsyncSession, message_id: uuid.UUID):
     """Get a single message with user info"""
@@ -429,8 +817,10 @@ async def add_reaction(db: AsyncSession, message_id: uuid.UUID, user_id: uuid.UU
         emoji=emoji
     )
     db.add(reaction)
+    await _record_reaction(db, message_id, user_id)
     await db.commit()
     await db.refresh(reaction)
+    await _sync_message_cache(db, message_id)
     return reaction
 
 async def remove_reaction(db: AsyncSession, message_id: uuid.UUID, user_id: uuid.UUID, emoji: str):
@@ -447,10 +837,43 @@ async def remove_reaction(db: AsyncSession, message_id: uuid.UUID, user_id: uuid
     reaction = result.scalar_one_or_none()
     if reaction:
         await db.delete(reaction)
+        await _record_reaction(db, message_id, user_id)
         await db.commit()
+        await _sync_message_cache(db, message_id)
         return True
     return False
 
+async def _record_reaction(db: AsyncSession, message_id: uuid.UUID, user_id: uuid.UUID):
+    """Log a reaction change against its message (delta sync resends the message)"""
+    result = await db.execute(
+        select(Message.channel_id, Channel.workspace_id)
+        .join(Channel, Channel.id == Message.channel_id)
+        .filter(Message.id == message_id)
+    )
+    row = result.first()
+    if row:
+        changes.record(db, "reaction", message_id, workspace_id=row.workspace_id, channel_id=row.channel_id,
+                       user_id=user_id)
+
+async def _sync_message_cache(db: AsyncSession, message_id: uuid.UUID):
+    """Write a message's new reaction state through to the first-page cache"""
+    if not message_cache.enabled():
+        return
+    # populate_existing: the session (long-lived on WS) may hold this message with stale reactions
+    result = await db.execute(
+        select(Message)
+        .options(
+            joinedload(Message.user),
+            selectinload(Message.reactions).joinedload(models.Reaction.user),
+            selectinload(Message.attachments)
+        )
+        .filter(Message.id == message_id)
+        .execution_options(populate_existing=True)
+    )
+    message = result.scalar_one_or_none()
+    if message:
+        await message_cache.message_updated(message)
+
 async def get_message_reactions(db: AsyncSession, message_id: uuid.UUID):
     """Get all reactions for a message with user info"""
     from models import Reaction
@@ -462,3 +885,85 @@ async def get_message_reactions(db: AsyncSession, message_id: uuid.UUID):
         .order_by(Reaction.created_at.asc())
     )
     return result.scalars().all()
+
+# Attachment access
+def _linkable_attachments(entity, attachment_ids, user_id: uuid.UUID):
+    Attachment = models.Attachment
+    return select(entity).filter(
+        Attachment.id.in_(attachment_ids),
+        Attachment.user_id == user_id,
+        Attachment.message_id.is_(None),
+        Attachment.upload_complete,
+    )
+
+async def get_unlinkable_attachment_ids(db: AsyncSession, attachment_ids: list, user_id: uuid.UUID) -> set:
+    """Requested attachments the user can't post: someone else's, already in a
+    message, or a presigned upload that was never confirmed (/complete)"""
+    result = await db.execute(_linkable_attachments(models.Attachment.id, attachment_ids, user_id))
+    return set(attachment_ids) - set(result.scalars())
+
+async def get_attachment_with_channel(db: AsyncSession, attachment_id: uuid.UUID):
+    """Get an attachment and the channel it was posted in (None if not yet sent)"""
+    from models import Attachment
+
+    result = await db.execute(
+        select(Attachment, Channel)
+        .outerjoin(Message, Attachment.message_id == Message.id)
+        .outerjoin(Channel, and_(Message.channel_id == Channel.id, Channel.deleted_at.is_(None)))
+        .filter(Attachment.id == attachment_id)
+    )
+    return result.first()
+
+async def can_access_channel(db: AsyncSession, user_id: uuid.UUID, channel_id: uuid.UUID, workspace_id: uuid.UUID, channel_type: str):
+    """Same visibility rule as get_channels: workspace members see public/voice
+    channels, private/DM channels require channel membership."""
+    member = await get_workspace_member(db, workspace_id, user_id)
+    if not member:
+        return False
+    if channel_type in ('public', 'voice'):
+        return True
+    result = await db.execute(
+        select(models.ChannelMember).filter(
+            models.ChannelMember.channel_id == channel_id,
+            models.ChannelMember.user_id == user_id
+        )
+    )
+    return result.scalars().first() is not None
+
+# Cached access lookups for hot read paths. Channels never change workspace,
+# membership entries tolerate a short staleness window.
+_channel_workspace_cache = TTLCache(maxsize=50_000, ttl=3600)
+_workspace_member_cache = TTLCache(maxsize=100_000, ttl=60)
+
+@functools.cache
+def _channel_workspace_id():
+    return select(Channel.workspace_id).filter(Channel.id == bindparam("channel_id"), Channel.deleted_at.is_(None))
+
+async def get_channel_workspace_id(db: AsyncSession, channel_id: uuid.UUID, cached: bool = True):
+    """Workspace of a channel, or None if the channel doesn't exist or is hidden.
+    A cached answer outlives a hide in other workers (forget_deleted only
+    reaches this one): pass cached=False before reading the channel's rows."""
+    workspace_id = _channel_workspace_cache.get(channel_id) if cached else None
+    if workspace_id is None:
+        result = await db.execute(_channel_workspace_id(), {"channel_id": channel_id})
+        workspace_id = result.scalar_one_or_none()
+        if workspace_id is not None:
+            _channel_workspace_cache.set(channel_id, workspace_id)
+    return workspace_id
+
+def forget_deleted(channel_ids=()):
+    """Drop this worker's cached access answers after hiding channels, users or workspaces"""
+    for channel_id in channel_ids:
+        _channel_workspace_cache.pop(channel_id)
+    # Keyed by (workspace, user); deletions are rare enough to start over
+    _workspace_member_cache.clear()
+
+async def is_workspace_member(db: AsyncSession, workspace_id: uuid.UUID, user_id: uuid.UUID):
+    # Only positive answers are cached, so a user who just joined isn't locked out
+    key = (workspace_id, user_id)
+    if _workspace_member_cache.get(key):
+        return True
+    is_member = await get_workspace_member(db, workspace_id, user_id) is not None
+    if is_member:
+        _workspace_member_cache.set(key, True)
+    return is_member
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import ColumnElement, Table, and_, delete, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import database
+import jobs
+import logs
+import message_cache
+import models
+import storage
+import thumbnails
+from ws_manager import manager
+
+log = logs.get_logger("deletions")
+
+# Removal of channels, users and workspaces. The request only hides the target
+# (crud.hide_*) and records a Deletion; a durable job then deletes the rows in
+# chunks of DELETE_CHUNK_SIZE, each its own short transaction, so nothing is
+# loaded into memory and no statement locks the whole set. Reactions,
+# attachments and mentions of a message go with it (ON DELETE CASCADE). A
+# failed or interrupted job is retried and picks up where the rows left off,
+# and a deletion whose job was lost (a crash between the commit and the
+# enqueue, an in-process queue dying, a dead-lettered job) is requeued once it
+# has made no progress for DELETE_STALE_SECONDS. Running it twice is harmless.
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", 1000))
+DELETE_CHUNK_PAUSE_MS = int(os.getenv("DELETE_CHUNK_PAUSE_MS", 10))  # Between chunks, leaves room for live writes
+DELETE_STALE_SECONDS = float(os.getenv("DELETE_STALE_SECONDS", 300))
+
+
+class _Stage(NamedTuple):
+    name: str
+    table: Table
+    where: ColumnElement
+
+
+def _channel_stages(channel_ids) -> List[_Stage]:
+    messages = models.Message.__table__
+    members = models.ChannelMember.__table__
+    in_channels = messages.c.channel_id.in_(channel_ids)
+    return [
+        # Replies before their parents (messages.parent_id has no cascade). A reply
+        # posted meanwhile makes a later stage fail; the retry starts over here.
+        _Stage("thread replies", messages, and_(in_channels, messages.c.parent_id.is_not(None))),
+        _Stage("messages", messages, and_(in_channels, messages.c.parent_id.is_(None))),
+        _Stage("channel members", members, members.c.channel_id.in_(channel_ids)),
+    ]
+
+
+def _stages(kind: str, target_id: uuid.UUID) -> List[_Stage]:
+    channels = models.Channel.__table__
+    if kind == "channel":
+        return _channel_stages([target_id]) + [_Stage("channel", channels, channels.c.id == target_id)]
+
+    if kind == "workspace":
+        members = models.WorkspaceMember.__table__
+        workspaces = models.Workspace.__table__
+        channel_ids = select(channels.c.id).filter(channels.c.workspace_id == target_id)
+        return _channel_stages(channel_ids) + [
+            _Stage("channels", channels, channels.c.workspace_id == target_id),
+            _Stage("workspace members", members, members.c.workspace_id == target_id),
+            _Stage("workspace", workspaces, workspaces.c.id == target_id),
+        ]
+
+    messages = models.Message.__table__
+    parents = messages.alias("parents")
+    own_messages = select(parents.c.id).filter(parents.c.user_id == target_id)
+    stages = [
+        # Other people's replies in the user's threads go with the thread
+        _Stage("thread replies", messages, messages.c.parent_id.in_(own_messages)),
+        _Stage("messages", messages, and_(
+            messages.c.user_id == target_id,
+            or_(messages.c.parent_id.is_(None), messages.c.parent_id.not_in(own_messages)),
+        )),
+    ]
+    for name, model in (
+        ("reactions", models.Reaction),
+        ("attachments", models.Attachment),
+        ("notifications", models.Notification),
+        ("mentions", models.message_mentions),
+        ("broadcast reads", models.BroadcastMentionRead),
+        ("channel members", models.ChannelMember),
+        ("workspace members", models.WorkspaceMember),
+    ):
+        table = getattr(model, "__table__", model)
+        stages.append(_Stage(name, table, table.c.user_id == target_id))
+    users = models.User.__table__
+    return stages + [_Stage("user", users, users.c.id == target_id)]
+
+
+async def _attachment_files(db: AsyncSession, table: Table, ids: list) -> list:
+    """Stored files of the attachments a chunk will take with it"""
+    attachment = models.Attachment
+    if table is models.Message.__table__:
+        where = attachment.message_id.in_(ids)
+    elif table is attachment.__table__:
+        where = attachment.id.in_(ids)
+    else:
+        return []
+    result = await db.execute(select(attachment.file_path, attachment.file_type).filter(where))
+    return result.all()
+
+
+async def _delete_files(files: list) -> None:
+    for file_path, file_type in files:
+        backend, key = storage.resolve(file_path)
+        keys = [key]
+        if thumbnails.is_supported(file_type):
+            keys += [thumbnails.derivative_path(key, variant) for variant in thumbnails.THUMBNAIL_VARIANTS]
+        for key in keys:
+            try:
+                await backend.delete(key)
+            except Exception as e:
+                # The rows are gone either way; an orphaned object is only storage
+                log.warning("deletion_file_failed", key=key, error=str(e))
+
+
+async def _clear(deletion_id: uuid.UUID, stage: _Stage) -> None:
+    """Delete the stage's rows a chunk at a time, counting them on the Deletion"""
+    pk = list(stage.table.primary_key.columns)
+    key = pk[0] if len(pk) == 1 else tuple_(*pk)
+    deletions = models.Deletion.__table__
+    while True:
+        async with database.async_session_maker() as db:
+            result = await db.execute(select(*pk).filter(stage.where).limit(DELETE_CHUNK_SIZE))
+            ids = [row[0] if len(pk) == 1 else tuple(row) for row in result]
+            if not ids:
+                return
+            files = await _attachment_files(db, stage.table, ids)
+            result = await db.execute(delete(stage.table).filter(key.in_(ids)))
+            # Progress commits with the chunk it counts
+            await db.execute(
+                update(deletions).filter(deletions.c.id == deletion_id)
+                .values(stage=stage.name, rows_deleted=deletions.c.rows_deleted + result.rowcount, updated_at=func.now())
+            )
+            await db.commit()
+        await _delete_files(files)
+        if len(ids) < DELETE_CHUNK_SIZE:
+            return
+        await asyncio.sleep(DELETE_CHUNK_PAUSE_MS / 1000)
+
+
+@jobs.job("deletions.run")
+async def run(payload: dict) -> None:
+    deletion_id = uuid.UUID(payload["deletion_id"])
+    async with database.async_session_maker() as db:
+        deletion = await db.get(models.Deletion, deletion_id)
+        if deletion is None or deletion.status == "done":
+            return
+        kind, target_id = deletion.kind, deletion.target_id
+        stages = _stages(kind, target_id)
+        if deletion.rows_total is None:
+            total = 0
+            for stage in stages:
+                result = await db.execute(select(func.count()).select_from(stage.table).filter(stage.where))
+                total += result.scalar_one()
+            deletion.rows_total = total
+        if kind == "workspace":
+            result = await db.execute(select(models.Channel.id).filter(models.Channel.workspace_id == target_id))
+            channel_ids = result.scalars().all()
+        else:
+            channel_ids = [target_id] if kind == "channel" else []
+        deletion.status = "running"
+        deletion.updated_at = func.now()
+        await db.commit()
+
+    log.info("deletion_started", deletion_id=str(deletion_id), kind=kind, target_id=str(target_id),
+             rows_total=deletion.rows_total)
+    try:
+        if kind == "user":
+            # Nullable owner references survive the user
+            async with database.async_session_maker() as db:
+                for model in (models.Channel, models.Workspace):
+                    await db.execute(update(model).filter(model.owner_id == target_id).values(owner_id=None))
+                await db.commit()
+        for stage in stages:
+            await _clear(deletion_id, stage)
+    except Exception as e:
+        async with database.async_session_maker() as db:
+            await db.execute(
+                update(models.Deletion).filter(models.Deletion.id == deletion_id).values(error=f"{type(e).__name__}: {e}")
+            )
+            await db.commit()
+        raise
+
+    async with database.async_session_maker() as db:
+        await db.execute(
+            update(models.Deletion).filter(models.Deletion.id == deletion_id)
+            .values(status="done", stage=None, error=None, finished_at=func.now())
+        )
+        await db.commit()
+    # A read racing the hide could have refilled the first-page cache
+    for channel_id in channel_ids:
+        await message_cache.invalidate(channel_id)
+    log.info("deletion_done", deletion_id=str(deletion_id), kind=kind, target_id=str(target_id))
+
+
+async def _schedule(db: AsyncSession, kind: str, target_id: uuid.UUID, requested_by: Optional[uuid.UUID],
+                    channel_ids: list) -> models.Deletion:
+    deletion = models.Deletion(kind=kind, target_id=target_id, requested_by=requested_by)
+    db.add(deletion)
+    await db.commit()
+    await db.refresh(deletion)
+    crud.forget_deleted(channel_ids)
+    for channel_id in channel_ids:
+        await message_cache.invalidate(channel_id)
+        await manager.close_channel(str(channel_id))
+    if kind == "user":
+        await manager.close_user(str(target_id))
+    await jobs.enqueue("deletions.run", {"deletion_id": deletion.id})
+    log.info("deletion_requested", deletion_id=str(deletion.id), kind=kind, target_id=str(target_id))
+    return deletion
+
+
+async def delete_channel(db: AsyncSession, channel: models.Channel, requested_by: uuid.UUID) -> models.Deletion:
+    """Hide the channel now and remove its messages and members in the background"""
+    channel_ids = await crud.hide_channel(db, channel)
+    return await _schedule(db, "channel", channel.id, requested_by, channel_ids)
+
+
+async def delete_workspace(db: AsyncSession, workspace: models.Workspace, requested_by: uuid.UUID) -> models.Deletion:
+    """Hide the workspace and its channels now and remove them in the background"""
+    channel_ids = await crud.hide_workspace(db, workspace)
+    return await _schedule(db, "workspace", workspace.id, requested_by, channel_ids)
+
+
+async def delete_user(db: AsyncSession, user: models.User, requested_by: uuid.UUID) -> models.Deletion:
+    """Hide the user now and remove their messages, reactions, notifications and
+    uploads in the background"""
+    channel_ids = await crud.hide_user(db, user)
+    return await _schedule(db, "user", user.id, requested_by, channel_ids)
+
+
+async def resume(startup: bool = False) -> None:
+    """Requeue unfinished deletions idle for DELETE_STALE_SECONDS. Each is
+    claimed by bumping its updated_at, so concurrent workers don't all requeue
+    it. At startup on the in-process backend nothing can still be queued, so
+    every unfinished deletion is requeued right away."""
+    idle = 0 if startup and not jobs.durable() else DELETE_STALE_SECONDS
+    deletion = models.Deletion
+    async with database.async_session_maker() as db:
+        result = await db.execute(
+            update(deletion)
+            .filter(deletion.status != "done",
+                    func.coalesce(deletion.updated_at, deletion.created_at) <= datetime.now(timezone.utc) - timedelta(seconds=idle))
+            .values(updated_at=func.now())
+            .returning(deletion.id)
+        )
+        deletion_ids = result.scalars().all()
+        await db.commit()
+    for deletion_id in deletion_ids:
+        await jobs.enqueue("deletions.run", {"deletion_id": deletion_id})
+    if deletion_ids:
+        log.info("deletions_resumed", count=len(deletion_ids))
+
+
+async def run_resumer() -> None:
+    """Background task (app lifespan): resume stalled deletions"""
+    while True:
+        await asyncio.sleep(DELETE_STALE_SECONDS / 2)
+        try:
+            await resume()
+        except Exception as e:
+            log.error("deletions_resume_failed", error=str(e))
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+import anyio
+from sqlalchemy import Select, select
+
+import database
+import logs
+import models
+
+log = logs.get_logger("export")
+
+# Admin workspace export: one JSON object per line, each with a "type", gzipped
+# as it is produced. Rows come off server-side cursors EXPORT_BATCH_ROWS at a
+# time inside a single read transaction, so the file is a consistent snapshot
+# and memory stays flat however large the workspace is. Attachments are listed
+# (a manifest), not embedded.
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 2000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT", 1))  # Each holds a DB connection until it finishes
+
+FORMAT_VERSION = 1
+
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+_producers = set()  # Keeps running export tasks referenced
+
+
+def busy() -> bool:
+    return _slots.locked()
+
+
+def _default(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _line(record_type: str, fields: dict) -> str:
+    return json.dumps({"type": record_type, **fields}, default=_default, ensure_ascii=False) + "\n"
+
+
+def _workspace_sections(workspace_id: uuid.UUID) -> list:
+    user, member, channel = models.User, models.WorkspaceMember, models.Channel
+    channel_member = models.ChannelMember
+    return [
+        ("workspace", select(
+            models.Workspace.id, models.Workspace.name, models.Workspace.owner_id, models.Workspace.created_at
+        ).filter(models.Workspace.id == workspace_id)),
+        ("user", select(
+            user.id, user.username, user.email, user.full_name, user.created_at, member.role, member.joined_at
+        ).join(member, member.user_id == user.id)
+         .filter(member.workspace_id == workspace_id, user.deleted_at.is_(None))
+         .order_by(member.joined_at)),
+        ("channel", select(
+            channel.id, channel.name, channel.description, channel.type.label("channel_type"), channel.owner_id,
+            channel.created_at
+        ).filter(channel.workspace_id == workspace_id, channel.deleted_at.is_(None))
+         .order_by(channel.created_at)),
+        ("channel_member", select(
+            channel_member.channel_id, channel_member.user_id, channel_member.joined_at
+        ).join(channel, channel.id == channel_member.channel_id)
+         .filter(channel.workspace_id == workspace_id, channel.deleted_at.is_(None))),
+    ]
+
+
+def _channel_sections(channel_id: uuid.UUID) -> list:
+    message, reaction, attachment = models.Message, models.Reaction, models.Attachment
+    return [
+        # Thread replies are messages with a parent_id; ix_messages_channel_id_created_at serves the order
+        ("message", select(
+            message.id, message.channel_id, message.user_id, message.parent_id, message.content, message.created_at
+        ).filter(message.channel_id == channel_id).order_by(message.created_at)),
+        ("reaction", select(
+            reaction.message_id, reaction.user_id, reaction.emoji, reaction.created_at
+        ).join(message, message.id == reaction.message_id).filter(message.channel_id == channel_id)),
+        ("attachment", select(
+            attachment.id, attachment.message_id, attachment.user_id, attachment.filename, attachment.file_type,
+            attachment.file_size, attachment.file_path, attachment.created_at
+        ).join(message, message.id == attachment.message_id).filter(message.channel_id == channel_id)),
+    ]
+
+
+async def _produce(workspace_id: uuid.UUID, queue: asyncio.Queue, stop: asyncio.Event) -> None:
+    """Read and compress the export into `queue`, a None last; stops between
+    batches once `stop` is set"""
+    async with _slots:
+        start = time.perf_counter()
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # gzip container
+        counts = Counter()
+        raw_bytes = 0
+        compressed_bytes = 0
+
+        async def send(data: bytes) -> None:
+            nonlocal raw_bytes, compressed_bytes
+            raw_bytes += len(data)
+            # Deflate off the event loop so other requests keep being served
+            chunk = await anyio.to_thread.run_sync(compressor.compress, data)
+            if chunk and not stop.is_set():
+                compressed_bytes += len(chunk)
+                await queue.put(chunk)
+
+        async def section(record_type: str, stmt: Select, channel_ids: list = None) -> None:
+            if stop.is_set():
+                return
+            result = await conn.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+            async for rows in result.partitions():
+                lines = []
+                for row in rows:
+                    fields = row._asdict()
+                    if channel_ids is not None:
+                        channel_ids.append(fields["id"])
+                    if record_type == "workspace":
+                        fields.update(format=FORMAT_VERSION, exported_at=datetime.now(timezone.utc))
+                    lines.append(_line(record_type, fields))
+                counts[record_type] += len(rows)
+                await send("".join(lines).encode())
+                if stop.is_set():
+                    break
+            await result.close()
+
+        try:
+            # Reads go to the SQLite reader pool when there is one, never the single writer
+            bind = database.reader_engine or database.engine
+            async with bind.connect() as conn:
+                if not database.IS_SQLITE:
+                    # One snapshot for every statement of the export
+                    await conn.execution_options(isolation_level="REPEATABLE READ")
+                async with conn.begin():
+                    channel_ids = []
+                    for record_type, stmt in _workspace_sections(workspace_id):
+                        await section(record_type, stmt, channel_ids if record_type == "channel" else None)
+                    for channel_id in channel_ids:
+                        for record_type, stmt in _channel_sections(channel_id):
+                            await section(record_type, stmt)
+            if stop.is_set():
+                log.info("workspace_export_aborted", workspace_id=str(workspace_id), records=sum(counts.values()))
+                return
+            tail = compressor.compress(_line("export_end", {"counts": dict(counts)}).encode()) + compressor.flush()
+            compressed_bytes += len(tail)
+            await queue.put(tail)
+            await queue.put(None)
+        except Exception as e:
+            log.error("workspace_export_failed", workspace_id=str(workspace_id), error=str(e))
+            if not stop.is_set():
+                await queue.put(e)
+            return
+        log.info("workspace_exported", workspace_id=str(workspace_id), records=sum(counts.values()),
+                 raw_bytes=raw_bytes, compressed_bytes=compressed_bytes,
+                 duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+
+async def stream_workspace(workspace_id: uuid.UUID) -> AsyncIterator[bytes]:
+    """Gzipped NDJSON of the workspace: workspace, users, channels, channel
+    members, then each channel's messages, reactions and attachment manifest;
+    an export_end record with the counts closes a complete file"""
+    # The database work runs in its own task: a client hanging up cancels this
+    # generator, and a cancel landing inside a driver call can leave a broken
+    # connection in the pool. The producer instead stops at its next batch.
+    queue = asyncio.Queue(maxsize=2)  # Compresses the next batch while this one is sent
+    stop = asyncio.Event()
+    producer = asyncio.create_task(_produce(workspace_id, queue, stop))
+    _producers.add(producer)
+    producer.add_done_callback(_producers.discard)
+    try:
+        while (chunk := await queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        # Unblock a producer waiting on a full queue so it can see `stop`
+        while not queue.empty():
+            queue.get_nowait()
@@ -0,0 +1,58 @@
+import functools
+import types
+import typing
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+# JSON for hot read endpoints without going through response_model, which
+# validates every nested object read off the ORM (each embedded user's email
+# included) before serializing it. The rows are our own data: dump() copies
+# each schema field straight off them, following the schema's nesting, and
+# orjson encodes the result. The shape is exactly the schema's.
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z  # UUID map keys; UTC as "Z", as pydantic writes it
+
+
+def _nested(annotation):
+    """(schema, is_list) for a field holding models, else None"""
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType):
+        inner = [arg for arg in args if arg is not type(None)]
+        return _nested(inner[0]) if len(inner) == 1 else None
+    if origin is list and args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+        return args[0], True
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None
+
+
+@functools.cache
+def _plan(schema: type[BaseModel]) -> list:
+    """(name, default, nested) per field, worked out once per schema"""
+    return [
+        (name, None if field.is_required() else field.get_default(call_default_factory=True), _nested(field.annotation))
+        for name, field in schema.model_fields.items()
+    ]
+
+
+def dump(row, schema: type[BaseModel]) -> dict:
+    """The schema's fields of a loaded row (and of its loaded relationships)"""
+    data = {}
+    for name, default, nested in _plan(schema):
+        value = getattr(row, name, default)
+        if nested is not None and value is not None:
+            model, many = nested
+            value = [dump(item, model) for item in value] if many else dump(value, model)
+        elif isinstance(value, list):
+            value = list(value)  # Never hand out a shared default
+        data[name] = value
+    return data
+
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, option=_OPTIONS)
+
+
+def response(data) -> Response:
+    return Response(content=dumps(data), media_type="application/json")
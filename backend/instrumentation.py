@@ -0,0 +1,253 @@
+import heapq
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import default
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import logs
+import metrics
+
+log = logs.get_logger("sql")
+
+# SQL instrumentation: per-request / per-WS-event statement counts, DB time,
+# slowest statements and pool wait, built on SQLAlchemy events. When disabled
+# no listeners or middleware are installed, so the hot path is untouched.
+SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "false").lower() == "true"
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", 200))
+# Same statement executed this many times in one request/event => likely N+1
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 5))
+SLOWEST_KEPT = 5
+
+
+class QueryStats:
+    """Statements executed within one scope (an HTTP request or a WS event)"""
+
+    __slots__ = ("label", "statements", "db_time", "pool_wait", "slowest", "shapes")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.statements = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.slowest: list = []  # min-heap of (duration, statement)
+        self.shapes: Dict[str, int] = {}
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.db_time += duration
+        self.shapes[statement] = self.shapes.get(statement, 0) + 1
+        if len(self.slowest) < SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (duration, statement))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, statement))
+
+    def n_plus_one(self) -> Dict[str, int]:
+        return {sql: n for sql, n in self.shapes.items() if n >= SQL_N_PLUS_ONE_THRESHOLD}
+
+
+class EndpointStats:
+    """Aggregate over all scopes sharing a label (route template or WS event type)"""
+
+    __slots__ = ("calls", "statements", "max_statements", "db_time", "pool_wait", "slowest", "n_plus_one")
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.slowest: list = []
+        self.n_plus_one: Dict[str, int] = {}
+
+    def add(self, stats: QueryStats) -> None:
+        self.calls += 1
+        self.statements += stats.statements
+        self.max_statements = max(self.max_statements, stats.statements)
+        self.db_time += stats.db_time
+        self.pool_wait += stats.pool_wait
+        for item in stats.slowest:
+            if len(self.slowest) < SLOWEST_KEPT:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+        for sql, n in stats.n_plus_one().items():
+            self.n_plus_one[sql] = max(self.n_plus_one.get(sql, 0), n)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "statements": self.statements,
+            "avg_statements": round(self.statements / self.calls, 2) if self.calls else 0,
+            "max_statements": self.max_statements,
+            "db_time_ms": round(self.db_time * 1000, 2),
+            "pool_wait_ms": round(self.pool_wait * 1000, 2),
+            "slowest": [
+                {"ms": round(d * 1000, 2), "statement": sql}
+                for d, sql in sorted(self.slowest, reverse=True)
+            ],
+            "n_plus_one": [
+                {"count": n, "statement": sql}
+                for sql, n in sorted(self.n_plus_one.items(), key=lambda item: -item[1])
+            ],
+        }
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("sql_query_stats", default=None)
+endpoints: Dict[str, EndpointStats] = {}
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _finish(stats: QueryStats) -> None:
+    aggregate = endpoints.get(stats.label)
+    if aggregate is None:
+        aggregate = endpoints[stats.label] = EndpointStats()
+    aggregate.add(stats)
+    for sql, n in stats.n_plus_one().items():
+        log.warning("sql_n_plus_one", label=stats.label, count=n, statement=sql[:200])
+
+
+@contextmanager
+def scope(label: str):
+    """Collect statements run inside the block under `label`"""
+    if not SQL_INSTRUMENTATION:
+        yield None
+        return
+    stats = QueryStats(label)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        _finish(stats)
+
+
+def reset() -> None:
+    endpoints.clear()
+
+
+def snapshot() -> dict:
+    return {
+        label: aggregate.to_dict()
+        for label, aggregate in sorted(endpoints.items(), key=lambda item: -item[1].statements)
+    }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _record_statement(conn, statement: str, error: Optional[BaseException] = None) -> None:
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, duration)
+    if duration * 1000 >= SQL_SLOW_QUERY_MS:
+        label = stats.label if stats is not None else "-"
+        extra = {"error": repr(error)} if error is not None else {}
+        log.warning("sql_slow_query", label=label, ms=round(duration * 1000, 1), statement=statement[:500], **extra)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn, statement)
+
+
+def _handle_error(context):
+    """A failed statement skips after_cursor_execute; record it (a timeout is
+    exactly the slow query worth logging) and pop its start time here"""
+    conn = context.connection
+    if conn is None or not conn.info.get("query_start_time") or context.statement is None:
+        return
+    _record_statement(conn, context.statement, context.original_exception)
+
+
+# Statement cache outcomes, counted on every statement whether or not
+# SQL_INSTRUMENTATION is on (a counter increment or two)
+_COMPILED_CACHE_RESULTS = {
+    default.CACHE_HIT: "hit",
+    default.CACHE_MISS: "miss",
+    default.NO_CACHE_KEY: "uncacheable",
+    default.CACHING_DISABLED: "disabled",
+    default.NO_DIALECT_SUPPORT: "disabled",
+}
+
+
+def _count_cache_use(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and context.compiled is not None:
+        metrics.SQL_COMPILED_CACHE.inc(_COMPILED_CACHE_RESULTS.get(context.cache_hit, "disabled"))
+    # asyncpg (Postgres) only: SQLAlchemy's per-connection LRU of prepared statements, keyed by SQL
+    prepared = getattr(conn.connection.dbapi_connection, "_prepared_statement_cache", None)
+    if prepared is not None:
+        metrics.SQL_PREPARED_STATEMENTS.inc("hit" if statement in prepared else "miss")
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Queue pool that records checkout wait in metrics and charges it to the current scope"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            metrics.DB_POOL_WAIT.observe(waited)
+            stats = _current.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+
+def install(engine) -> None:
+    """Attach cursor listeners to an (async) engine; no-op unless SQL_INSTRUMENTATION is on"""
+    if not SQL_INSTRUMENTATION:
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def install_cache_stats(engine) -> None:
+    """Count compiled-statement and prepared-statement cache hits in metrics"""
+    event.listen(getattr(engine, "sync_engine", engine), "before_cursor_execute", _count_cache_use)
+
+
+class SQLInstrumentationMiddleware:
+    """ASGI middleware: one scope per HTTP request, labelled by route template.
+
+    Adds a Server-Timing header (db time, statement count) to every response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats("http")
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.db_time * 1000:.2f};desc="{stats.statements} queries"'.encode()
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            stats.label = f"{scope['method']} {route.path}" if route is not None else "unmatched"
+            _finish(stats)
@@ -0,0 +1,338 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError, WatchError
+
+import logs
+import metrics
+
+log = logs.get_logger("jobs")
+
+# Background jobs for work that shouldn't hold up the request that caused it.
+# Durable jobs go to a Redis Stream read through a consumer group: any worker
+# process can run them, a running job keeps its lease alive, and jobs whose
+# lease runs out (worker crashed or stalled) are reclaimed by another worker.
+# Failures are retried with exponential backoff and dead-lettered after
+# JOBS_MAX_ATTEMPTS. JOBS_BACKEND=local swaps in an in-process queue with the
+# same retry/dead-letter behaviour (development, single node without Redis).
+#
+# Jobs registered with local=True always use the in-process queue: pushes to
+# this process's WebSockets can't run anywhere else, and die with it anyway.
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "redis")  # redis | local
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 4))  # Concurrent jobs per process (per queue)
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", 60))  # Unacked this long -> reclaimed
+JOBS_RETRY_BASE_SECONDS = float(os.getenv("JOBS_RETRY_BASE_SECONDS", 2))  # base * 2^(attempt - 1), jittered
+JOBS_STREAM = os.getenv("JOBS_STREAM", "jobs")
+
+_GROUP = "workers"
+_CONSUMER = metrics.WORKER_ID
+_DELAYED_KEY = f"{JOBS_STREAM}:delayed"  # Sorted set of retries, scored by due time
+_DEAD_KEY = f"{JOBS_STREAM}:dead"
+_DEAD_MAXLEN = 10000
+
+
+class Job(NamedTuple):
+    id: str
+    name: str
+    payload: dict
+    attempts: int  # Failed attempts so far
+
+
+class _Handler(NamedTuple):
+    func: Callable[[dict], Awaitable[None]]
+    local: bool
+
+
+_handlers: Dict[str, _Handler] = {}
+_redis: Optional[redis.Redis] = None
+_local_queue: asyncio.Queue = asyncio.Queue()
+_local_dead: deque = deque(maxlen=1000)
+_local_ids = itertools.count(1)
+_tasks: List[asyncio.Task] = []
+_stopping = False
+
+
+def job(name: str, local: bool = False):
+    """Register ``async def handler(payload: dict)`` as the handler for jobs called `name`"""
+
+    def register(func):
+        _handlers[name] = _Handler(func, local)
+        return func
+
+    return register
+
+
+def durable() -> bool:
+    """Whether durable jobs are in Redis (they outlive this process)"""
+    return _redis is not None
+
+
+async def enqueue(name: str, payload: dict) -> None:
+    """Queue a job. The payload goes through JSON on every backend (UUIDs and
+    datetimes arrive as strings). Jobs queue in-process until start() runs."""
+    handler = _handlers[name]
+    body = json.dumps(payload, default=str)
+    if handler.local or _redis is None:
+        _local_queue.put_nowait(Job(f"local-{next(_local_ids)}", name, json.loads(body), 0))
+    else:
+        await _redis.xadd(JOBS_STREAM, {"name": name, "payload": body, "attempts": 0})
+    metrics.JOBS.inc(name, "enqueued")
+
+
+def _retry_delay(attempts: int) -> float:
+    return JOBS_RETRY_BASE_SECONDS * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+
+
+async def _execute(job: Job) -> Optional[str]:
+    """Run the job's handler; returns None on success, else the error"""
+    handler = _handlers.get(job.name)
+    if handler is None:
+        return f"no handler registered for {job.name!r}"
+    start = time.perf_counter()
+    try:
+        await handler.func(job.payload)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log.exception("job_failed", job=job.name, job_id=job.id, attempt=job.attempts + 1)
+        metrics.JOBS.inc(job.name, "failed")
+        return f"{type(e).__name__}: {e}"
+    metrics.JOB_SECONDS.observe(time.perf_counter() - start, job.name)
+    metrics.JOBS.inc(job.name, "done")
+    return None
+
+
+# --- In-process queue ---------------------------------------------------------
+
+async def _work_local() -> None:
+    while True:
+        job = await _local_queue.get()
+        error = await _execute(job)
+        if error is None:
+            continue
+        attempts = job.attempts + 1
+        if attempts >= JOBS_MAX_ATTEMPTS:
+            _local_dead.append({"id": job.id, "name": job.name, "payload": job.payload,
+                                "attempts": attempts, "error": error, "failed_at": time.time()})
+            metrics.JOBS.inc(job.name, "dead")
+            log.error("job_dead", job=job.name, job_id=job.id, attempts=attempts, error=error)
+        else:
+            asyncio.get_running_loop().call_later(
+                _retry_delay(attempts), _local_queue.put_nowait, job._replace(attempts=attempts)
+            )
+
+
+# --- Redis Streams queue --------------------------------------------------------
+
+def _decode(entry_id: bytes, fields: dict) -> Job:
+    fields = {key.decode(): value.decode() for key, value in fields.items()}
+    return Job(entry_id.decode(), fields["name"], json.loads(fields["payload"]), int(fields["attempts"]))
+
+
+# Renew only an entry this consumer still owns: once the reclaimer has taken
+# it (our lease ran out during a stall), claiming it back would run it twice
+_RENEW_SCRIPT = """
+local owned = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[3], ARGV[3], 1, ARGV[2])
+if #owned == 0 then
+    return 0
+end
+redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[3], 'JUSTID')
+return 1
+"""
+
+
+async def _keep_lease(entry_id: str) -> None:
+    """Reset the entry's idle time while its handler runs, so it isn't
+    reclaimed; returns once the entry is no longer ours"""
+    while True:
+        await asyncio.sleep(JOBS_LEASE_SECONDS / 3)
+        try:
+            if not await _redis.eval(_RENEW_SCRIPT, 1, JOBS_STREAM, _GROUP, _CONSUMER, entry_id):
+                log.warning("job_lease_lost", job_id=entry_id)
+                return
+        except RedisError as e:
+            log.warning("job_lease_renew_failed", job_id=entry_id, error=str(e))
+
+
+async def _finish(job: Job, error: Optional[str]) -> None:
+    """Ack the entry, scheduling a retry or dead-lettering it in the same transaction"""
+    async with _redis.pipeline(transaction=True) as pipe:
+        if error is not None:
+            attempts = job.attempts + 1
+            fields = {"name": job.name, "payload": json.dumps(job.payload), "attempts": attempts}
+            if attempts >= JOBS_MAX_ATTEMPTS:
+                pipe.xadd(_DEAD_KEY, {**fields, "error": error[:2000], "job_id": job.id, "failed_at": time.time()},
+                          maxlen=_DEAD_MAXLEN, approximate=True)
+                metrics.JOBS.inc(job.name, "dead")
+                log.error("job_dead", job=job.name, job_id=job.id, attempts=attempts, error=error)
+            else:
+                # job_id keeps identical retries distinct members of the set
+                pipe.zadd(_DELAYED_KEY, {json.dumps({**fields, "job_id": job.id}): time.time() + _retry_delay(attempts)})
+        pipe.xack(JOBS_STREAM, _GROUP, job.id)
+        pipe.xdel(JOBS_STREAM, job.id)
+        await pipe.execute()
+
+
+async def _run_entry(entry_id: bytes, fields: dict) -> None:
+    try:
+        job = _decode(entry_id, fields)
+        lease = asyncio.create_task(_keep_lease(job.id))
+        try:
+            error = await _execute(job)
+        finally:
+            lost = lease.done()  # _keep_lease only returns once the entry isn't ours
+            lease.cancel()
+        if lost:
+            return  # The reclaimer already counted this attempt and acked the entry
+        await _finish(job, error)
+    except RedisError as e:
+        # Left pending: reclaimed (and counted as an attempt) once its lease expires
+        log.warning("jobs_redis_error", job_id=entry_id.decode(), error=str(e))
+    except Exception:
+        log.exception("jobs_worker_error", job_id=entry_id.decode())
+
+
+async def _work_redis() -> None:
+    """One blocked read per process; an entry is only claimed while one of the
+    JOBS_WORKERS slots is free, so a busy process leaves jobs to the others"""
+    slots = asyncio.Semaphore(JOBS_WORKERS)
+    running = set()
+    try:
+        # Checked as well as cancelled: redis-py can swallow a cancel that lands
+        # just as a blocked read returns, and the loop would then read again
+        while not _stopping:
+            await slots.acquire()
+            try:
+                entries = await _redis.xreadgroup(_GROUP, _CONSUMER, {JOBS_STREAM: ">"}, count=1, block=5000)
+            except RedisError as e:
+                slots.release()
+                log.warning("jobs_redis_error", error=str(e))
+                if "NOGROUP" in str(e):  # Redis restarted without its data
+                    with contextlib.suppress(RedisError):
+                        await _create_group(_redis)
+                await asyncio.sleep(1)
+                continue
+            messages = [message for _, stream_messages in entries or () for message in stream_messages]
+            if not messages:
+                slots.release()
+            for entry_id, fields in messages:
+                task = asyncio.create_task(_run_entry(entry_id, fields))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: slots.release())
+    finally:
+        for task in running:
+            task.cancel()
+
+
+async def _promote_due_retries() -> None:
+    async with _redis.pipeline(transaction=True) as pipe:
+        await pipe.watch(_DELAYED_KEY)
+        due = await pipe.zrangebyscore(_DELAYED_KEY, 0, time.time(), start=0, num=100)
+        if not due:
+            return
+        pipe.multi()
+        pipe.zrem(_DELAYED_KEY, *due)
+        for member in due:
+            fields = json.loads(member)
+            pipe.xadd(JOBS_STREAM, {"name": fields["name"], "payload": fields["payload"], "attempts": fields["attempts"]})
+        await pipe.execute()
+
+
+async def _reclaim_expired() -> None:
+    """Entries unacked for longer than the lease belong to a dead or stalled
+    worker; that counts as a failed attempt (the job may be what kills it)"""
+    _, claimed, _ = await _redis.xautoclaim(
+        JOBS_STREAM, _GROUP, _CONSUMER, min_idle_time=int(JOBS_LEASE_SECONDS * 1000), start_id="0-0", count=100
+    )
+    for entry_id, fields in claimed:
+        if not fields:
+            continue
+        job = _decode(entry_id, fields)
+        log.warning("job_lease_expired", job=job.name, job_id=job.id, attempt=job.attempts + 1)
+        await _finish(job, "lease expired")
+
+
+async def _maintain() -> None:
+    last_reclaim = 0.0
+    while not _stopping:
+        await asyncio.sleep(1)
+        try:
+            await _promote_due_retries()
+            if time.monotonic() - last_reclaim > JOBS_LEASE_SECONDS / 2:
+                last_reclaim = time.monotonic()
+                await _reclaim_expired()
+        except WatchError:
+            pass  # Another worker moved the due retries first
+        except RedisError as e:
+            log.warning("jobs_redis_error", error=str(e))
+        except Exception:
+            log.exception("jobs_worker_error")
+
+
+# --- Lifecycle and inspection ---------------------------------------------------
+
+async def _create_group(redis_client: redis.Redis) -> None:
+    try:
+        await redis_client.xgroup_create(JOBS_STREAM, _GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def start(redis_client: Optional[redis.Redis] = None) -> None:
+    """Start this process's worker pool (app lifespan)"""
+    global _redis
+    if JOBS_BACKEND == "redis" and redis_client is not None:
+        await _create_group(redis_client)
+        _redis = redis_client
+    _tasks.extend(asyncio.create_task(_work_local()) for _ in range(JOBS_WORKERS))
+    if _redis is not None:
+        _tasks.append(asyncio.create_task(_work_redis()))
+        _tasks.append(asyncio.create_task(_maintain()))
+    log.info("jobs_started", backend="redis" if _redis is not None else "local", workers=JOBS_WORKERS)
+
+
+async def stop() -> None:
+    """Cancel the workers. Durable jobs they were running are reclaimed once
+    their lease expires; queued in-process jobs are lost."""
+    global _redis, _stopping
+    _stopping = True
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _redis = None
+    _stopping = False
+    if not _local_queue.empty():
+        log.warning("jobs_dropped", count=_local_queue.qsize())
+
+
+async def stats(dead_letters: int = 20) -> dict:
+    data = {
+        "backend": "redis" if _redis is not None else "local",
+        "workers": JOBS_WORKERS,
+        "local": {"queued": _local_queue.qsize(), "dead": len(_local_dead), "recent_dead": list(_local_dead)[-dead_letters:]},
+    }
+    if _redis is not None:
+        pending = await _redis.xpending(JOBS_STREAM, _GROUP)
+        recent_dead = await _redis.xrevrange(_DEAD_KEY, count=dead_letters) if dead_letters else []
+        data["redis"] = {
+            "stream_length": await _redis.xlen(JOBS_STREAM),
+            "in_progress": pending["pending"],
+            "retry_scheduled": await _redis.zcard(_DELAYED_KEY),
+            "dead": await _redis.xlen(_DEAD_KEY),
+            "recent_dead": [
+                {key.decode(): value.decode() for key, value in fields.items()} for _, fields in recent_dead
+            ],
+        }
+    return data
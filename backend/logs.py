@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Structured JSON-lines logging. Callers only enqueue a record; a background
+# listener thread formats and writes it, so a slow stdout never blocks the
+# event loop. Per-event sampling and rate limits keep hot paths (typing,
+# signaling) from flooding the output.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "")  # Empty = stdout
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Max records per event name per second (0 = unlimited)
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 50))
+# "event:ratio,..." e.g. "ws.typing:0.01,ws.signal:0.1"
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+
+_ROOT = "diligental"
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+dropped = 0  # Records lost because the queue was full
+
+
+def _parse_sample(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, ratio = item.partition(":")
+        try:
+            rates[event] = float(ratio)
+        except ValueError:
+            pass
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "logger": record.name.removeprefix(f"{_ROOT}."),
+            "event": getattr(record, "event", None) or record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key != "event":
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class EventFilter(logging.Filter):
+    """Per-event sampling and a per-second rate limit, applied before enqueueing"""
+
+    def __init__(self, sample: Dict[str, float], rate_limit: int):
+        super().__init__()
+        self.sample = sample
+        self.rate_limit = rate_limit
+        self._windows: Dict[str, list] = {}  # event -> [window second, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None) or record.msg
+        ratio = self.sample.get(event)
+        if ratio is not None and record.levelno < logging.WARNING and random.random() >= ratio:
+            return False
+        if not self.rate_limit:
+            return True
+        second = int(time.monotonic())
+        window = self._windows.get(event)
+        if window is None or window[0] != second:
+            suppressed = window[2] if window is not None else 0
+            window = self._windows[event] = [second, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        window[1] += 1
+        if window[1] > self.rate_limit:
+            window[2] += 1
+            return False
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record structured (the base class flattens it into a
+        # string); only resolve what must be read in the calling context.
+        import tracing
+
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            record.trace_id = trace_id
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+class EventLogger:
+    """log.info("ws.error", user=..., channel_id=...): an event name plus fields"""
+
+    __slots__ = ("_logger",)
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def _log(self, level: int, event: str, fields: dict, exc_info=None) -> None:
+        if self._logger.isEnabledFor(level):
+            if not _RESERVED.isdisjoint(fields):
+                fields = {f"{k}_" if k in _RESERVED else k: v for k, v in fields.items()}
+            self._logger.log(level, event, extra={"event": event, **fields}, exc_info=exc_info)
+
+    def debug(self, event: str, **fields) -> None:
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields) -> None:
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(logging.getLogger(f"{_ROOT}.{name}"))
+
+
+def setup() -> None:
+    """Install the queue handler and start the writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+    writer = logging.FileHandler(LOG_FILE, encoding="utf-8") if LOG_FILE else logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(EventFilter(_parse_sample(LOG_SAMPLE), LOG_RATE_LIMIT))
+
+    root = logging.getLogger(_ROOT)
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [handler]
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,51 +1,68 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import asyncio
+import hmac
 import redis.asyncio as redis
 from contextlib import asynccontextmanager
-from database import engine, Base, async_session_maker
-from routes import auth, users, channels, ws, workspaces, notifications, files
-from crud import get_user_by_username, create_user
-from schemas import UserCreate
-from fastapi.staticfiles import StaticFiles
+from database import engine
+from routes import auth, users, channels, ws, workspaces, notifications, files, admin, boot, deletions as deletions_routes
+import thumbnails
+import storage
+import message_cache
+import instrumentation
+import changes
+import deletions
+import jobs
+import metrics
+import profiler
+import tracing
+import logs
+import migrations
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+logs.setup()
+log = logs.get_logger("main")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Create tables
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    # Configure mappers to ensure all relationships are set up
-    from sqlalchemy.orm import configure_mappers
-    try:
-        configure_mappers()
-    except Exception as e:
-        print(f"Mapper configuration warning: {e}")
-    
-    # Seed Default Admin
-    async with async_session_maker() as db:
-        try:
-            admin = await get_user_by_username(db, "admin")
-            if not admin:
-                print("Seeding default admin user...")
-                await create_user(db, UserCreate(
-                    email="admin@example.com",
-                    username="admin",
-                    password="admin123",
-                    role="admin",
-                    full_name="System Admin"
-                ))
-                print("Default admin created: admin / admin123")
-        except Exception as e:
-            print(f"Error seeding admin: {e}")
+    # Startup: schema changes run out of band (python -m migrations upgrade)
+    version = await migrations.check(engine)
+    log.info("schema_version", version=version)
 
     # Redis connection
     app.state.redis = redis.from_url(REDIS_URL)
+    tracing.instrument_redis(app.state.redis)
+    message_cache.init(app.state.redis)
+
+    # Background job workers (post-commit pushes, bulk work)
+    await jobs.start(app.state.redis)
+    await deletions.resume(startup=True)
+
+    # Metrics (event-loop lag probe, per-worker snapshot publisher), change-log
+    # pruning, stalled-deletion requeue and trace export
+    background_tasks = [
+        asyncio.create_task(metrics.monitor_event_loop()),
+        asyncio.create_task(metrics.publish(app.state.redis)),
+        asyncio.create_task(changes.run_pruner()),
+        asyncio.create_task(deletions.run_resumer()),
+    ]
+    if tracing.TRACING_ENABLED:
+        background_tasks.append(asyncio.create_task(tracing.run_exporter()))
+    if profiler.LOOP_STALL_DETECTOR:
+        profiler.stall_detector.start()
     yield
     # Shutdown
+    profiler.stall_detector.stop()
+    for task in background_tasks:
+        task.cancel()
+    await jobs.stop()
     await app.state.redis.close()
+    thumbnails.shutdown()
+    await storage.close()
+    logs.shutdown()
 
 app = FastAPI(title="Diligental API", version="0.1.0", lifespan=lifespan)
 
@@ -66,6 +83,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if instrumentation.SQL_INSTRUMENTATION:
+    app.add_middleware(instrumentation.SQLInstrumentationMiddleware)
+
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Outermost, so the root span covers the other middleware too
+if tracing.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware)
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(channels.router)
@@ -73,10 +99,9 @@ app.include_router(ws.router)
 app.include_router(workspaces.router)
 app.include_router(notifications.router)
 app.include_router(files.router)
-
-# Mount static files
-os.makedirs("uploads", exist_ok=True)
-app.mount("/static", StaticFiles(directory="uploads"), name="static")
+app.include_router(admin.router)
+app.include_router(deletions_routes.router)
+app.include_router(boot.router)
 
 @app.get("/")
 async def root():
@@ -86,6 +111,21 @@ async def root():
 async def health_check():
     try:
         await app.state.redis.ping()
-        return {"status": "ok", "redis": "connected"}
+        return {
+            "status": "ok",
+            "redis": "connected",
+            "message_cache": {**message_cache.stats, "hit_rate": round(message_cache.hit_rate(), 4)}
+        }
     except Exception as e:
         return {"status": "degraded", "redis": str(e)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition for all live workers (counters per worker, gauges summed)"""
+    if metrics.METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {metrics.METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    elif not metrics.METRICS_PUBLIC:
+        raise HTTPException(status_code=404, detail="Not Found")
+    snapshots = await metrics.collect(app.state.redis)
+    return PlainTextResponse(metrics.render(snapshots), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+import database
+import jobs
+import logs
+import metrics
+import models
+from ws_manager import manager
+
+log = logs.get_logger("mention_fanout")
+
+# Push of @channel/@here mentions, run on the job queue after the sender's
+# request has returned. It only looks at users with a notification socket on
+# this worker, so its cost follows who is online, not how large the channel
+# is. Everyone else sees the mention lazily in GET /notifications.
+MENTION_FANOUT_BATCH = int(os.getenv("MENTION_FANOUT_BATCH", 500))  # Online users resolved per query
+
+
+async def enqueue(broadcast: models.BroadcastMention, created_at: datetime) -> None:
+    """Queue delivery of a committed broadcast mention"""
+    await jobs.enqueue("mentions.fanout", {
+        "broadcast_id": broadcast.id, "message_id": broadcast.message_id, "channel_id": broadcast.channel_id,
+        "sender_id": broadcast.user_id, "kind": broadcast.kind, "created_at": created_at,
+    })
+
+
+@jobs.job("mentions.fanout", local=True)
+async def fanout(payload: dict) -> None:
+    await deliver(
+        uuid.UUID(payload["broadcast_id"]), uuid.UUID(payload["message_id"]), uuid.UUID(payload["channel_id"]),
+        uuid.UUID(payload["sender_id"]), payload["kind"], payload["created_at"],
+    )
+
+
+async def deliver(
+    broadcast_id: uuid.UUID,
+    message_id: uuid.UUID,
+    channel_id: uuid.UUID,
+    sender_id: uuid.UUID,
+    kind: str,
+    created_at: str,
+) -> int:
+    """Push the mention to online members of the channel; returns how many users got it"""
+    online = [user_id for user_id in manager.user_connections if user_id != str(sender_id)]
+    if not online:
+        return 0
+
+    start = time.perf_counter()
+    async with database.async_session_maker() as db:
+        result = await db.execute(
+            select(models.Channel.workspace_id, models.Channel.type, models.Channel.name)
+            .filter(models.Channel.id == channel_id)
+        )
+        channel = result.first()
+    if channel is None:
+        return 0
+
+    # Same audience as can_access_channel
+    if channel.type in ("public", "voice"):
+        member = models.WorkspaceMember
+        scope = member.workspace_id == channel.workspace_id
+    else:
+        member = models.ChannelMember
+        scope = member.channel_id == channel_id
+
+    data = {
+        "id": broadcast_id,
+        "content": f"@{kind} in #{channel.name}",
+        "type": "mention",
+        "is_read": False,
+        "created_at": created_at,
+        "related_id": message_id,
+    }
+    delivered = 0
+    for i in range(0, len(online), MENTION_FANOUT_BATCH):
+        batch = [uuid.UUID(user_id) for user_id in online[i:i + MENTION_FANOUT_BATCH]]
+        # Session closed before sending, so no pooled connection is held across the sends
+        async with database.async_session_maker() as db:
+            result = await db.execute(select(member.user_id).filter(scope, member.user_id.in_(batch)))
+            recipients = result.scalars().all()
+        for user_id in recipients:
+            await manager.send_personal_message({"type": "notification", "data": {**data, "user_id": user_id}}, str(user_id))
+        delivered += len(recipients)
+        await asyncio.sleep(0)  # Let socket reads and other requests in between batches
+
+    metrics.BROADCAST_LATENCY.observe(time.perf_counter() - start, "mention")
+    metrics.BROADCAST_RECIPIENTS.observe(delivered, "mention")
+    log.info("mention_fanout", kind=kind, channel_id=str(channel_id), online=len(online), recipients=delivered)
+    return delivered
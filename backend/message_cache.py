@@ -0,0 +1,263 @@
+import json
+import os
+from typing import Iterable, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, WatchError
+
+import fastjson
+import schemas
+import storage
+
+# Cache of each channel's first history page (GET /channels/{id}/messages with
+# skip=0, no parent_id): its newest MESSAGE_CACHE_SIZE messages, oldest first.
+# Stored in Redis as the ready-to-send JSON body so hits never touch Postgres
+# and every worker sees the same copy; new messages are appended and the
+# oldest trimmed off.
+MESSAGE_CACHE_ENABLED = os.getenv("MESSAGE_CACHE_ENABLED", "true").lower() == "true"
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", 50))
+MESSAGE_CACHE_TTL = int(os.getenv("MESSAGE_CACHE_TTL", 3600))
+# Pages embed signed attachment links (storage.attachment_url), valid for at
+# least one window when minted. A page lives at most half a window from its
+# fill (write-through keeps the remaining TTL), so links it serves stay valid.
+_PAGE_TTL = min(MESSAGE_CACHE_TTL, storage.ATTACHMENT_URL_EXPIRES_SECONDS // 2)
+
+_redis: Optional[redis.Redis] = None
+
+# Per-process counters (aggregated across workers by the metrics endpoint)
+stats = {"hits": 0, "misses": 0, "fills": 0, "write_through": 0, "errors": 0}
+
+# Fill only if no writer bumped the channel version since the reader
+# snapshotted it, so a slow reader can't overwrite a newer page.
+_FILL_SCRIPT = """
+local current = redis.call('GET', KEYS[1]) or '0'
+if current == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def init(client: redis.Redis) -> None:
+    global _redis
+    _redis = client if MESSAGE_CACHE_ENABLED else None
+
+
+def enabled() -> bool:
+    return _redis is not None
+
+
+def _page_key(channel_id) -> str:
+    return f"msgcache:{channel_id}:page:v3"  # v2: signed attachment links, v3: newest messages
+
+
+def _version_key(channel_id) -> str:
+    return f"msgcache:{channel_id}:ver"
+
+
+def hit_rate() -> float:
+    total = stats["hits"] + stats["misses"]
+    return stats["hits"] / total if total else 0.0
+
+
+def serialize_message(message, reply_count: int = 0) -> dict:
+    data = fastjson.dump(message, schemas.Message)
+    data["reply_count"] = reply_count
+    return data
+
+
+def dumps_page(messages: Iterable[dict]) -> bytes:
+    return fastjson.dumps(list(messages))
+
+
+# Compact shape (?format=compact): every author and reactor once in "users",
+# messages refer to them by id and carry reactions aggregated per emoji.
+def _reaction_summary(pairs) -> list:
+    by_emoji = {}
+    for emoji, user_id in pairs:
+        by_emoji.setdefault(emoji, []).append(user_id)
+    return [{"emoji": emoji, "count": len(user_ids), "user_ids": user_ids} for emoji, user_ids in by_emoji.items()]
+
+
+def compact_page(page: Iterable[dict], users: dict) -> list:
+    """Compact messages from full-format ones (a cached page), adding their
+    users to `users`"""
+    messages = []
+    for item in page:
+        item = dict(item)
+        user = item.pop("user", None)
+        if user:
+            users.setdefault(item["user_id"], user)
+        reactions = item.pop("reactions", None) or []
+        for reaction in reactions:
+            if reaction.get("user"):
+                users.setdefault(reaction["user_id"], reaction["user"])
+        item["reactions"] = _reaction_summary((reaction["emoji"], reaction["user_id"]) for reaction in reactions)
+        messages.append(item)
+    return messages
+
+
+def compact_messages(messages, users: dict, with_channel: bool = False) -> list:
+    """Compact messages straight from loaded rows, each user copied once however
+    many messages and reactions it appears on"""
+    def add_user(user):
+        if user is not None and user.id not in users:
+            users[user.id] = fastjson.dump(user, schemas.UserOut)
+
+    compact = []
+    for message in messages:
+        add_user(message.user)
+        for reaction in message.reactions:
+            add_user(reaction.user)
+        item = {
+            "id": message.id,
+            "content": message.content,
+            "channel_id": message.channel_id,
+            "parent_id": message.parent_id,
+            "created_at": message.created_at,
+            "user_id": message.user_id,
+            "reply_count": getattr(message, "reply_count", 0),
+            "reactions": _reaction_summary((reaction.emoji, reaction.user_id) for reaction in message.reactions),
+            "attachments": [fastjson.dump(attachment, schemas.AttachmentOut) for attachment in message.attachments],
+            "mentioned_users": [{"id": user.id, "username": user.username} for user in message.mentioned_users],
+        }
+        if with_channel:
+            item["channel"] = fastjson.dump(message.channel, schemas.ChannelSummary)
+        compact.append(item)
+    return compact
+
+
+def dumps_compact(**fields) -> bytes:
+    """JSON of a compact response; values may still be UUIDs and datetimes"""
+    return fastjson.dumps(fields)
+
+
+async def get_first_page(channel_id, limit: int) -> Optional[bytes]:
+    """Cached JSON body for the first page, or None on a miss"""
+    if _redis is None or limit > MESSAGE_CACHE_SIZE:
+        return None
+    try:
+        body = await _redis.get(_page_key(channel_id))
+    except RedisError:
+        stats["errors"] += 1
+        return None
+    if body is None:
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    if limit == MESSAGE_CACHE_SIZE:
+        return body
+    page = json.loads(body)
+    return dumps_page(page[max(len(page) - limit, 0):])  # The newest `limit`
+
+
+async def snapshot_version(channel_id) -> Optional[bytes]:
+    """Read before querying the DB on a miss; pass to fill()"""
+    if _redis is None:
+        return None
+    try:
+        return await _redis.get(_version_key(channel_id)) or b"0"
+    except RedisError:
+        stats["errors"] += 1
+        return None
+
+
+async def fill(channel_id, body: bytes, version: Optional[bytes]) -> None:
+    if _redis is None or version is None:
+        return
+    try:
+        stored = await _redis.eval(
+            _FILL_SCRIPT, 2, _version_key(channel_id), _page_key(channel_id),
+            version, body, _PAGE_TTL
+        )
+        if stored:
+            stats["fills"] += 1
+    except RedisError:
+        stats["errors"] += 1
+
+
+async def _update_page(channel_id, mutate) -> None:
+    """Write-through: bump the version, then apply mutate(page) -> page|None to a cached page"""
+    if _redis is None:
+        return
+    page_key = _page_key(channel_id)
+    try:
+        await _redis.incr(_version_key(channel_id))
+        async with _redis.pipeline() as pipe:
+            for _ in range(3):
+                try:
+                    await pipe.watch(page_key)
+                    body = await pipe.get(page_key)
+                    ttl = await pipe.ttl(page_key)
+                    if body is None or ttl <= 0:
+                        await pipe.reset()
+                        return # Not cached; the next read fills it
+                    page = mutate(json.loads(body))
+                    if page is None:
+                        await pipe.reset()
+                        return
+                    pipe.multi()
+                    pipe.set(page_key, dumps_page(page), ex=ttl)  # The page's oldest links bound its TTL
+                    await pipe.execute()
+                    stats["write_through"] += 1
+                    return
+                except WatchError:
+                    continue
+        # Lost the race repeatedly; drop the page rather than serve a stale one
+        await _redis.delete(page_key)
+    except RedisError:
+        stats["errors"] += 1
+        await invalidate(channel_id)
+
+
+async def message_created(message) -> None:
+    """Called after create_message commits. message needs user/attachments/mentions loaded."""
+    if _redis is None:
+        return
+
+    if message.parent_id:
+        parent_id = str(message.parent_id)
+
+        def mutate(page):
+            for item in page:
+                if item["id"] == parent_id:
+                    item["reply_count"] = (item.get("reply_count") or 0) + 1
+                    return page
+            return None
+    else:
+        data = serialize_message(message)
+
+        def mutate(page):
+            page.append(data)
+            return page[-MESSAGE_CACHE_SIZE:]
+
+    await _update_page(message.channel_id, mutate)
+
+
+async def message_updated(message) -> None:
+    """Replace a cached message (e.g. after a reaction change), keeping its reply count"""
+    if _redis is None or message.parent_id:
+        return
+    message_id = str(message.id)
+    data = serialize_message(message)
+
+    def mutate(page):
+        for i, item in enumerate(page):
+            if item["id"] == message_id:
+                data["reply_count"] = item.get("reply_count") or 0
+                page[i] = data
+                return page
+        return None
+
+    await _update_page(message.channel_id, mutate)
+
+
+async def invalidate(channel_id) -> None:
+    if _redis is None:
+        return
+    try:
+        await _redis.incr(_version_key(channel_id))
+        await _redis.delete(_page_key(channel_id))
+    except RedisError:
+        stats["errors"] += 1
@@ -0,0 +1,296 @@
+import asyncio
+import bisect
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import logs
+
+log = logs.get_logger("metrics")
+
+# Minimal Prometheus-style registry. Hot-path updates are plain dict/list
+# increments in this process; each worker periodically publishes a snapshot
+# to Redis and GET /metrics merges the snapshots of all live workers. Counters
+# and histograms are exported per worker (a "worker" label): a worker's series
+# just ends when it exits, where a sum across the live ones would go backwards
+# and read as a counter reset. Gauges are summed.
+# Label values must come from bounded sets (route templates, event types).
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 5))
+# /metrics needs "Authorization: Bearer <METRICS_TOKEN>"; without a token it is
+# off (404) unless METRICS_PUBLIC=true (e.g. only reachable on a private network)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_REDIS_PREFIX = "metrics:worker:"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_registry: Dict[str, "_Metric"] = {}
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Optional callback computing the values at snapshot time instead
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], object] = {}
+        _registry[name] = self
+
+    def snapshot(self) -> dict:
+        if self.callback is not None:
+            self._values = dict(self.callback())
+        return {
+            "type": self.type,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "values": [[list(labels), value] for labels, value in self._values.items()],
+        }
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            # [per-bucket counts (+Inf last), sum, count]
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+# --- Metric definitions -----------------------------------------------------
+
+HTTP_REQUESTS = Counter("diligental_http_requests_total", "HTTP requests", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("diligental_http_request_seconds", "HTTP request latency", ("method", "route"))
+
+WS_EVENT_LATENCY = Histogram("diligental_ws_event_seconds", "WebSocket frame handling time", ("event",))
+BROADCAST_LATENCY = Histogram("diligental_broadcast_seconds", "Fan-out time for one broadcast", ("kind",))
+BROADCAST_RECIPIENTS = Histogram("diligental_broadcast_recipients", "Sockets reached per broadcast (sockets per channel)", ("kind",), buckets=FANOUT_BUCKETS)
+MESSAGES_CREATED = Counter("diligental_messages_created_total", "Messages persisted", ("source",))
+
+EVENT_LOOP_LAG = Histogram("diligental_event_loop_lag_seconds", "Delay of a periodic event-loop probe beyond its schedule")
+EVENT_LOOP_STALLS = Counter("diligental_event_loop_stalls_total", "Event-loop stalls reported by the stall detector")
+JOBS = Counter("diligental_jobs_total", "Background jobs by outcome (enqueued, done, failed, dead)", ("job", "event"))
+JOB_SECONDS = Histogram("diligental_job_seconds", "Run time of successful background jobs", ("job",))
+DB_POOL_WAIT = Histogram("diligental_db_pool_checkout_wait_seconds", "Time spent waiting to check out a DB connection")
+SQL_COMPILED_CACHE = Counter("diligental_sql_compiled_cache_total", "Statements by SQLAlchemy compiled-cache outcome (hit, miss, uncacheable, disabled)", ("result",))
+SQL_PREPARED_STATEMENTS = Counter("diligental_sql_prepared_statements_total", "Postgres statements by prepared-statement cache outcome (hit, miss)", ("result",))
+
+
+def _pool_status():
+    from database import engine
+
+    pool = engine.sync_engine.pool
+    checked_out = getattr(pool, "checkedout", None)
+    return {("checked_out",): checked_out()} if checked_out else {}
+
+
+def _message_cache_stats():
+    import message_cache
+
+    return {(key,): value for key, value in message_cache.stats.items()}
+
+
+def _jobs_local_queued():
+    import jobs
+
+    return {(): jobs._local_queue.qsize()}
+
+
+def _ws_connections():
+    from ws_manager import manager
+
+    return {
+        ("channel",): sum(len(sockets) for sockets in manager.active_connections.values()),
+        ("notifications",): sum(len(sockets) for sockets in manager.user_connections.values()),
+    }
+
+
+def _ws_active_channels():
+    from ws_manager import manager
+
+    return {(): len(manager.active_connections)}
+
+
+# Callback metrics are computed at snapshot time, so the hot path pays nothing
+WS_CONNECTIONS = Gauge("diligental_ws_connections", "Open WebSockets", ("kind",), callback=_ws_connections)
+WS_ACTIVE_CHANNELS = Gauge("diligental_ws_active_channels", "Channels with at least one open WebSocket", callback=_ws_active_channels)
+DB_POOL_CONNECTIONS = Gauge("diligental_db_pool_connections", "DB pool connections", ("state",), callback=_pool_status)
+JOBS_LOCAL_QUEUED = Gauge("diligental_jobs_local_queued", "Jobs waiting in this process's in-process queue", callback=_jobs_local_queued)
+MESSAGE_CACHE_EVENTS = Counter("diligental_message_cache_events_total", "First-page message cache events (hits, misses, fills, ...)", ("event",), callback=_message_cache_stats)
+
+
+# --- HTTP middleware ----------------------------------------------------------
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count and latency per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = ["5xx"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = f"{message['status'] // 100}xx"
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], path)
+            HTTP_REQUESTS.inc(scope["method"], path, status[0])
+
+
+# --- Background tasks -------------------------------------------------------
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(time.perf_counter() - start - interval, 0.0))
+
+
+def snapshot() -> dict:
+    return {name: metric.snapshot() for name, metric in _registry.items()}
+
+
+async def publish(redis_client) -> None:
+    """Push this worker's snapshot to Redis every METRICS_PUSH_INTERVAL seconds"""
+    key = f"{_REDIS_PREFIX}{WORKER_ID}"
+    ttl = max(int(METRICS_PUSH_INTERVAL * 3), 5)
+    while True:
+        try:
+            await redis_client.set(key, json.dumps(snapshot()), ex=ttl)
+        except Exception as e:
+            log.warning("metrics_publish_failed", error=str(e))
+        await asyncio.sleep(METRICS_PUSH_INTERVAL)
+
+
+async def collect(redis_client) -> Dict[str, dict]:
+    """Snapshots from every live worker by worker id, with this worker's taken fresh"""
+    snapshots = {WORKER_ID: snapshot()}
+    try:
+        async for key in redis_client.scan_iter(match=f"{_REDIS_PREFIX}*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            worker = key[len(_REDIS_PREFIX):]
+            if worker == WORKER_ID:
+                continue
+            raw = await redis_client.get(key)
+            if raw:
+                snapshots[worker] = json.loads(raw)
+    except Exception as e:
+        log.warning("metrics_collect_failed", error=str(e))
+    return snapshots
+
+
+# --- Exposition -------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(snapshots: Dict[str, dict]) -> str:
+    """Merge worker snapshots (see the module comment) into Prometheus text exposition"""
+    lines = []
+    for name, metric in _registry.items():
+        per_worker = metric.type != "gauge"
+        labelnames = metric.labelnames + ("worker",) if per_worker else metric.labelnames
+        merged: Dict[tuple, object] = {}
+        for worker, snap in snapshots.items():
+            data = snap.get(name)
+            if not data:
+                continue
+            for labels, value in data["values"]:
+                key = tuple(labels) + (worker,) if per_worker else tuple(labels)
+                if metric.type == "histogram":
+                    state = merged.setdefault(key, [[0] * (len(metric.buckets) + 1), 0.0, 0])
+                    if len(value[0]) != len(state[0]):
+                        continue # Worker running with different buckets (mid-deploy)
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, value in sorted(merged.items()):
+            if metric.type == "histogram":
+                cumulative = 0
+                for bound, count in zip(list(metric.buckets) + [float("inf")], value[0]):
+                    cumulative += count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{name}_bucket{_labels(labelnames, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, labels)} {_format_number(value[1])}")
+                lines.append(f"{name}_count{_labels(labelnames, labels)} {value[2]}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, labels)} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+"""Versioned schema migrations.
+
+Each migration is a module in this package named vNNNN_<slug>.py with a
+docstring (its description) and an ``async def upgrade(conn)``. Modules
+that set ``TRANSACTIONAL = False`` run on an autocommit connection, which
+is what Postgres needs for CREATE INDEX CONCURRENTLY; use create_index()
+there. Applied versions are recorded in the schema_version table.
+
+Each migration defines the DDL it applies (Core tables, columns and
+indexes in the module itself), never reading the current models, so a
+fresh database goes through the same history as an upgraded one. A
+released migration is never edited; changes go in a new one. v0001 is the
+schema the app created before migrations existed, and steps stay
+idempotent (IF NOT EXISTS, checkfirst) for databases that predate them.
+
+The app only checks the version at startup (check()); upgrades run out of
+band with ``python -m migrations upgrade``.
+"""
+import importlib
+import pkgutil
+import re
+from contextlib import asynccontextmanager
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex, Index
+
+import logs
+
+log = logs.get_logger("migrations")
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+_ADVISORY_LOCK_ID = 0x6D696772
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    description: str
+    upgrade: Callable
+    transactional: bool
+
+
+class SchemaOutOfDate(Exception):
+    """The database is behind the migrations shipped with this code"""
+
+
+def discover() -> List[Migration]:
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = re.match(r"v(\d+)_", module_info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(Migration(
+            int(match.group(1)), module_info.name, (module.__doc__ or "").strip().splitlines()[0],
+            module.upgrade, getattr(module, "TRANSACTIONAL", True),
+        ))
+    migrations.sort(key=lambda m: m.version)
+    return migrations
+
+
+async def applied_versions(conn) -> List[int]:
+    if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(schema_version.name)):
+        return []
+    return list((await conn.execute(select(schema_version.c.version).order_by(schema_version.c.version))).scalars())
+
+
+async def create_index(conn, index: Index) -> None:
+    """Build an index without blocking writes (CONCURRENTLY on Postgres).
+
+    Must run on an autocommit connection (TRANSACTIONAL = False).
+    """
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if conn.dialect.name == "postgresql":
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+        invalid = (await conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": index.name})).scalar()
+        if invalid:
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+        ddl = re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", ddl)
+    log.info("migration_create_index", index=index.name, table=index.table.name)
+    await conn.execute(text(ddl))
+
+
+async def drop_index(conn, name: str) -> None:
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    await conn.execute(text(f'DROP INDEX {concurrently}IF EXISTS "{name}"'))
+
+
+async def _record(conn, migration: Migration) -> None:
+    await conn.execute(schema_version.insert().values(version=migration.version, description=migration.description))
+
+
+@asynccontextmanager
+async def _upgrade_lock(engine):
+    """Serializes concurrent `upgrade` runs (e.g. several containers starting) on Postgres"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+        try:
+            yield
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _ADVISORY_LOCK_ID})
+
+
+async def upgrade(engine, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to target (default: latest); returns the versions applied"""
+    applied = []
+    async with _upgrade_lock(engine):
+        async with engine.begin() as conn:
+            await conn.run_sync(schema_version.create, checkfirst=True)
+            done = set(await applied_versions(conn))
+
+        for migration in discover():
+            if migration.version in done or (target is not None and migration.version > target):
+                continue
+            log.info("migration_start", version=migration.version, name=migration.name)
+            if migration.transactional:
+                async with engine.begin() as conn:
+                    await migration.upgrade(conn)
+                    await _record(conn, migration)
+            else:
+                async with engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await migration.upgrade(conn)
+                    await _record(conn, migration)
+            applied.append(migration.version)
+            log.info("migration_done", version=migration.version, name=migration.name)
+    return applied
+
+
+async def check(engine) -> int:
+    """Startup gate: raise SchemaOutOfDate if migrations are pending; returns the current version"""
+    async with engine.connect() as conn:
+        done = set(await applied_versions(conn))
+    pending = [m.version for m in discover() if m.version not in done]
+    if pending:
+        raise SchemaOutOfDate(
+            f"Database schema is missing migrations {pending}; run: python -m migrations upgrade"
+        )
+    return max(done, default=0)
+
+
+async def reset(engine) -> None:
+    """Drop every model table and the version table (development and benchmarks only)"""
+    from database import Base
+    import models  # noqa: F401  (registers the tables)
+
+    async with engine.begin() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            # DROP TABLE deletes row by row with FK checks; skip them
+            await conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(schema_version.drop, checkfirst=True)
+        if sqlite:
+            await conn.exec_driver_sql("PRAGMA foreign_keys=ON")
@@ -0,0 +1,63 @@
+"""Schema migration CLI (run from backend/ with the app's DATABASE_URL).
+
+    python -m migrations status
+    python -m migrations upgrade [--to N]
+    python -m migrations check      # exit 1 if migrations are pending
+"""
+import argparse
+import asyncio
+import sys
+
+import database
+import migrations
+
+
+async def status() -> int:
+    async with database.engine.connect() as conn:
+        done = set(await migrations.applied_versions(conn))
+    for migration in migrations.discover():
+        mark = "applied" if migration.version in done else "pending"
+        print(f"  {migration.version:04d}  {mark:<8} {migration.name}: {migration.description}")
+    return 0
+
+
+async def upgrade(target) -> int:
+    applied = await migrations.upgrade(database.engine, target)
+    print(f"Applied {applied}" if applied else "Already up to date")
+    return 0
+
+
+async def check() -> int:
+    try:
+        version = await migrations.check(database.engine)
+    except migrations.SchemaOutOfDate as e:
+        print(e)
+        return 1
+    print(f"Schema at version {version}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    upgrade_parser = sub.add_parser("upgrade")
+    upgrade_parser.add_argument("--to", type=int, help="stop at this version")
+    sub.add_parser("check")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            if args.command == "status":
+                return await status()
+            if args.command == "upgrade":
+                return await upgrade(args.to)
+            return await check()
+        finally:
+            await database.dispose()
+
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Initial schema and the default admin user"""
+import uuid
+
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, Uuid, func, select
+
+from security import get_password_hash
+
+# The schema the app created at startup before versioned migrations, so
+# existing databases see no difference. Frozen: schema changes go in a new
+# migration, never here.
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("username", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("full_name", String, nullable=True),
+    Column("role", String),
+    Column("tailnet_ip", String, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "workspaces", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("owner_id", Uuid, ForeignKey("users.id")),
+    Column("invite_code", String, unique=True, index=True),
+)
+
+Table(
+    "workspace_members", metadata,
+    Column("workspace_id", Uuid, ForeignKey("workspaces.id"), primary_key=True),
+    Column("user_id", Uuid, ForeignKey("users.id"), primary_key=True),
+    Column("role", String),
+    Column("joined_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "channels", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("name", String, index=True, nullable=False),
+    Column("description", String, nullable=True),
+    Column("type", String),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("owner_id", Uuid, ForeignKey("users.id")),
+    Column("workspace_id", Uuid, ForeignKey("workspaces.id"), nullable=False),
+)
+
+Table(
+    "channel_members", metadata,
+    Column("channel_id", Uuid, ForeignKey("channels.id"), primary_key=True),
+    Column("user_id", Uuid, ForeignKey("users.id"), primary_key=True),
+    Column("joined_at", DateTime(timezone=True), server_default=func.now()),
+    Column("last_read_at", DateTime(timezone=True), nullable=True),
+)
+
+Table(
+    "messages", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("channel_id", Uuid, ForeignKey("channels.id"), nullable=False),
+    Column("user_id", Uuid, ForeignKey("users.id"), nullable=False),
+    Column("parent_id", Uuid, ForeignKey("messages.id"), nullable=True),
+)
+
+Table(
+    "message_mentions", metadata,
+    Column("message_id", Uuid, ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True),
+    Column("user_id", Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+)
+
+Table(
+    "attachments", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("message_id", Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=True),
+    Column("user_id", Uuid, ForeignKey("users.id"), nullable=False),
+    Column("filename", String, nullable=False),
+    Column("file_path", String, nullable=False),
+    Column("file_type", String, nullable=False),
+    Column("file_size", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+Table(
+    "notifications", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("user_id", Uuid, ForeignKey("users.id"), nullable=False, index=True),
+    Column("content", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("is_read", Boolean),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("related_id", Uuid, nullable=True),
+)
+
+Table(
+    "reactions", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("message_id", Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("user_id", Uuid, ForeignKey("users.id"), nullable=False, index=True),
+    Column("emoji", String(10), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+async def upgrade(conn):
+    await conn.run_sync(metadata.create_all)
+
+    if (await conn.execute(select(users.c.id).filter(users.c.username == "admin"))).first() is None:
+        await conn.execute(users.insert().values(
+            id=uuid.uuid4(),
+            email="admin@example.com",
+            username="admin",
+            hashed_password=get_password_hash("admin123"),
+            full_name="System Admin",
+            role="admin",
+        ))
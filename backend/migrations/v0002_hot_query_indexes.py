@@ -0,0 +1,35 @@
+"""Indexes for channel history, threads, notifications and mentions"""
+from sqlalchemy import Boolean, Column, DateTime, Index, MetaData, Table, Uuid, text
+
+from migrations import create_index, drop_index
+
+# Built concurrently on Postgres, so writes continue during the build
+TRANSACTIONAL = False
+
+# The columns indexed here, as of this revision (the tables exist already)
+metadata = MetaData()
+messages = Table(
+    "messages", metadata,
+    Column("channel_id", Uuid), Column("parent_id", Uuid), Column("created_at", DateTime(timezone=True)),
+)
+notifications = Table(
+    "notifications", metadata,
+    Column("user_id", Uuid), Column("is_read", Boolean), Column("created_at", DateTime(timezone=True)),
+)
+message_mentions = Table("message_mentions", metadata, Column("message_id", Uuid), Column("user_id", Uuid))
+
+INDEXES = [
+    Index("ix_messages_channel_id_created_at", messages.c.channel_id, messages.c.created_at),
+    Index("ix_messages_parent_id_created_at", messages.c.parent_id, messages.c.created_at),
+    Index("ix_notifications_user_id_created_at", notifications.c.user_id, notifications.c.created_at),
+    Index("ix_notifications_user_unread", notifications.c.user_id, notifications.c.created_at,
+          postgresql_where=text("NOT is_read"), sqlite_where=text("NOT is_read")),
+    Index("ix_message_mentions_user_id_message_id", message_mentions.c.user_id, message_mentions.c.message_id),
+]
+
+
+async def upgrade(conn):
+    for index in INDEXES:
+        await create_index(conn, index)
+    # Superseded by ix_notifications_user_id_created_at (same leading column)
+    await drop_index(conn, "ix_notifications_user_id")
@@ -0,0 +1,58 @@
+"""Mention timestamps and a user-first index for the mentions inbox"""
+from sqlalchemy import Column, DateTime, Index, MetaData, Table, Uuid, inspect, text
+
+from migrations import create_index, drop_index
+
+TRANSACTIONAL = False
+
+message_mentions = Table(
+    "message_mentions", MetaData(),
+    Column("message_id", Uuid), Column("user_id", Uuid), Column("created_at", DateTime(timezone=True)),
+)
+# Newest-first mentions per user, off the index alone
+INDEX = Index(
+    "ix_message_mentions_user_id_created_at",
+    message_mentions.c.user_id, message_mentions.c.created_at, message_mentions.c.message_id,
+)
+
+BACKFILL_BATCH = 5000
+
+
+async def upgrade(conn):
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("message_mentions"))
+    if "created_at" not in {column["name"] for column in columns}:
+        column_type = DateTime(timezone=True).compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE message_mentions ADD COLUMN created_at {column_type}"))
+
+    # Walks the primary key in ranges of BACKFILL_BATCH rows: each batch is an
+    # index range scan, and no single statement locks the whole table
+    after = None
+    while True:
+        params = {"skip": BACKFILL_BATCH - 1}
+        if after is not None:
+            params.update(after_message=after[0], after_user=after[1])
+        past_last = "WHERE (message_id, user_id) > (:after_message, :after_user) " if after is not None else ""
+        upto = (await conn.execute(text(
+            f"SELECT message_id, user_id FROM message_mentions {past_last}"
+            "ORDER BY message_id, user_id LIMIT 1 OFFSET :skip"
+        ), params)).first()
+
+        conditions = ["created_at IS NULL"]
+        if after is not None:
+            conditions.append("(message_id, user_id) > (:after_message, :after_user)")
+        if upto is not None:
+            conditions.append("(message_id, user_id) <= (:upto_message, :upto_user)")
+            params.update(upto_message=upto[0], upto_user=upto[1])
+        await conn.execute(text(
+            "UPDATE message_mentions SET created_at = COALESCE("
+            "(SELECT created_at FROM messages WHERE messages.id = message_mentions.message_id), "
+            "CURRENT_TIMESTAMP) "
+            f"WHERE {' AND '.join(conditions)}"
+        ), params)
+        if upto is None:
+            break
+        after = upto
+
+    await create_index(conn, INDEX)
+    # Built by v0002; the new index leads with user_id too
+    await drop_index(conn, "ix_message_mentions_user_id_message_id")
@@ -0,0 +1,29 @@
+"""Broadcast (@channel/@here) mentions and their per-user read state"""
+from sqlalchemy import Column, DateTime, ForeignKey, Index, MetaData, String, Table, Uuid, func
+
+metadata = MetaData()
+# Referenced by the foreign keys below; not created here
+for name in ("users", "channels", "messages"):
+    Table(name, metadata, Column("id", Uuid, primary_key=True))
+
+broadcast_mentions = Table(
+    "broadcast_mentions", metadata,
+    Column("id", Uuid, primary_key=True),
+    Column("message_id", Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, unique=True),
+    Column("channel_id", Uuid, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False),
+    Column("user_id", Uuid, ForeignKey("users.id"), nullable=False),
+    Column("kind", String, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_broadcast_mentions_channel_id_created_at", "channel_id", "created_at"),
+)
+
+broadcast_mention_reads = Table(
+    "broadcast_mention_reads", metadata,
+    Column("user_id", Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("broadcast_id", Uuid, ForeignKey("broadcast_mentions.id", ondelete="CASCADE"), primary_key=True),
+    Column("read_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+async def upgrade(conn):
+    await conn.run_sync(metadata.create_all, tables=[broadcast_mentions, broadcast_mention_reads])
@@ -0,0 +1,29 @@
+"""Soft-delete markers on users, workspaces and channels, and the deletions table"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, Uuid, func, inspect, text
+
+SOFT_DELETABLE = ("users", "workspaces", "channels")
+
+deletions = Table(
+    "deletions", MetaData(),
+    Column("id", Uuid, primary_key=True),
+    Column("kind", String, nullable=False),
+    Column("target_id", Uuid, nullable=False),
+    Column("requested_by", Uuid, nullable=True),
+    Column("status", String, nullable=False),
+    Column("stage", String, nullable=True),
+    Column("rows_total", Integer, nullable=True),
+    Column("rows_deleted", Integer, nullable=False),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+
+async def upgrade(conn):
+    # Nullable, no default: a metadata-only change on Postgres
+    column_type = DateTime(timezone=True).compile(dialect=conn.dialect)
+    for table in SOFT_DELETABLE:
+        columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns(table))
+        if "deleted_at" not in {column["name"] for column in columns}:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN deleted_at {column_type}"))
+    await conn.run_sync(deletions.create, checkfirst=True)
@@ -0,0 +1,20 @@
+"""Checkpoints of Slack export imports"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Uuid, func
+
+imports = Table(
+    "imports", MetaData(),
+    Column("id", Uuid, primary_key=True),
+    Column("source", String, nullable=False),
+    Column("workspace_id", Uuid, nullable=False),
+    Column("status", String, nullable=False),
+    Column("files_done", Integer, nullable=False),
+    Column("messages", Integer, nullable=False),
+    Column("reactions", Integer, nullable=False),
+    Column("mentions", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+
+async def upgrade(conn):
+    await conn.run_sync(imports.create, checkfirst=True)
@@ -0,0 +1,20 @@
+"""Change log for delta sync"""
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Index, Integer, MetaData, String, Table, Uuid, func
+
+changes = Table(
+    "changes", MetaData(),
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("kind", String, nullable=False),
+    Column("entity_id", Uuid, nullable=False),
+    Column("workspace_id", Uuid, nullable=True),
+    Column("channel_id", Uuid, nullable=True),
+    Column("user_id", Uuid, nullable=True),
+    Column("deleted", Boolean, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_changes_workspace_id_id", "workspace_id", "id"),
+    Index("ix_changes_user_id_id", "user_id", "id"),
+)
+
+
+async def upgrade(conn):
+    await conn.run_sync(changes.create, checkfirst=True)
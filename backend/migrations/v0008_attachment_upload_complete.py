@@ -0,0 +1,11 @@
+"""Upload-confirmed flag on attachments"""
+from sqlalchemy import Boolean, inspect, text
+
+
+async def upgrade(conn):
+    # Existing rows were proxied uploads or already posted. A constant default
+    # is a metadata-only change on Postgres 11+.
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("attachments"))
+    if "upload_complete" not in {column["name"] for column in columns}:
+        column_type = Boolean().compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE attachments ADD COLUMN upload_complete {column_type} NOT NULL DEFAULT true"))
@@ -0,0 +1,10 @@
+"""Last-progress time on deletions, so stalled ones can be requeued"""
+from sqlalchemy import DateTime, inspect, text
+
+
+async def upgrade(conn):
+    # Nullable, no default: a metadata-only change on Postgres
+    columns = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns("deletions"))
+    if "updated_at" not in {column["name"] for column in columns}:
+        column_type = DateTime(timezone=True).compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE deletions ADD COLUMN updated_at {column_type}"))
@@ -1,24 +1,29 @@
 import enum
 import secrets
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Enum, Text, Table
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Index, Integer, String, DateTime, Enum, Text, Table, Uuid, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
+import storage
+import thumbnails
 import uuid
-from sqlalchemy.dialects.postgresql import UUID
 
 # Association table for message mentions (many-to-many)
 message_mentions = Table(
     'message_mentions',
     Base.metadata,
-    Column('message_id', UUID(as_uuid=True), ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True),
-    Column('user_id', UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    Column('message_id', Uuid, ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True),
+    Column('user_id', Uuid, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    # Copy of the message's created_at, so a user's mentions read newest-first off one index
+    Column('created_at', DateTime(timezone=True), nullable=True),
+    # The primary key leads with message_id; "messages mentioning me" needs user first
+    Index('ix_message_mentions_user_id_created_at', 'user_id', 'created_at', 'message_id')
 )
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True, nullable=False)
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
@@ -26,6 +31,7 @@ class User(Base):
     role = Column(String, default="user") # 'admin' or 'user'
     tailnet_ip = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    deleted_at = Column(DateTime(timezone=True), nullable=True) # Set while a Deletion removes the user's data
 
     messages = relationship("Message", back_populates="user")
     channels = relationship("Channel", back_populates="owner")
@@ -38,11 +44,12 @@ class User(Base):
 class Workspace(Base):
     __tablename__ = "workspaces"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    owner_id = Column(Uuid, ForeignKey("users.id"))
     invite_code = Column(String, unique=True, index=True, default=lambda: secrets.token_urlsafe(6))
+    deleted_at = Column(DateTime(timezone=True), nullable=True) # Set while a Deletion removes it
 
     owner = relationship("User", back_populates="owned_workspaces")
     members = relationship("WorkspaceMember", back_populates="workspace", cascade="all, delete-orphan")
@@ -51,8 +58,8 @@ class Workspace(Base):
 class WorkspaceMember(Base):
     __tablename__ = "workspace_members"
 
-    workspace_id = Column(UUID(as_uuid=True), ForeignKey("workspaces.id"), primary_key=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    workspace_id = Column(Uuid, ForeignKey("workspaces.id"), primary_key=True)
+    user_id = Column(Uuid, ForeignKey("users.id"), primary_key=True)
     role = Column(String, default="member") # 'admin', 'member'
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -62,8 +69,8 @@ class WorkspaceMember(Base):
 class ChannelMember(Base):
     __tablename__ = "channel_members"
 
-    channel_id = Column(UUID(as_uuid=True), ForeignKey("channels.id"), primary_key=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    channel_id = Column(Uuid, ForeignKey("channels.id"), primary_key=True)
+    user_id = Column(Uuid, ForeignKey("users.id"), primary_key=True)
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
     last_read_at = Column(DateTime(timezone=True), nullable=True)
 
@@ -73,13 +80,14 @@ class ChannelMember(Base):
 class Channel(Base):
     __tablename__ = "channels"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
     type = Column(String, default="public") # 'public', 'private', 'dm', 'voice'
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
-    workspace_id = Column(UUID(as_uuid=True), ForeignKey("workspaces.id"), nullable=False)
+    owner_id = Column(Uuid, ForeignKey("users.id"))
+    workspace_id = Column(Uuid, ForeignKey("workspaces.id"), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=True) # Set while a Deletion removes it
 
     owner = relationship("User", back_populates="channels")
     workspace = relationship("Workspace", back_populates="channels")
@@ -88,14 +96,19 @@ class Channel(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    # Channel history and thread replies are both read in created_at order
+    __table_args__ = (
+        Index("ix_messages_channel_id_created_at", "channel_id", "created_at"),
+        Index("ix_messages_parent_id_created_at", "parent_id", "created_at"),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    channel_id = Column(UUID(as_uuid=True), ForeignKey("channels.id"), nullable=False)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
-    parent_id = Column(UUID(as_uuid=True), ForeignKey("messages.id"), nullable=True) # For threading
+    channel_id = Column(Uuid, ForeignKey("channels.id"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
+    parent_id = Column(Uuid, ForeignKey("messages.id"), nullable=True) # For threading
 
     channel = relationship("Channel", back_populates="messages")
     user = relationship("User", back_populates="messages")
@@ -108,37 +121,137 @@ class Message(Base):
 class Attachment(Base):
     __tablename__ = "attachments"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="CASCADE"), nullable=True) # Can be null initially if uploaded before message sent
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    message_id = Column(Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=True) # Can be null initially if uploaded before message sent
+    user_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
     filename = Column(String, nullable=False)
-    file_path = Column(String, nullable=False) # Local path or S3 key
+    file_path = Column(String, nullable=False) # "/static/<key>" on local disk, bare key in object storage (see storage.resolve)
     file_type = Column(String, nullable=False) # MIME type
     file_size = Column(Integer, nullable=False) # Bytes
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    upload_complete = Column(Boolean, nullable=False, server_default=text("true")) # False from POST /uploads until /complete finds the blob
 
     message = relationship("Message", back_populates="attachments")
     user = relationship("User")
 
+    @property
+    def url(self):
+        # Signed, immutable-cached download route (routes/files.py)
+        return storage.attachment_url(self.id)
+
+    @property
+    def thumbnail_url(self):
+        if not thumbnails.is_supported(self.file_type):
+            return None
+        return storage.attachment_url(self.id, "thumb")
+
+    @property
+    def preview_url(self):
+        if not thumbnails.is_supported(self.file_type):
+            return None
+        return storage.attachment_url(self.id, "preview")
+
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_id_created_at", "user_id", "created_at"),
+        Index("ix_notifications_user_unread", "user_id", "created_at",
+              postgresql_where=text("NOT is_read"), sqlite_where=text("NOT is_read")),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, ForeignKey("users.id"), nullable=False)
     content = Column(String, nullable=False)
     type = Column(String, nullable=False) # 'mention', 'reply', 'system'
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    related_id = Column(UUID(as_uuid=True), nullable=True) # e.g. message_id
+    related_id = Column(Uuid, nullable=True) # e.g. message_id
 
     user = relationship("User", back_populates="notifications")
 
+class BroadcastMention(Base):
+    """An @channel/@here in a message, stored once for the whole channel. Members
+    see it as a notification computed at read time (crud.get_notifications)."""
+    __tablename__ = "broadcast_mentions"
+    __table_args__ = (
+        Index("ix_broadcast_mentions_channel_id_created_at", "channel_id", "created_at"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    message_id = Column(Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, unique=True)
+    channel_id = Column(Uuid, ForeignKey("channels.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.id"), nullable=False) # Sender
+    kind = Column(String, nullable=False) # 'channel' (everyone) or 'here' (online members, push only)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class BroadcastMentionRead(Base):
+    """Per-user read state of broadcast mentions (absent = unread)"""
+    __tablename__ = "broadcast_mention_reads"
+
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    broadcast_id = Column(Uuid, ForeignKey("broadcast_mentions.id", ondelete="CASCADE"), primary_key=True)
+    read_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Deletion(Base):
+    """A channel, user or workspace being removed in the background (deletions.py).
+    The target is hidden (deleted_at) when this is created and gone when it's done."""
+    __tablename__ = "deletions"
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    kind = Column(String, nullable=False) # 'channel', 'user', 'workspace'
+    target_id = Column(Uuid, nullable=False)
+    requested_by = Column(Uuid, nullable=True) # No FK: the requester may be deleted later
+    status = Column(String, nullable=False, default="pending") # 'pending', 'running', 'done'
+    stage = Column(String, nullable=True) # Table being cleared
+    rows_total = Column(Integer, nullable=True) # Counted when the job starts
+    rows_deleted = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True) # Last failed attempt (the job is retried)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=True) # Last progress (or requeue); see deletions.resume
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class Import(Base):
+    """A Slack export being loaded into a workspace (slack_import.py). Rows carry
+    ids derived from the Slack ones, so a rerun after a crash continues from
+    files_done without duplicating anything."""
+    __tablename__ = "imports"
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    source = Column(String, nullable=False) # Absolute path of the archive
+    workspace_id = Column(Uuid, nullable=False) # No FK: the record outlives a deleted workspace
+    status = Column(String, nullable=False, default="running") # 'running', 'done'
+    files_done = Column(Integer, nullable=False, default=0) # Channel day files committed, in archive order
+    messages = Column(Integer, nullable=False, default=0)
+    reactions = Column(Integer, nullable=False, default=0)
+    mentions = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class Change(Base):
+    """A write a connected client would otherwise refetch for, logged for delta
+    sync (changes.py). The id is the clients' cursor; the row only says what
+    changed, GET /sync reads its current state."""
+    __tablename__ = "changes"
+    __table_args__ = (
+        Index("ix_changes_workspace_id_id", "workspace_id", "id"),
+        Index("ix_changes_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False) # 'channel', 'channel_member', 'message', 'reaction', 'notification'
+    entity_id = Column(Uuid, nullable=False) # The channel, message (also for reactions) or notification
+    workspace_id = Column(Uuid, nullable=True) # Null: only user_id's concern (read markers, own notifications)
+    channel_id = Column(Uuid, nullable=True)
+    user_id = Column(Uuid, nullable=True) # The member or notification recipient
+    deleted = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Reaction(Base):
     __tablename__ = "reactions"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    message_id = Column(UUID(as_uuid=True), ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    message_id = Column(Uuid, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Uuid, ForeignKey("users.id"), nullable=False, index=True)
     emoji = Column(String(10), nullable=False)  # Store emoji character or shortcode
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -0,0 +1,45 @@
+import uuid
+from typing import Iterable
+
+from sqlalchemy import select
+
+import database
+import jobs
+import models
+from ws_manager import manager
+
+# Post-commit push of notification rows (mentions, replies) to the recipients'
+# notification sockets, run on the job queue instead of in the sender's request.
+
+
+async def enqueue(notifications: Iterable[models.Notification]) -> None:
+    """Queue the push of committed notifications"""
+    recipients = [[notif.id, notif.user_id] for notif in notifications]
+    if recipients:
+        await jobs.enqueue("notifications.push", {"recipients": recipients})
+
+
+@jobs.job("notifications.push", local=True)
+async def push(payload: dict) -> None:
+    # Only load the rows of recipients with a socket open on this worker
+    ids = [uuid.UUID(notification_id) for notification_id, user_id in payload["recipients"]
+           if user_id in manager.user_connections]
+    if not ids:
+        return
+    async with database.async_session_maker() as db:
+        result = await db.execute(select(models.Notification).filter(models.Notification.id.in_(ids)))
+        notifications = result.scalars().all()
+    for notif in notifications:
+        # Matches the frontend Notification interface
+        await manager.send_personal_message({
+            "type": "notification",
+            "data": {
+                "id": notif.id,
+                "user_id": notif.user_id,
+                "content": notif.content,
+                "type": notif.type,
+                "is_read": notif.is_read,
+                "created_at": notif.created_at,
+                "related_id": notif.related_id
+            }
+        }, str(notif.user_id))
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+import logs
+import metrics
+
+log = logs.get_logger("profiler")
+
+# Sampling profiler: a background thread snapshots the event-loop thread's
+# stack every PROFILE_INTERVAL_MS via sys._current_frames() and counts
+# collapsed stacks, so the loop itself runs uninstrumented.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", 120))
+
+# Stall detector: a watchdog thread logs the loop thread's stack whenever the
+# loop hasn't run its heartbeat for LOOP_STALL_THRESHOLD_MS.
+LOOP_STALL_DETECTOR = os.getenv("LOOP_STALL_DETECTOR", "true").lower() == "true"
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", 250))
+_HEARTBEAT_INTERVAL = 0.05
+
+_profile_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """Another profile is already running in this worker"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _sample_loop(thread_ids, interval: float, deadline: float, samples: Counter) -> None:
+    own_id = threading.get_ident()
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        for thread_id in thread_ids or frames.keys():
+            frame = frames.get(thread_id)
+            if frame is not None and thread_id != own_id:
+                samples[_collapse(frame)] += 1
+        time.sleep(interval)
+
+
+async def profile(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS, all_threads: bool = False) -> Dict:
+    """Sample this worker for `seconds`; returns collapsed stacks -> sample count"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileBusy()
+    try:
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval_ms, 1) / 1000
+        thread_ids = None if all_threads else [threading.get_ident()]
+        samples: Counter = Counter()
+        start = time.monotonic()
+        sampler = threading.Thread(
+            target=_sample_loop, args=(thread_ids, interval, start + seconds, samples),
+            name="profiler", daemon=True
+        )
+        sampler.start()
+        # The sampler thread sleeps between snapshots, so wait without blocking the loop
+        await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+        return {
+            "duration": round(time.monotonic() - start, 3),
+            "interval_ms": interval * 1000,
+            "samples": sum(samples.values()),
+            "stacks": samples,
+        }
+    finally:
+        _profile_lock.release()
+
+
+def to_collapsed(stacks: Dict[str, int]) -> str:
+    """Brendan Gregg's folded format (flamegraph.pl, speedscope, inferno)"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+
+class StallDetector:
+    """Watchdog thread that logs the blocking stack when the event loop stops turning"""
+
+    def __init__(self, threshold_ms: float = LOOP_STALL_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self._last_beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(_HEARTBEAT_INTERVAL)
+
+    def _watch(self) -> None:
+        stalled_since = None
+        while not self._stop.wait(self.threshold / 4):
+            blocked = time.monotonic() - self._last_beat
+            if blocked < self.threshold + _HEARTBEAT_INTERVAL:
+                if stalled_since is not None:
+                    log.warning("loop_stall_ended", ms=round((time.monotonic() - stalled_since) * 1000))
+                    stalled_since = None
+                continue
+            if stalled_since is not None:
+                continue # Already reported this stall
+            stalled_since = self._last_beat
+            metrics.EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>\n"
+            log.warning("loop_stall", ms=round(blocked * 1000), stack=stack)
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-stall-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+stall_detector = StallDetector()
@@ -0,0 +1,244 @@
+import functools
+import uuid
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Select, bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# Read models for the hot read paths (history, threads, mentions, channel and
+# member lists): __slots__ records filled from Core selects instead of ORM
+# instances, which carry attribute instrumentation and identity-map
+# bookkeeping per row for data that is only serialized and dropped. Field
+# names match the ORM attributes, so the response schemas and fastjson.dump()
+# read either. Writes, and anything that writes back, keep using models.
+_IN_CHUNK = 500  # Ids per IN (...) when loading children, as selectinload does
+
+
+@dataclass(slots=True)
+class UserRow:
+    id: uuid.UUID
+    email: str
+    username: str
+    full_name: Optional[str]
+    tailnet_ip: Optional[str]
+    role: Optional[str]
+    created_at: datetime
+
+
+@dataclass(slots=True)
+class MentionedUserRow:
+    id: uuid.UUID
+    username: str
+
+
+@dataclass(slots=True)
+class ReactionRow:
+    id: uuid.UUID
+    message_id: uuid.UUID
+    user_id: uuid.UUID
+    emoji: str
+    created_at: datetime
+    user: Optional[UserRow] = None
+
+
+@dataclass(slots=True)
+class AttachmentRow:
+    id: uuid.UUID
+    message_id: uuid.UUID
+    filename: str
+    file_path: str
+    file_type: str
+    file_size: int
+    created_at: datetime
+
+    url = models.Attachment.url
+    thumbnail_url = models.Attachment.thumbnail_url
+    preview_url = models.Attachment.preview_url
+
+
+@dataclass(slots=True)
+class ChannelMemberRow:
+    channel_id: uuid.UUID
+    user_id: uuid.UUID
+    joined_at: datetime
+    last_read_at: Optional[datetime]
+    user: Optional[UserRow] = None
+
+
+@dataclass(slots=True)
+class ChannelRow:
+    id: uuid.UUID
+    name: str
+    description: Optional[str]
+    type: Optional[str]
+    created_at: datetime
+    owner_id: Optional[uuid.UUID]
+    workspace_id: uuid.UUID
+    members: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class MessageRow:
+    id: uuid.UUID
+    content: str
+    created_at: datetime
+    channel_id: uuid.UUID
+    user_id: uuid.UUID
+    parent_id: Optional[uuid.UUID]
+    user: Optional[UserRow] = None
+    channel: Optional[ChannelRow] = None  # Only where the query asked for it (mentions)
+    reply_count: int = 0
+    reactions: list = field(default_factory=list)
+    attachments: list = field(default_factory=list)
+    mentioned_users: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class WorkspaceMemberRow:
+    workspace_id: uuid.UUID
+    user_id: uuid.UUID
+    role: Optional[str]
+    joined_at: datetime
+    user: Optional[UserRow] = None
+
+
+@functools.cache
+def columns(record, model) -> tuple:
+    """The model's columns behind a record's stored fields, in field order"""
+    table = model.__table__
+    return tuple(table.c[f.name] for f in fields(record) if f.name in table.c)
+
+
+def _user(users: dict, values) -> Optional[UserRow]:
+    """The user of an outer-joined row (None if absent), one record per id"""
+    if values[0] is None:
+        return None
+    user = users.get(values[0])
+    if user is None:
+        user = users[values[0]] = UserRow(*values)
+    return user
+
+
+def _chunks(ids: list):
+    for start in range(0, len(ids), _IN_CHUNK):
+        yield ids[start:start + _IN_CHUNK]
+
+
+def select_messages(with_channel: bool = False) -> Select:
+    """Messages with their authors; add filters, order and paging, then load_messages().
+    with_channel adds the channel's columns: the caller joins models.Channel."""
+    user = models.User
+    query = (
+        select(*columns(MessageRow, models.Message), *columns(UserRow, user))
+        .outerjoin(user, user.id == models.Message.user_id)
+    )
+    if with_channel:
+        query = query.add_columns(*columns(ChannelRow, models.Channel))
+    return query
+
+
+async def load_messages(db: AsyncSession, query: Select, params: dict = None, with_channel: bool = False) -> list:
+    """MessageRows for a select_messages() query, with reactions (and their users),
+    attachments and mentioned users: three more queries, as the ORM's eager loads made"""
+    result = await db.execute(query, params)
+    n_message, n_user = len(columns(MessageRow, models.Message)), len(columns(UserRow, models.User))
+    users, messages = {}, []
+    for row in result:
+        message = MessageRow(*row[:n_message], user=_user(users, row[n_message:n_message + n_user]))
+        if with_channel:
+            message.channel = ChannelRow(*row[n_message + n_user:])
+        messages.append(message)
+    if messages:
+        await _load_children(db, messages, users)
+    return messages
+
+
+@functools.cache
+def _children():
+    """Reactions with their users, attachments, and mentioned users of the messages in :ids"""
+    reaction, attachment, user = models.Reaction, models.Attachment, models.User
+    mentions = models.message_mentions
+    ids = bindparam("ids", expanding=True)
+    return (
+        select(*columns(ReactionRow, reaction), *columns(UserRow, user))
+        .outerjoin(user, user.id == reaction.user_id)
+        .filter(reaction.message_id.in_(ids)),
+        select(*columns(AttachmentRow, attachment)).filter(attachment.message_id.in_(ids)),
+        select(mentions.c.message_id, user.id, user.username)
+        .join(user, user.id == mentions.c.user_id)
+        .filter(mentions.c.message_id.in_(ids)),
+    )
+
+
+async def _load_children(db: AsyncSession, messages: list, users: dict) -> None:
+    by_id = {message.id: message for message in messages}
+    reactions, attachments, mentioned = _children()
+    n_reaction = len(columns(ReactionRow, models.Reaction))
+    for ids in _chunks(list(by_id)):
+        result = await db.execute(reactions, {"ids": ids})
+        for row in result:
+            item = ReactionRow(*row[:n_reaction], user=_user(users, row[n_reaction:]))
+            by_id[item.message_id].reactions.append(item)
+    for ids in _chunks(list(by_id)):
+        result = await db.execute(attachments, {"ids": ids})
+        for row in result:
+            item = AttachmentRow(*row)
+            by_id[item.message_id].attachments.append(item)
+    for ids in _chunks(list(by_id)):
+        result = await db.execute(mentioned, {"ids": ids})
+        for message_id, user_id, username in result:
+            by_id[message_id].mentioned_users.append(MentionedUserRow(user_id, username))
+
+
+def select_channels() -> Select:
+    """Channel columns; add filters and paging, then with_members()"""
+    return select(*columns(ChannelRow, models.Channel))
+
+
+def with_members(page: Select) -> Select:
+    """A select_channels() page outer-joined to the channels' members and their
+    users, for load_channels(): one query, as the ORM's joined load made"""
+    page = page.subquery()
+    member, user = models.ChannelMember, models.User
+    return (
+        select(page, *columns(ChannelMemberRow, member), *columns(UserRow, user))
+        .outerjoin(member, member.channel_id == page.c.id)
+        .outerjoin(user, user.id == member.user_id)
+    )
+
+
+async def load_channels(db: AsyncSession, query: Select, params: dict = None) -> list:
+    """ChannelRows, with their members and the members' users, for a with_members() query"""
+    n_channel, n_member = len(columns(ChannelRow, models.Channel)), len(columns(ChannelMemberRow, models.ChannelMember))
+    result = await db.execute(query, params)
+    users, channels = {}, {}
+    for row in result:
+        channel = channels.get(row[0])
+        if channel is None:
+            channel = channels[row[0]] = ChannelRow(*row[:n_channel])
+        if row[n_channel] is not None:
+            channel.members.append(ChannelMemberRow(
+                *row[n_channel:n_channel + n_member], user=_user(users, row[n_channel + n_member:])
+            ))
+    return list(channels.values())
+
+
+@functools.cache
+def _workspace_members():
+    member, user = models.WorkspaceMember, models.User
+    return (
+        select(*columns(WorkspaceMemberRow, member), *columns(UserRow, user))
+        .outerjoin(user, user.id == member.user_id)
+        .filter(member.workspace_id == bindparam("workspace_id"))
+    )
+
+
+async def load_workspace_members(db: AsyncSession, workspace_id: uuid.UUID) -> list:
+    n_member = len(columns(WorkspaceMemberRow, models.WorkspaceMember))
+    result = await db.execute(_workspace_members(), {"workspace_id": workspace_id})
+    users = {}
+    return [WorkspaceMemberRow(*row[:n_member], user=_user(users, row[n_member:])) for row in result]
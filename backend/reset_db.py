@@ -1,11 +1,10 @@
 import asyncio
-from database import engine, Base
-from models import *  # Import all models to ensure they are registered
+from database import engine
+import migrations
 
 async def reset_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
+    await migrations.reset(engine)
+    await migrations.upgrade(engine)
     print("Database reset successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+import os
+import time
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import export
+import instrumentation
+import jobs
+import profiler
+from database import get_db
+from deps import get_current_admin_user
+from models import User
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/sql-stats")
+async def read_sql_stats(current_user: User = Depends(get_current_admin_user)):
+    """Per-endpoint / per-WS-event statement counts, DB time, pool wait, slowest and N+1 suspects"""
+    return {
+        "enabled": instrumentation.SQL_INSTRUMENTATION,
+        "slow_query_ms": instrumentation.SQL_SLOW_QUERY_MS,
+        "n_plus_one_threshold": instrumentation.SQL_N_PLUS_ONE_THRESHOLD,
+        "endpoints": instrumentation.snapshot()
+    }
+
+@router.delete("/sql-stats")
+async def reset_sql_stats(current_user: User = Depends(get_current_admin_user)):
+    instrumentation.reset()
+    return {"message": "SQL stats reset"}
+
+@router.get("/jobs")
+async def read_jobs(
+    dead_letters: int = Query(20, ge=0, le=500),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Background job queue depth, in-flight and retrying jobs, and the latest dead letters"""
+    return await jobs.stats(dead_letters)
+
+@router.get("/profile")
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000),
+    all_threads: bool = False,
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Sample this worker's stacks for `seconds`; collapsed output feeds flamegraph.pl / speedscope"""
+    try:
+        result = await profiler.profile(seconds, interval_ms, all_threads)
+    except profiler.ProfileBusy:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running on this worker")
+
+    if format == "json":
+        top = sorted(result["stacks"].items(), key=lambda item: -item[1])[:50]
+        return {**result, "pid": os.getpid(), "stacks": [{"stack": stack, "count": n} for stack, n in top]}
+
+    filename = f"profile-{os.getpid()}-{int(time.time())}.folded"
+    return PlainTextResponse(
+        profiler.to_collapsed(result["stacks"]),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/workspaces/{workspace_id}/export")
+async def export_workspace(
+    workspace_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Stream the workspace as gzipped NDJSON (users, channels, messages and threads, reactions, attachment manifest)"""
+    workspace = await crud.get_workspace(db, workspace_id)
+    if not workspace:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    # The export reads on its own connection; don't hold this one for the whole download
+    await db.close()
+    if export.busy():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="An export is already running on this worker")
+
+    filename = f"workspace-{workspace_id}-{int(time.time())}.ndjson.gz"
+    return StreamingResponse(
+        export.stream_workspace(workspace_id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
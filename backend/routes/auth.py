@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from database import get_db
-from crud import get_user_by_username, create_user, get_user_by_email
+from crud import BROADCAST_MENTIONS, get_user_by_username, create_user, get_user_by_email
 from schemas import Token, UserCreate, WorkspaceCreate, ChannelCreate
 from security import verify_password, create_access_token, create_refresh_token, verify_refresh_token, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
 import crud
@@ -98,6 +98,8 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = await get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
+    if user.username in BROADCAST_MENTIONS:
+        raise HTTPException(status_code=400, detail="Username is reserved")
     # Check email
     if await get_user_by_email(db, email=user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
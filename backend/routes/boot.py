@@ -0,0 +1,164 @@
+import asyncio
+import contextlib
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import changes
+import crud
+import database
+import fastjson
+import schemas
+from database import get_db
+from deps import get_current_user
+from models import User
+from routes.channels import first_page
+
+router = APIRouter(tags=["boot"])
+
+
+async def _read(query, *args):
+    """Run a crud read on its own session, so independent reads can overlap"""
+    async with database.async_session_maker() as db:
+        return await query(db, *args)
+
+
+async def _discard(task: Optional[asyncio.Task]) -> None:
+    """Let a read that's no longer wanted finish: a cancel landing inside a
+    driver call can leave a broken connection in the pool"""
+    if task:
+        with contextlib.suppress(Exception):
+            await task
+
+
+async def _can_open(db: AsyncSession, channel_id: uuid.UUID, workspace_id: uuid.UUID, user_id: uuid.UUID) -> bool:
+    channel = await crud.get_channel(db, channel_id)
+    return bool(
+        channel and channel.workspace_id == workspace_id
+        and await crud.can_access_channel(db, user_id, channel.id, channel.workspace_id, channel.type)
+    )
+
+
+async def _sidebar(db: AsyncSession, workspace_id: Optional[uuid.UUID], user_id: uuid.UUID, channel_ids: list = None):
+    if workspace_id is None:
+        return []
+    if channel_ids is None:
+        channels = await crud.get_channels(db, workspace_id=workspace_id, user_id=user_id)
+    else:
+        channels = await crud.get_channels(
+            db, workspace_id=workspace_id, user_id=user_id, limit=len(channel_ids), channel_ids=channel_ids
+        )
+    states = await crud.get_channel_read_states(db, [channel.id for channel in channels], user_id)
+    sidebar = []
+    for channel in channels:
+        state = states.get(channel.id)
+        item = fastjson.dump(channel, schemas.SidebarChannel)
+        if state is not None:
+            item["last_message_at"], item["last_read_at"] = state.last_message_at, state.last_read_at
+            # A member who has never opened the channel has read up to when they joined
+            seen = state.last_read_at or state.joined_at
+            item["unread"] = bool(state.joined_at and state.last_message_at and state.last_message_at > seen)
+        sidebar.append(item)
+    return sidebar
+
+
+@router.get("/boot", response_model=schemas.Boot)
+async def boot(
+    workspace_id: Optional[uuid.UUID] = None,
+    channel_id: Optional[uuid.UUID] = None,
+    limit: int = Query(50, ge=0, le=100),  # 0: no history
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The user, their workspaces, the sidebar of `workspace_id` (default: the
+    first) with unread state, the first page of `channel_id` (default: the first
+    channel) and the unread notification count, in one round trip"""
+    user = fastjson.dump(current_user, schemas.UserOut)
+    user_id = current_user.id
+    # Taken before anything is read: a change racing the reads comes again through /sync
+    cursor = await changes.head(db)
+    # Each read below takes its own pooled connection; hand back the one auth used
+    await db.close()
+
+    workspaces_task = asyncio.ensure_future(_read(crud.get_user_workspaces, user_id))
+    notifications_task = asyncio.ensure_future(_read(crud.count_unread_notifications, user_id))
+    if workspace_id is None:
+        workspaces = await workspaces_task
+        workspace_id = workspaces[0].id if workspaces else None
+    sidebar_task = asyncio.ensure_future(_read(_sidebar, workspace_id, user_id))
+    # With the channel known up front its history loads alongside the rest;
+    # access is checked against the sidebar before any of it is returned
+    page_task = asyncio.ensure_future(_read(first_page, channel_id, limit)) if channel_id and limit else None
+
+    workspaces, unread_notifications, channels = await asyncio.gather(workspaces_task, notifications_task, sidebar_task)
+    if workspace_id and workspace_id not in {workspace.id for workspace in workspaces}:
+        await _discard(page_task)
+        raise HTTPException(status_code=403, detail="Not a member of this workspace")
+    if channel_id is None and channels:
+        channel_id = channels[0]["id"]
+        page_task = asyncio.ensure_future(_read(first_page, channel_id, limit)) if limit else None
+    # The sidebar is one page of channels; anything past it is checked on its own
+    if channel_id and channel_id not in {channel["id"] for channel in channels} and (
+        not workspace_id or not await _read(_can_open, channel_id, workspace_id, user_id)
+    ):
+        await _discard(page_task)
+        raise HTTPException(status_code=404, detail="Channel not found")
+    page = await page_task if page_task else b"[]"
+
+    # The page is already JSON (and usually straight from the cache): splice it in
+    body = fastjson.dumps({
+        "user": user, "workspaces": [fastjson.dump(workspace, schemas.WorkspaceOut) for workspace in workspaces],
+        "workspace_id": workspace_id, "channels": channels, "channel_id": channel_id,
+        "unread_notifications": unread_notifications, "cursor": cursor,
+    })
+    return Response(content=body[:-1] + b',"messages":' + page + b"}", media_type="application/json")
+
+
+@router.get("/sync", response_model=schemas.Sync)
+async def sync(
+    workspace_id: uuid.UUID,
+    since: int = Query(..., ge=0),  # Cursor from /boot or the previous /sync
+    channel_id: Optional[uuid.UUID] = None,  # Open channel, whose changed messages are included
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """What changed in the workspace and for the user since `since`: changed
+    channels as the sidebar shows them, changed messages of `channel_id` and
+    changed notifications, or `reset` when the client should reload"""
+    if not await crud.is_workspace_member(db, workspace_id, current_user.id):
+        raise HTTPException(status_code=403, detail="Not a member of this workspace")
+    user_id = current_user.id
+    found = await changes.pending(db, since, workspace_id, user_id)
+    if found is None:
+        return schemas.Sync(cursor=since, reset=True)
+
+    channel_ids, gone, message_ids, notification_ids = set(), set(), set(), set()
+    for change in found.changes:
+        if change.kind in ("channel", "channel_member", "message"):
+            channel_ids.add(change.channel_id)
+        if change.deleted and (change.kind == "channel" or change.user_id == user_id):
+            gone.add(change.channel_id)
+        if change.kind in ("message", "reaction") and change.channel_id == channel_id:
+            message_ids.add(change.entity_id)
+        if change.kind == "notification":
+            notification_ids.add(change.entity_id)
+
+    # Current state, under the usual visibility rules; changes the user can't see drop out here
+    channels = await _sidebar(db, workspace_id, user_id, list(channel_ids)) if channel_ids else []
+    messages = []
+    if message_ids and await _can_open(db, channel_id, workspace_id, user_id):
+        messages = await crud.get_messages_by_ids(db, list(message_ids))
+        counts = await crud.get_thread_replies_counts(db, [message.id for message in messages])
+        for message in messages:
+            message.reply_count = counts.get(message.id, 0)
+    notifications, unread_notifications = [], None
+    if notification_ids:
+        notifications = await crud.get_notifications_by_ids(db, user_id, list(notification_ids))
+        unread_notifications = await crud.count_unread_notifications(db, user_id)
+    return schemas.Sync.model_validate({
+        "cursor": found.cursor, "channels": channels,
+        "removed_channels": list(gone - {channel["id"] for channel in channels}),
+        "messages": messages, "notifications": notifications, "unread_notifications": unread_notifications,
+    }, from_attributes=True)
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+import json
 import uuid
 
 from database import get_db
 import crud
-from schemas import Channel, ChannelCreate, Message, MessageCreate, DMChannelCreate
+import deletions
+import fastjson
+import message_cache
+import metrics
+from schemas import Channel, ChannelCreate, Deletion, Message, MessageCreate, DMChannelCreate
 from models import User
 from deps import get_current_user
 
@@ -69,7 +74,7 @@ async def read_channels(
         raise HTTPException(status_code=403, detail="Not a member of this workspace")
 
     channels = await crud.get_channels(db, workspace_id=workspace_id, user_id=current_user.id, skip=skip, limit=limit)
-    return channels
+    return fastjson.response([fastjson.dump(channel, Channel) for channel in channels])
 
 @router.post("/{channel_id}/messages", response_model=Message)
 async def create_message(
@@ -91,8 +96,11 @@ async def create_message(
     # Ensure message.channel_id matches path param (good practice)
     if message.channel_id != channel_id:
         raise HTTPException(status_code=400, detail="Channel ID mismatch")
+    if message.attachment_ids and await crud.get_unlinkable_attachment_ids(db, message.attachment_ids, current_user.id):
+        raise HTTPException(status_code=400, detail="Invalid attachment")
 
-    msg, _ = await crud.create_message(db=db, message=message, user_id=current_user.id)
+    msg = await crud.create_message(db=db, message=message, user_id=current_user.id)
+    metrics.MESSAGES_CREATED.inc("http")
     return msg
 
 @router.get("/{channel_id}/messages", response_model=List[Message])
@@ -101,29 +109,75 @@ async def read_messages(
     skip: int = 0,
     limit: int = 50,
     parent_id: Optional[uuid.UUID] = None,
+    format: str = Query("full", pattern="^(full|compact)$"),  # compact: users listed once, reactions aggregated
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Ensure channel exists
-    db_channel = await crud.get_channel(db, channel_id=channel_id)
-    if not db_channel:
+    # Ensure channel exists. The cached answer can predate a hide in another
+    # worker: the first page re-checks on a cache miss, other pages skip the cache.
+    first_page_read = not parent_id and skip == 0
+    workspace_id = await crud.get_channel_workspace_id(db, channel_id, cached=first_page_read)
+    if not workspace_id:
         raise HTTPException(status_code=404, detail="Channel not found")
         
     # Ensure user is member of the workspace
-    member = await crud.get_workspace_member(db, db_channel.workspace_id, current_user.id)
-    if not member:
+    if not await crud.is_workspace_member(db, workspace_id, current_user.id):
         raise HTTPException(status_code=403, detail="Not a member of this workspace")
 
+    if first_page_read:
+        body = await first_page(db, channel_id, limit)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Channel not found")
+        if format == "compact":
+            users = {}
+            messages = message_cache.compact_page(json.loads(body), users)
+            body = message_cache.dumps_compact(users=users, messages=messages)
+        return Response(content=body, media_type="application/json")
+
     messages = await crud.get_messages(db, channel_id=channel_id, skip=skip, limit=limit, parent_id=parent_id)
     
     # Add reply counts to messages (only for top-level messages)
     if not parent_id:
+        counts = await crud.get_thread_replies_counts(db, [msg.id for msg in messages])
         for msg in messages:
-            msg.reply_count = await crud.get_thread_replies_count(db, msg.id)
-    
-    return messages
+            msg.reply_count = counts.get(msg.id, 0)
+
+    if format == "compact":
+        users = {}
+        messages = message_cache.compact_messages(messages, users)
+        return Response(content=message_cache.dumps_compact(users=users, messages=messages), media_type="application/json")
+
+    return fastjson.response([fastjson.dump(msg, Message) for msg in messages])
+
+async def first_page(db: AsyncSession, channel_id: uuid.UUID, limit: int = 50) -> Optional[bytes]:
+    """JSON of the channel's newest page of messages, served from the hot-channel
+    cache; None if the channel is hidden. Hiding a channel drops its cached page
+    and bumps the version (deletions._schedule), so only a miss can reach a
+    hidden channel, and it checks the database before filling."""
+    cached = await message_cache.get_first_page(channel_id, limit)
+    if cached is not None:
+        return cached
+    version = await message_cache.snapshot_version(channel_id)
+    if not await crud.get_channel_workspace_id(db, channel_id, cached=False):
+        return None
 
-@router.delete("/{channel_id}", status_code=status.HTTP_204_NO_CONTENT)
+    messages = await crud.get_messages(db, channel_id=channel_id, limit=limit)
+    counts = await crud.get_thread_replies_counts(db, [msg.id for msg in messages])
+    body = message_cache.dumps_page(message_cache.serialize_message(msg, counts.get(msg.id, 0)) for msg in messages)
+    if limit == message_cache.MESSAGE_CACHE_SIZE:
+        await message_cache.fill(channel_id, body, version)
+    return body
+
+@router.post("/{channel_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+async def mark_channel_read(
+    channel_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Record that the user has seen the channel up to now (members only; a no-op otherwise)"""
+    await crud.mark_channel_read(db, channel_id, current_user.id)
+
+@router.delete("/{channel_id}", response_model=Deletion, status_code=status.HTTP_202_ACCEPTED)
 async def delete_channel(
     channel_id: uuid.UUID,
     db: AsyncSession = Depends(get_db),
@@ -142,8 +196,8 @@ async def delete_channel(
     # if channel.owner_id != current_user.id and member.role != 'admin':
     #    raise HTTPException(status_code=403, detail="Not authorized to delete this channel")
 
-    await crud.delete_channel(db, channel_id)
-    return None
+    # Hidden now; messages are removed in the background (GET /deletions/{id})
+    return await deletions.delete_channel(db, channel, current_user.id)
 
 @router.patch("/{channel_id}", response_model=Channel)
 async def update_channel(
@@ -174,8 +228,8 @@ async def read_channel(
     member = await crud.get_workspace_member(db, channel.workspace_id, current_user.id)
     if not member:
          raise HTTPException(status_code=403, detail="Not a member of this workspace")
-         
-    return channel
+
+    return fastjson.response(fastjson.dump(channel, Channel))
 
 # Thread-specific endpoint
 @router.get("/{channel_id}/threads/{message_id}", response_model=dict)
@@ -184,6 +238,7 @@ async def get_thread(
     message_id: uuid.UUID,
     skip: int = 0,
     limit: int = 50,
+    format: str = Query("full", pattern="^(full|compact)$"),  # compact: users listed once, reactions aggregated
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -205,12 +260,19 @@ async def get_thread(
     # Get replies
     replies = await crud.get_thread_messages(db, parent_id=message_id, skip=skip, limit=limit)
     reply_count = await crud.get_thread_replies_count(db, message_id)
+
+    if format == "compact":
+        users = {}
+        parent = message_cache.compact_messages([parent_message], users)[0]
+        replies = message_cache.compact_messages(replies, users)
+        body = message_cache.dumps_compact(users=users, parent=parent, replies=replies, reply_count=reply_count)
+        return Response(content=body, media_type="application/json")
     
-    return {
-        "parent": parent_message,
-        "replies": replies,
+    return fastjson.response({
+        "parent": fastjson.dump(parent_message, Message),
+        "replies": [fastjson.dump(reply, Message) for reply in replies],
         "reply_count": reply_count
-    }
+    })
 
 # Reaction endpoints
 @router.post("/{channel_id}/messages/{message_id}/reactions")
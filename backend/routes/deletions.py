@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+import uuid
+
+import models, schemas
+from database import get_db
+from deps import get_current_user
+
+router = APIRouter(prefix="/deletions", tags=["deletions"])
+
+@router.get("/{deletion_id}", response_model=schemas.Deletion)
+async def read_deletion(
+    deletion_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Progress of a background channel/user/workspace deletion (requester or admin)"""
+    deletion = await db.get(models.Deletion, deletion_id)
+    if not deletion or (deletion.requested_by != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Deletion not found")
+    return deletion
@@ -1,18 +1,68 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-import shutil
+from typing import NamedTuple, Optional
+import anyio
 import os
 import uuid
 from datetime import datetime
 from database import get_db
-from deps import get_current_user
+from deps import get_current_user, oauth2_scheme_optional
 from models import User, Attachment
-from schemas import AttachmentOut
+from schemas import AttachmentOut, UploadRequest, PresignedUpload
+from security import verify_access_token
+from cache import TTLCache
+import crud
+import logs
+import storage
+import thumbnails
+
+log = logs.get_logger("files")
 
 router = APIRouter(tags=["files"])
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024 # 10MB
+BLOCKED_EXTENSIONS = ['.exe', '.sh', '.bat', '.cmd', '.js', '.py', '.php']
+
+# Upload names are UUIDs and never rewritten, so responses can be cached forever.
+# "private" because access is checked per user.
+ATTACHMENT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+class AttachmentMeta(NamedTuple):
+    file_path: str
+    filename: str
+    file_type: str
+    user_id: uuid.UUID
+    channel_id: Optional[uuid.UUID]
+    workspace_id: Optional[uuid.UUID]
+    channel_type: Optional[str]
+
+# attachment_id -> AttachmentMeta. An attachment only ever moves from
+# "unsent" to "posted in a channel", so unsent entries get a short TTL.
+_attachment_cache = TTLCache(maxsize=20_000, ttl=3600)
+# (username, channel_id or attachment_id) -> bool
+_access_cache = TTLCache(maxsize=50_000, ttl=60)
+
+class AttachmentFileResponse(FileResponse):
+    # Bigger reads for Range requests (video / PDF seeking). Full-file responses
+    # use zero-copy sendfile when the server supports the ASGI pathsend extension.
+    chunk_size = 1024 * 1024
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _new_storage_key(filename: str) -> str:
+    # Validate extension
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext in BLOCKED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="File type not allowed")
+
+    # Date-based prefix + unique filename
+    today = datetime.now()
+    return f"{today.year}/{today.month:02d}/{uuid.uuid4()}{file_ext}"
 
 @router.post("/upload", response_model=AttachmentOut)
 async def upload_file(
@@ -20,45 +70,242 @@ async def upload_file(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Validate extension
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext in ['.exe', '.sh', '.bat', '.cmd', '.js', '.py', '.php']:
-         raise HTTPException(status_code=400, detail="File type not allowed")
+    # Proxied upload: bytes pass through the API. Prefer POST /uploads (presigned).
+    key = _new_storage_key(file.filename)
+    backend = storage.get_storage()
+    file_type = file.content_type or "application/octet-stream"
 
-    # Create date-based directory
-    today = datetime.now()
-    date_path = f"{today.year}/{today.month:02d}"
-    full_upload_path = os.path.join(UPLOAD_DIR, date_path)
-    os.makedirs(full_upload_path, exist_ok=True)
-
-    # Generate unique filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(full_upload_path, unique_filename)
-    
     # Save file
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_size = await backend.save(key, file.file, file_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save file: {str(e)}")
     
-    # Get file size and validate
-    file_size = os.path.getsize(file_path)
-    if file_size > 10 * 1024 * 1024: # 10MB limit
-        os.remove(file_path)
+    # Validate size
+    if file_size > MAX_UPLOAD_SIZE:
+        await backend.delete(key)
         raise HTTPException(status_code=400, detail="File too large (max 10MB)")
     
     # Create DB entry
     attachment = Attachment(
         user_id=current_user.id,
         filename=file.filename,
-        file_path=f"/static/{date_path}/{unique_filename}", # Public URL path
-        file_type=file.content_type or "application/octet-stream",
-        file_size=file_size
+        file_path=backend.file_path_for(key),
+        file_type=file_type,
+        file_size=file_size,
+        upload_complete=True
     )
     
     db.add(attachment)
     await db.commit()
     await db.refresh(attachment)
+
+    # Build thumbnail/preview derivatives in the background process pool
+    if thumbnails.is_supported(attachment.file_type):
+        storage.schedule_derivatives(backend, key)
     
     return attachment
+
+@router.post("/uploads", response_model=PresignedUpload)
+async def create_upload(
+    upload: UploadRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Reserve an attachment and return a presigned URL the client PUTs the file to directly"""
+    if upload.file_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
+
+    key = _new_storage_key(upload.filename)
+    backend = storage.get_storage()
+    upload_url, headers = backend.presign_put(key, upload.file_type, upload.file_size)
+
+    attachment = Attachment(
+        user_id=current_user.id,
+        filename=upload.filename,
+        file_path=backend.file_path_for(key),
+        file_type=upload.file_type,
+        file_size=upload.file_size,
+        upload_complete=False # Until /complete finds the blob
+    )
+    db.add(attachment)
+    await db.commit()
+    await db.refresh(attachment)
+
+    return PresignedUpload(attachment=attachment, upload_url=upload_url, method="PUT", headers=headers)
+
+@router.post("/uploads/{attachment_id}/complete", response_model=AttachmentOut)
+async def complete_upload(
+    attachment_id: uuid.UUID,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Confirm a presigned upload landed: checks the stored size and starts derivative generation"""
+    attachment = await db.get(Attachment, attachment_id)
+    if not attachment or attachment.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    backend, key = storage.resolve(attachment.file_path)
+    file_size = await backend.size(key)
+    if file_size is None:
+        raise HTTPException(status_code=400, detail="Upload not found in storage")
+    if file_size > MAX_UPLOAD_SIZE:
+        await backend.delete(key)
+        await db.delete(attachment)
+        await db.commit()
+        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
+
+    if attachment.file_size != file_size or not attachment.upload_complete:
+        attachment.file_size = file_size
+        attachment.upload_complete = True
+        await db.commit()
+        await db.refresh(attachment)
+
+    if thumbnails.is_supported(attachment.file_type):
+        storage.schedule_derivatives(backend, key)
+    return attachment
+
+@router.put("/uploads/local/{key:path}", status_code=204)
+async def put_local_upload(key: str, expires: int, size: int, signature: str, request: Request):
+    """Presigned PUT target for the local-disk backend (S3 clients PUT to the bucket instead)"""
+    content_type = request.headers.get("content-type", "")
+    if not storage.verify_local_upload(key, content_type, size, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+
+    backend = storage.get_storage("local")
+    try:
+        path = backend.local_path(key)
+    except storage.StorageError:
+        raise HTTPException(status_code=400, detail="Invalid storage key")
+    # Stored files are immutable: a replayed URL must not replace one
+    if await anyio.to_thread.run_sync(os.path.exists, path):
+        raise HTTPException(status_code=409, detail="Upload already exists")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Written beside the target, then linked into place, which fails if the
+    # key appeared meanwhile; an aborted upload leaves nothing at the key
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        written = 0
+        async with await anyio.open_file(partial, "wb") as out:
+            async for chunk in request.stream():
+                written += len(chunk)
+                if written > size:
+                    break
+                await out.write(chunk)
+        if written != size:
+            raise HTTPException(status_code=400, detail="Upload size does not match the signed size")
+        try:
+            await anyio.to_thread.run_sync(os.link, partial, path)
+        except FileExistsError:
+            raise HTTPException(status_code=409, detail="Upload already exists")
+    finally:
+        await anyio.to_thread.run_sync(_remove_if_exists, partial)
+    return Response(status_code=204)
+
+def _remove_if_exists(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+@router.get("/attachments/{attachment_id}")
+async def get_attachment(
+    attachment_id: uuid.UUID,
+    request: Request,
+    variant: Optional[str] = None,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None, # Signed link (Attachment.url) for <img>/<a> tags
+    header_token: Optional[str] = Depends(oauth2_scheme_optional),
+    db: AsyncSession = Depends(get_db)
+):
+    # A signed link was minted for a response that already passed the access
+    # check; otherwise the caller's token is checked against the channel below
+    if signature is not None:
+        if expires is None or not storage.verify_attachment_url(attachment_id, expires, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired attachment link")
+        username = None
+    else:
+        username = verify_access_token(header_token or "")
+        if not username:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if variant is not None and variant not in thumbnails.THUMBNAIL_VARIANTS:
+        raise HTTPException(status_code=400, detail="Unknown variant")
+
+    meta = _attachment_cache.get(attachment_id)
+    if meta is None:
+        row = await crud.get_attachment_with_channel(db, attachment_id)
+        if not row:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        attachment, channel = row
+        meta = AttachmentMeta(
+            file_path=attachment.file_path,
+            filename=attachment.filename,
+            file_type=attachment.file_type,
+            user_id=attachment.user_id,
+            channel_id=channel.id if channel else None,
+            workspace_id=channel.workspace_id if channel else None,
+            channel_type=channel.type if channel else None
+        )
+        _attachment_cache.set(attachment_id, meta, ttl=None if channel else 30)
+
+    # Unsent attachments are only visible to the uploader
+    if username is not None:
+        access_key = (username, meta.channel_id or attachment_id)
+        allowed = _access_cache.get(access_key)
+        if allowed is None:
+            user = await crud.get_user_by_username(db, username)
+            if not user:
+                allowed = False
+            elif meta.channel_id is None:
+                allowed = user.id == meta.user_id
+            else:
+                allowed = await crud.can_access_channel(db, user.id, meta.channel_id, meta.workspace_id, meta.channel_type)
+            _access_cache.set(access_key, allowed)
+        if not allowed:
+            raise HTTPException(status_code=403, detail="Not allowed to access this attachment")
+
+    if not thumbnails.is_supported(meta.file_type):
+        variant = None
+
+    # Content behind an (id, variant) pair never changes, so revalidation
+    # needs neither a stat nor a derivative build
+    etag = f'"{attachment_id}-{variant or "original"}"'
+    headers = {"ETag": etag, "Cache-Control": ATTACHMENT_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    backend, key = storage.resolve(meta.file_path)
+    media_type = meta.file_type
+    if variant:
+        try:
+            key = (await backend.ensure_derivatives(key))[variant]
+            media_type = f"image/{thumbnails.THUMBNAIL_FORMAT}"
+        except Exception as e:
+            # Serve the original for now, but don't let it be cached as the variant
+            log.warning("derivative_unavailable", attachment_id=attachment_id, error=str(e))
+            headers["ETag"] = f'"{attachment_id}-original"'
+            headers["Cache-Control"] = "no-cache"
+
+    # Object stores serve the bytes themselves; the redirect is only cacheable
+    # while the presigned URL is valid.
+    direct_url = backend.presign_get(key)
+    if direct_url:
+        return RedirectResponse(direct_url, status_code=307, headers={
+            "Cache-Control": f"private, max-age={max(storage.PRESIGN_EXPIRES_SECONDS - 60, 0)}"
+        })
+
+    path = backend.local_path(key)
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return AttachmentFileResponse(
+        path,
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result,
+        filename=meta.filename,
+        content_disposition_type="inline"
+    )
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional
+import uuid
 from database import get_db
-from crud import get_users, create_user, get_user_by_username, get_user_by_id
-from schemas import UserCreate, UserOut, UserUpdate
+import deletions
+import fastjson
+import message_cache
+from crud import BROADCAST_MENTIONS, get_users, create_user, get_user_by_username, get_user_by_id, get_mentions
+from schemas import Deletion, MentionOut, UserCreate, UserOut, UserUpdate
 from deps import get_current_active_user, get_current_admin_user
 from models import User
 
@@ -14,6 +18,26 @@ router = APIRouter(prefix="/users", tags=["users"])
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
+@router.get("/me/mentions", response_model=List[MentionOut])
+async def read_my_mentions(
+    workspace_id: Optional[uuid.UUID] = None,
+    channel_id: Optional[uuid.UUID] = None,
+    before: Optional[uuid.UUID] = None,
+    limit: int = Query(50, ge=1, le=200),
+    format: str = Query("full", pattern="^(full|compact)$"),  # compact: users listed once, reactions aggregated
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Messages mentioning the current user, newest first; page with before=<last message id>"""
+    messages = await get_mentions(
+        db, current_user.id, workspace_id=workspace_id, channel_id=channel_id, before=before, limit=limit
+    )
+    if format == "compact":
+        users = {}
+        messages = message_cache.compact_messages(messages, users, with_channel=True)
+        return Response(content=message_cache.dumps_compact(users=users, messages=messages), media_type="application/json")
+    return fastjson.response([fastjson.dump(message, MentionOut) for message in messages])
+
 @router.get("/", response_model=List[UserOut])
 async def read_users(
     skip: int = 0, 
@@ -33,6 +57,8 @@ async def create_new_user(
     db_user = await get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
+    if user.username in BROADCAST_MENTIONS:
+        raise HTTPException(status_code=400, detail="Username is reserved")
     return await create_user(db=db, user=user)
 
 @router.put("/{user_id}", response_model=UserOut)
@@ -54,6 +80,8 @@ async def update_user(
         existing_user = await get_user_by_username(db, username=user_update.username)
         if existing_user and existing_user.id != user_id:
             raise HTTPException(status_code=400, detail="Username already in use")
+        if user_update.username in BROADCAST_MENTIONS:
+            raise HTTPException(status_code=400, detail="Username is reserved")
         db_user.username = user_update.username
     if user_update.full_name:
         db_user.full_name = user_update.full_name
@@ -70,7 +98,7 @@ async def update_user(
     await db.refresh(db_user)
     return db_user
 
-@router.delete("/{user_id}")
+@router.delete("/{user_id}", response_model=Deletion, status_code=202)
 async def delete_user(
     user_id: str,
     db: AsyncSession = Depends(get_db),
@@ -84,6 +112,5 @@ async def delete_user(
     if db_user.id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
     
-    await db.delete(db_user)
-    await db.commit()
-    return {"message": "User deleted successfully"}
\ No newline at end of file
+    # Hidden now; their messages and other rows are removed in the background
+    return await deletions.delete_user(db, db_user, current_user.id)
\ No newline at end of file
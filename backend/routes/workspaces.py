@@ -4,7 +4,7 @@ from sqlalchemy.future import select
 from typing import List
 import uuid
 
-import crud, models, schemas
+import crud, deletions, fastjson, models, schemas
 from database import get_db
 from deps import get_current_user
 
@@ -59,7 +59,9 @@ async def regenerate_invite_code(workspace_id: uuid.UUID, db: AsyncSession = Dep
 @router.post("/join", response_model=schemas.Workspace)
 async def join_workspace(request: schemas.JoinWorkspaceRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     # Find workspace by invite code
-    result = await db.execute(select(models.Workspace).filter(models.Workspace.invite_code == request.invite_code))
+    result = await db.execute(select(models.Workspace).filter(
+        models.Workspace.invite_code == request.invite_code, models.Workspace.deleted_at.is_(None)
+    ))
     workspace = result.scalars().first()
     
     if not workspace:
@@ -100,6 +102,25 @@ async def get_workspace(
         raise HTTPException(status_code=404, detail="Workspace not found")
     return workspace
 
+@router.delete("/{workspace_id}", response_model=schemas.Deletion, status_code=status.HTTP_202_ACCEPTED)
+async def delete_workspace(
+    workspace_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    member = await crud.get_workspace_member(db, workspace_id, current_user.id)
+    if not member:
+        raise HTTPException(status_code=403, detail="Not a member of this workspace")
+    if member.role != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can delete a workspace")
+
+    workspace = await crud.get_workspace(db, workspace_id)
+    if not workspace:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+
+    # Hidden now with its channels; the rows are removed in the background
+    return await deletions.delete_workspace(db, workspace, current_user.id)
+
 @router.get("/{workspace_id}/members", response_model=List[schemas.WorkspaceMemberOut])
 async def get_workspace_members(
     workspace_id: uuid.UUID,
@@ -113,5 +134,6 @@ async def get_workspace_members(
          
     # Fetch members (need a CRUD method or direct query)
     # Let's add crud.get_workspace_members
-    return await crud.get_workspace_members(db, workspace_id)
+    members = await crud.get_workspace_members(db, workspace_id)
+    return fastjson.response([fastjson.dump(member, schemas.WorkspaceMemberOut) for member in members])
 
@@ -94,12 +94,25 @@ class AttachmentBase(BaseModel):
 
 class AttachmentOut(AttachmentBase):
     id: uuid.UUID
-    file_path: str
+    url: Optional[str] = None
+    thumbnail_url: Optional[str] = None  # Downscaled derivatives, images only
+    preview_url: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class UploadRequest(BaseModel):
+    filename: str
+    file_type: str = "application/octet-stream"
+    file_size: int
+
+class PresignedUpload(BaseModel):
+    attachment: AttachmentOut
+    upload_url: str # Absolute for object stores, API-relative for local disk
+    method: str = "PUT"
+    headers: dict[str, str] = {}
+
 # Message Schemas
 class MentionedUser(BaseModel):
     id: uuid.UUID
@@ -128,6 +141,18 @@ class Message(MessageBase):
     class Config:
         from_attributes = True
 
+class ChannelSummary(BaseModel):
+    id: uuid.UUID
+    name: str
+    type: str
+    workspace_id: uuid.UUID
+
+    class Config:
+        from_attributes = True
+
+class MentionOut(Message):
+    channel: ChannelSummary
+
 # Workspace Schemas
 class WorkspaceBase(BaseModel):
     name: str
@@ -137,7 +162,7 @@ class WorkspaceCreate(WorkspaceBase):
 
 class Workspace(WorkspaceBase):
     id: uuid.UUID
-    owner_id: uuid.UUID
+    owner_id: Optional[uuid.UUID] = None  # Cleared when the owner's account is deleted
     invite_code: str | None = None  # Allow None for older workspaces or before migration, theoretically
 
     class Config:
@@ -148,7 +173,7 @@ class JoinWorkspaceRequest(BaseModel):
 
 class WorkspaceOut(WorkspaceBase):
     id: uuid.UUID
-    owner_id: uuid.UUID
+    owner_id: Optional[uuid.UUID] = None
     # Invite code is optional in output, usually hidden unless specifically requested or if user is owner.
     # We can omit it here or include it. For simplicity, let's include it for now, 
     # but ideally we'd have a separate OwnerWorkspaceOut.
@@ -187,3 +212,45 @@ class Notification(NotificationBase):
 
     class Config:
         from_attributes = True
+
+# Background deletion progress
+class Deletion(BaseModel):
+    id: uuid.UUID
+    kind: str # 'channel', 'user', 'workspace'
+    target_id: uuid.UUID
+    status: str # 'pending', 'running', 'done'
+    stage: Optional[str] = None
+    rows_total: Optional[int] = None
+    rows_deleted: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Client boot (GET /boot): everything the first render needs in one response
+class SidebarChannel(Channel):
+    last_message_at: Optional[datetime] = None
+    last_read_at: Optional[datetime] = None
+    unread: bool = False  # Tracked for channels the user is a member of
+
+class Boot(BaseModel):
+    user: UserOut
+    workspaces: list[WorkspaceOut]
+    workspace_id: Optional[uuid.UUID] = None
+    channels: list[SidebarChannel] = []
+    channel_id: Optional[uuid.UUID] = None
+    unread_notifications: int = 0
+    messages: list[Message] = []  # First page of channel_id
+    cursor: int = 0  # For GET /sync
+
+# Delta sync (GET /sync): what changed since the client's cursor
+class Sync(BaseModel):
+    cursor: int
+    reset: bool = False  # Cursor too old or too far behind: reload through /boot
+    channels: list[SidebarChannel] = []  # Created or changed (members, new messages, read marker)
+    removed_channels: list[uuid.UUID] = []
+    messages: list[Message] = []  # New or changed top-level messages of channel_id
+    notifications: list[Notification] = []
+    unread_notifications: Optional[int] = None  # Only when notifications changed
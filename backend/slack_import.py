@@ -0,0 +1,404 @@
+"""Import a Slack export (the zip from Settings > Import/Export, or its unzipped
+directory) into a workspace.
+
+    python -m slack_import export.zip --workspace-name "Acme" --owner alice
+    python -m slack_import export.zip --workspace-id <uuid>
+    python -m slack_import export.zip        # continue an interrupted import
+    python -m slack_import export.zip --force --workspace-name "Acme 2" --owner alice  # once more
+
+Run from backend/ against the app's DATABASE_URL. Users are matched to
+existing accounts by email, otherwise created with an unusable password (they
+set one through the admin panel). Messages, thread replies, reactions and
+user mentions go in through Core in batches of --batch-size messages: COPY
+on Postgres, executemany on SQLite; no per-message transaction, notification
+or fan-out. Each batch commits together with the Import checkpoint, and every
+row's id is derived from its Slack id, so rerunning after a crash picks up at
+the first uncommitted file. Uploaded files are not copied (Slack serves them
+only with the exporting workspace's token).
+"""
+import argparse
+import asyncio
+import html
+import json
+import os
+import re
+import secrets
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import database
+import models
+from security import get_password_hash
+
+BATCH_SIZE = 10_000
+NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "diligental:slack-import")
+
+# Slack channel lists and the type each becomes
+CHANNEL_LISTS = (("channels.json", "public"), ("groups.json", "private"), ("mpims.json", "private"), ("dms.json", "dm"))
+# Kept as messages; joins, leaves, topic changes and the like are dropped
+MESSAGE_SUBTYPES = {None, "thread_broadcast", "bot_message", "me_message", "file_share", "reply_broadcast"}
+# Slack stores reactions by name; Reaction.emoji holds a character or a short :code:
+EMOJI = {
+    "+1": "👍", "thumbsup": "👍", "-1": "👎", "thumbsdown": "👎", "heart": "❤️", "tada": "🎉", "joy": "😂",
+    "eyes": "👀", "rocket": "🚀", "fire": "🔥", "pray": "🙏", "clap": "👏", "100": "💯", "smile": "😄",
+    "white_check_mark": "✅", "heavy_check_mark": "✔️", "x": "❌", "raised_hands": "🙌", "thinking_face": "🤔",
+    "slightly_smiling_face": "🙂", "ok_hand": "👌", "wave": "👋", "point_up": "☝️", "muscle": "💪",
+}
+
+USER_MENTION = re.compile(r"<@([UW][A-Z0-9]+)(?:\|[^>]*)?>")
+SPECIAL_MENTION = re.compile(r"<!(channel|here|everyone)(?:\|[^>]*)?>")
+CHANNEL_LINK = re.compile(r"<#[CG][A-Z0-9]+\|([^>]*)>")
+LINK = re.compile(r"<((?:https?|mailto):[^|>]+)(?:\|[^>]*)?>")
+
+
+def _id(workspace_id: uuid.UUID, *parts) -> uuid.UUID:
+    return uuid.uuid5(NAMESPACE, "/".join([str(workspace_id), *parts]))
+
+
+def _time(ts) -> datetime:
+    return datetime.fromtimestamp(float(ts), timezone.utc)
+
+
+class Archive:
+    """The export's JSON files, from a zip or a directory"""
+
+    def __init__(self, path: str):
+        self.zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        self.path = path
+
+    def names(self) -> List[str]:
+        if self.zip:
+            return [name for name in self.zip.namelist() if not name.endswith("/")]
+        return [
+            os.path.relpath(os.path.join(root, name), self.path).replace(os.sep, "/")
+            for root, _, files in os.walk(self.path) for name in files
+        ]
+
+    def load(self, name: str, default=None):
+        try:
+            if self.zip:
+                with self.zip.open(name) as f:
+                    return json.load(f)
+            with open(os.path.join(self.path, name), encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, FileNotFoundError):
+            return default
+
+
+def _content(text: str, usernames: Dict[str, str]) -> str:
+    """Slack markup to the app's plain text (@username, @channel, #channel, bare links)"""
+    text = USER_MENTION.sub(lambda m: f"@{usernames.get(m.group(1), m.group(1))}", text)
+    text = SPECIAL_MENTION.sub(lambda m: "@here" if m.group(1) == "here" else "@channel", text)
+    text = CHANNEL_LINK.sub(r"#\1", text)
+    text = LINK.sub(r"\1", text)
+    return html.unescape(text)
+
+
+def _emoji(name: str) -> Optional[str]:
+    name = name.split("::")[0]  # Skin tone variants
+    if name in EMOJI:
+        return EMOJI[name]
+    code = f":{name}:"
+    return code if len(code) <= models.Reaction.emoji.type.length else None
+
+
+def _insert_ignore(table):
+    if database.IS_SQLITE:
+        return sqlite_insert(table).on_conflict_do_nothing()
+    return pg_insert(table).on_conflict_do_nothing()
+
+
+async def _load(conn, table, rows: List[dict]) -> None:
+    """Insert rows, skipping ones already there (a resumed batch)"""
+    if not rows:
+        return
+    if database.IS_SQLITE:
+        await conn.execute(_insert_ignore(table), rows)
+        return
+    # COPY is the fastest way in but has no ON CONFLICT: copy into a temporary
+    # twin of the table, then insert-select from it
+    columns = list(rows[0])
+    staging = f"import_{table.name}"
+    await conn.exec_driver_sql(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table.name}) ON COMMIT DELETE ROWS"
+    )
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        staging, records=[tuple(row[column] for column in columns) for row in rows], columns=columns
+    )
+    names = ", ".join(columns)
+    await conn.exec_driver_sql(f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {staging} ON CONFLICT DO NOTHING")
+
+
+async def _start(conn, source: str, workspace_id: Optional[uuid.UUID], workspace_name: Optional[str],
+                 owner: Optional[str], force: bool = False) -> dict:
+    """The unfinished Import of this archive, or a new one (and workspace)"""
+    imports = models.Import.__table__
+    result = await conn.execute(select(imports).filter(imports.c.source == source, imports.c.status != "done"))
+    row = result.mappings().first()
+    if row is not None:
+        print(f"Resuming import {row['id']} at file {row['files_done']}")
+        return dict(row)
+    if not force:
+        result = await conn.execute(select(imports).filter(imports.c.source == source, imports.c.status == "done"))
+        done = result.mappings().first()
+        if done is not None:
+            raise SystemExit(f"{source} was already imported into workspace {done['workspace_id']} "
+                             f"(import {done['id']}); pass --force to import it again")
+
+    if workspace_id is None:
+        if not workspace_name or not owner:
+            raise SystemExit("A new import needs --workspace-id, or --workspace-name and --owner")
+        result = await conn.execute(select(models.User.id).filter(models.User.username == owner,
+                                                                  models.User.deleted_at.is_(None)))
+        owner_id = result.scalar()
+        if owner_id is None:
+            raise SystemExit(f"No user {owner!r}")
+        workspace_id = uuid.uuid4()
+        await conn.execute(models.Workspace.__table__.insert().values(
+            id=workspace_id, name=workspace_name, owner_id=owner_id, invite_code=secrets.token_urlsafe(6)
+        ))
+        await conn.execute(models.WorkspaceMember.__table__.insert().values(
+            workspace_id=workspace_id, user_id=owner_id, role="admin"
+        ))
+    else:
+        result = await conn.execute(select(models.Workspace.id).filter(models.Workspace.id == workspace_id,
+                                                                       models.Workspace.deleted_at.is_(None)))
+        if result.scalar() is None:
+            raise SystemExit(f"No workspace {workspace_id}")
+
+    row = {"id": uuid.uuid4(), "source": source, "workspace_id": workspace_id, "status": "running",
+           "files_done": 0, "messages": 0, "reactions": 0, "mentions": 0}
+    await conn.execute(imports.insert().values(**row))
+    return row
+
+
+async def _import_users(conn, archive: Archive, workspace_id: uuid.UUID) -> Tuple[Dict[str, uuid.UUID], Dict[str, str]]:
+    """Slack user id -> user id, and -> username; existing accounts are matched by email"""
+    slack_users = archive.load("users.json", [])
+    emails = {u["id"]: (u.get("profile", {}).get("email") or f"{u['id'].lower()}@slack-import.invalid").lower()
+              for u in slack_users}
+    existing, wanted = {}, sorted(set(emails.values()))
+    for start in range(0, len(wanted), 1000):  # Under the drivers' bind parameter limits
+        result = await conn.execute(
+            select(models.User.email, models.User.id, models.User.username)
+            .filter(func.lower(models.User.email).in_(wanted[start:start + 1000]))
+        )
+        existing.update((email.lower(), (user_id, username)) for email, user_id, username in result)
+    result = await conn.execute(select(models.User.username))
+    taken = set(result.scalars())
+
+    password_hash = get_password_hash(secrets.token_urlsafe(32))  # Unusable until reset; one bcrypt for all
+    user_ids, usernames, rows = {}, {}, []
+    for u in slack_users:
+        email = emails[u["id"]]
+        if email in existing:
+            user_ids[u["id"]], usernames[u["id"]] = existing[email]
+            continue
+        username = re.sub(r"\W", "_", u.get("name") or u["id"])
+        if username in taken:
+            username = f"{username}_{u['id'].lower()}"
+        taken.add(username)
+        user_id = _id(workspace_id, "user", u["id"])
+        rows.append({
+            "id": user_id, "email": email, "username": username, "hashed_password": password_hash,
+            "full_name": u.get("real_name") or u.get("profile", {}).get("real_name"), "role": "user",
+        })
+        user_ids[u["id"]], usernames[u["id"]] = user_id, username
+    await _load(conn, models.User.__table__, rows)
+    await _load(conn, models.WorkspaceMember.__table__, [
+        {"workspace_id": workspace_id, "user_id": user_id, "role": "member"} for user_id in set(user_ids.values())
+    ])
+    return user_ids, usernames
+
+
+async def _import_channels(conn, archive: Archive, workspace_id: uuid.UUID,
+                           user_ids: Dict[str, uuid.UUID]) -> List[Tuple[str, uuid.UUID]]:
+    """(export directory, channel id) of every channel, in archive order"""
+    channels, channel_rows, member_rows = [], [], []
+    for filename, kind in CHANNEL_LISTS:
+        for c in archive.load(filename, []):
+            channel_id = _id(workspace_id, "channel", c["id"])
+            channel_rows.append({
+                "id": channel_id, "name": c.get("name") or "direct_message", "type": kind,
+                "description": (c.get("purpose") or {}).get("value") or None,
+                "owner_id": user_ids.get(c.get("creator") or c.get("user")), "workspace_id": workspace_id,
+                "created_at": _time(c.get("created") or 0),
+            })
+            members = {user_ids[m] for m in c.get("members") or [] if m in user_ids}
+            member_rows.extend({"channel_id": channel_id, "user_id": user_id} for user_id in members)
+            channels.append((c.get("name") or c["id"], channel_id))
+    await _load(conn, models.Channel.__table__, channel_rows)
+    await _load(conn, models.ChannelMember.__table__, member_rows)
+    return channels
+
+
+def _day_files(archive: Archive, channels: List[Tuple[str, uuid.UUID]]) -> List[Tuple[str, uuid.UUID]]:
+    by_directory = {}
+    for name in archive.names():
+        directory, _, filename = name.rpartition("/")
+        if directory and filename.endswith(".json"):
+            by_directory.setdefault(directory, []).append(name)
+    return [(name, channel_id) for directory, channel_id in channels for name in sorted(by_directory.get(directory, []))]
+
+
+def _rows(archive: Archive, name: str, channel_id: uuid.UUID, workspace_id: uuid.UUID, user_ids: Dict[str, uuid.UUID],
+          usernames: Dict[str, str], threads: set, counts: dict) -> Iterator[Tuple[str, dict]]:
+    """("message" | "reaction" | "mention", row) for one channel day file"""
+    slack_channel = name.rpartition("/")[0]
+    for m in sorted(archive.load(name, []), key=lambda m: float(m.get("ts", 0))):
+        author = user_ids.get(m.get("user"))
+        if m.get("type") != "message" or m.get("subtype") not in MESSAGE_SUBTYPES or author is None:
+            counts["skipped"] += 1
+            continue
+        content = _content(m.get("text") or "", usernames)
+        files = [f.get("name") or f.get("title") or "file" for f in m.get("files") or []]
+        counts["files"] += len(files)
+        if not content and files:
+            content = " ".join(f"[{file}]" for file in files)
+        if not content:
+            counts["skipped"] += 1
+            continue
+
+        message_id = _id(workspace_id, "message", slack_channel, m["ts"])
+        created_at = _time(m["ts"])
+        parent_id = None
+        thread_ts = m.get("thread_ts")
+        if thread_ts and thread_ts != m["ts"]:
+            parent_id = _id(workspace_id, "message", slack_channel, thread_ts)
+            if parent_id not in threads:
+                parent_id = None  # Reply to a message that isn't in the export; kept as a top-level message
+        elif thread_ts:
+            threads.add(message_id)
+        yield "message", {"id": message_id, "content": content, "channel_id": channel_id, "user_id": author,
+                          "parent_id": parent_id, "created_at": created_at}
+
+        mentioned = {user_ids[u] for u in USER_MENTION.findall(m.get("text") or "") if u in user_ids} - {author}
+        for user_id in mentioned:
+            yield "mention", {"message_id": message_id, "user_id": user_id, "created_at": created_at}
+
+        reacted = set()  # Several names map to one emoji ("+1", "thumbsup", skin tones): one row per user
+        for reaction in m.get("reactions") or []:
+            emoji = _emoji(reaction["name"])
+            if emoji is None:
+                counts["skipped_reactions"] += 1
+                continue
+            for slack_user in reaction.get("users") or []:
+                if slack_user in user_ids and (emoji, slack_user) not in reacted:
+                    reacted.add((emoji, slack_user))
+                    yield "reaction", {
+                        "id": _id(workspace_id, "reaction", slack_channel, m["ts"], emoji, slack_user),
+                        "message_id": message_id, "user_id": user_ids[slack_user], "emoji": emoji,
+                        "created_at": created_at,
+                    }
+
+
+async def run_import(path: str, workspace_id: Optional[uuid.UUID] = None, workspace_name: Optional[str] = None,
+                     owner: Optional[str] = None, batch_size: int = BATCH_SIZE, force: bool = False) -> dict:
+    started = time.perf_counter()
+    source = os.path.abspath(path)
+    archive = Archive(source)
+    imports = models.Import.__table__
+
+    async with database.engine.begin() as conn:
+        state = await _start(conn, source, workspace_id, workspace_name, owner, force)
+    workspace_id = state["workspace_id"]
+    # Users and channels are rewritten on every run; the ids make it a no-op the second time
+    async with database.engine.begin() as conn:
+        user_ids, usernames = await _import_users(conn, archive, workspace_id)
+        channels = await _import_channels(conn, archive, workspace_id, user_ids)
+    files = _day_files(archive, channels)
+    print(f"{len(user_ids)} users, {len(channels)} channels, {len(files)} day files")
+
+    counts = {"messages": state["messages"], "reactions": state["reactions"], "mentions": state["mentions"],
+              "skipped": 0, "skipped_reactions": 0, "files": 0}
+    threads, thread_channel = set(), None  # Thread roots of the channel being read
+    batch = {"message": [], "reaction": [], "mention": []}
+    files_done = state["files_done"]
+
+    async def flush(files_done: int) -> None:
+        async with database.engine.begin() as conn:
+            # Parents before replies, messages before what points at them
+            await _load(conn, models.Message.__table__, batch["message"])
+            await _load(conn, models.Reaction.__table__, batch["reaction"])
+            await _load(conn, models.message_mentions, batch["mention"])
+            counts["messages"] += len(batch["message"])
+            counts["reactions"] += len(batch["reaction"])
+            counts["mentions"] += len(batch["mention"])
+            await conn.execute(update(imports).filter(imports.c.id == state["id"]).values(
+                files_done=files_done, messages=counts["messages"], reactions=counts["reactions"],
+                mentions=counts["mentions"],
+            ))
+        for rows in batch.values():
+            rows.clear()
+        print(f"  {files_done}/{len(files)} files, {counts['messages']} messages "
+              f"({time.perf_counter() - started:.0f}s)", flush=True)
+
+    for position in range(files_done, len(files)):
+        name, channel_id = files[position]
+        if channel_id != thread_channel:
+            threads, thread_channel = set(), channel_id
+            if position > 0 and files[position - 1][1] == channel_id:
+                # Resuming mid-channel: replies can point at roots committed before the crash
+                async with database.engine.connect() as conn:
+                    result = await conn.execute(select(models.Message.id).filter(
+                        models.Message.channel_id == channel_id, models.Message.parent_id.is_(None)
+                    ))
+                    threads = set(result.scalars())
+        for kind, row in _rows(archive, name, channel_id, workspace_id, user_ids, usernames, threads, counts):
+            batch[kind].append(row)
+        if len(batch["message"]) >= batch_size:
+            await flush(position + 1)
+    await flush(len(files))
+
+    # Derived state, once for the whole import: history starts out read, and
+    # the planner learns the new table sizes
+    async with database.engine.begin() as conn:
+        channel_ids = [channel_id for _, channel_id in channels]
+        members = models.ChannelMember
+        for start in range(0, len(channel_ids), 500):
+            await conn.execute(update(members).filter(
+                members.channel_id.in_(channel_ids[start:start + 500]), members.last_read_at.is_(None)
+            ).values(last_read_at=func.now()))
+        await conn.execute(update(imports).filter(imports.c.id == state["id"]).values(
+            status="done", finished_at=func.now()
+        ))
+    async with database.engine.connect() as conn:
+        await conn.execute(text("ANALYZE" if database.IS_SQLITE else "ANALYZE messages, reactions, message_mentions"))
+        await conn.commit()
+
+    summary = {"workspace_id": str(workspace_id), "users": len(user_ids), "channels": len(channels), **counts,
+               "seconds": round(time.perf_counter() - started, 1)}
+    print(f"Imported {summary}")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archive", help="export zip or directory")
+    parser.add_argument("--workspace-id", type=uuid.UUID, help="import into this existing workspace")
+    parser.add_argument("--workspace-name", help="create a workspace with this name")
+    parser.add_argument("--owner", help="username owning the new workspace")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="messages per transaction")
+    parser.add_argument("--force", action="store_true", help="import an archive that was already imported")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            await run_import(args.archive, args.workspace_id, args.workspace_name, args.owner, args.batch_size,
+                             args.force)
+        finally:
+            await database.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import abc
+import asyncio
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import anyio
+import httpx
+
+import logs
+import thumbnails
+from security import SECRET_KEY
+
+log = logs.get_logger("storage")
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # 'local' or 's3'
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+PRESIGN_EXPIRES_SECONDS = int(os.getenv("PRESIGN_EXPIRES_SECONDS", 900))
+# Attachment links (/attachments/{id}) are signed per attachment, since <img> and
+# <a> can't send the Authorization header. Expiry is rounded up to the next window
+# boundary plus one, so a link stays valid for one to two windows and is the same
+# URL (one browser cache entry) for a whole window.
+ATTACHMENT_URL_EXPIRES_SECONDS = int(os.getenv("ATTACHMENT_URL_EXPIRES_SECONDS", 7200))
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://localhost:9000")
+# Endpoint handed to clients, when it differs from the one the API reaches (e.g. docker network names)
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL", S3_ENDPOINT_URL)
+S3_BUCKET = os.getenv("S3_BUCKET", "diligental")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+
+# Local-disk uploads are recorded as "/static/<key>" in Attachment.file_path (the
+# mount older releases served them from). It only locates the blob: clients get
+# the access-checked /attachments/{id} links, never the path.
+LOCAL_URL_PREFIX = "/static/"
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(abc.ABC):
+    """Blob store for attachments. Keys look like "2025/12/<uuid>.ext"."""
+
+    name = "base"
+
+    def file_path_for(self, key: str) -> str:
+        """Value persisted in Attachment.file_path"""
+        return key
+
+    @abc.abstractmethod
+    async def save(self, key: str, fileobj: BinaryIO, content_type: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def presign_put(self, key: str, content_type: str, content_length: int,
+                    expires: int = PRESIGN_EXPIRES_SECONDS) -> Tuple[str, Dict[str, str]]:
+        """URL and headers a client uses to PUT the blob directly. The type and
+        length are part of the signature: the store refuses any other."""
+
+    def presign_get(self, key: str, expires: int = PRESIGN_EXPIRES_SECONDS) -> Optional[str]:
+        """Direct download URL, or None when the API must serve the bytes itself"""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    @abc.abstractmethod
+    async def ensure_derivatives(self, key: str) -> Dict[str, str]:
+        """Build missing thumbnail/preview derivatives; returns variant -> key"""
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def file_path_for(self, key: str) -> str:
+        # Same locator as rows written before the /static mount was removed
+        return f"{LOCAL_URL_PREFIX}{key}"
+
+    def local_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise StorageError("Invalid storage key")
+        return path
+
+    def _write(self, key: str, fileobj: BinaryIO) -> int:
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(fileobj, buffer, 1024 * 1024)
+        return os.path.getsize(path)
+
+    async def save(self, key: str, fileobj: BinaryIO, content_type: str) -> int:
+        return await anyio.to_thread.run_sync(self._write, key, fileobj)
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await anyio.to_thread.run_sync(os.stat, self.local_path(key))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, key: str) -> None:
+        try:
+            await anyio.to_thread.run_sync(os.remove, self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def presign_put(self, key: str, content_type: str, content_length: int,
+                    expires: int = PRESIGN_EXPIRES_SECONDS) -> Tuple[str, Dict[str, str]]:
+        # No external store to hand off to: the client PUTs to our own
+        # signed endpoint (routes/files.py) instead of the multipart form.
+        expires_at = int(time.time()) + expires
+        signature = sign_local_upload(key, content_type, content_length, expires_at)
+        query = f"expires={expires_at}&size={content_length}&signature={signature}"
+        return f"/uploads/local/{quote(key)}?{query}", {"Content-Type": content_type}
+
+    async def ensure_derivatives(self, key: str) -> Dict[str, str]:
+        await thumbnails.ensure_derivatives(self.local_path(key))
+        return {v: thumbnails.derivative_path(key, v) for v in thumbnails.THUMBNAIL_VARIANTS}
+
+
+def _sign(method: str, target: str, expires_at: int) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{method}\n{target}\n{expires_at}".encode(), hashlib.sha256).hexdigest()
+
+
+def _verify(method: str, target: str, expires_at: int, signature: str) -> bool:
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(_sign(method, target, expires_at), signature)
+
+
+def sign_local_upload(key: str, content_type: str, content_length: int, expires_at: int) -> str:
+    return _sign("PUT", f"{key}\n{content_type}\n{content_length}", expires_at)
+
+
+def verify_local_upload(key: str, content_type: str, content_length: int, expires_at: int, signature: str) -> bool:
+    return _verify("PUT", f"{key}\n{content_type}\n{content_length}", expires_at, signature)
+
+
+def attachment_url(attachment_id, variant: Optional[str] = None) -> str:
+    """Signed /attachments/{id} link; only handed out in responses that passed a channel-access check"""
+    window = ATTACHMENT_URL_EXPIRES_SECONDS
+    expires_at = (int(time.time()) // window + 2) * window
+    signature = _sign("GET", f"attachments/{attachment_id}", expires_at)
+    variant_param = f"variant={variant}&" if variant else ""
+    return f"/attachments/{attachment_id}?{variant_param}expires={expires_at}&signature={signature}"
+
+
+def verify_attachment_url(attachment_id, expires_at: int, signature: str) -> bool:
+    return _verify("GET", f"attachments/{attachment_id}", expires_at, signature)
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible store (AWS S3, MinIO, R2, ...) using SigV4 presigned URLs.
+
+    The API signs URLs locally (no SDK, no network round trip) and uses the
+    same presigned URLs for its own server-side calls.
+    """
+
+    name = "s3"
+
+    def __init__(self, endpoint_url: str = S3_ENDPOINT_URL, bucket: str = S3_BUCKET, region: str = S3_REGION,
+                 access_key_id: str = S3_ACCESS_KEY_ID, secret_access_key: str = S3_SECRET_ACCESS_KEY,
+                 public_endpoint_url: Optional[str] = S3_PUBLIC_ENDPOINT_URL):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.public_endpoint_url = (public_endpoint_url or endpoint_url).rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self._client: Optional[httpx.AsyncClient] = None
+        # Derivative keys known to exist, and in-flight builds keyed by source key
+        self._built: set = set()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=60)
+        return self._client
+
+    def _signing_key(self, datestamp: str) -> bytes:
+        def _hmac(key: bytes, msg: str) -> bytes:
+            return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+        k_date = _hmac(f"AWS4{self.secret_access_key}".encode(), datestamp)
+        k_region = _hmac(k_date, self.region)
+        k_service = _hmac(k_region, "s3")
+        return _hmac(k_service, "aws4_request")
+
+    def presign(self, method: str, key: str, expires: int = PRESIGN_EXPIRES_SECONDS, public: bool = False,
+                headers: Optional[Dict[str, str]] = None) -> str:
+        """SigV4 query-string presigned URL (path-style addressing). The request
+        must then carry `headers` with exactly these values."""
+        endpoint = self.public_endpoint_url if public else self.endpoint_url
+        signed = {"host": urlparse(endpoint).netloc}
+        signed.update((name.lower(), value.strip()) for name, value in (headers or {}).items())
+        signed_headers = ";".join(sorted(signed))
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = now.strftime("%Y%m%d")
+        credential_scope = f"{datestamp}/{self.region}/s3/aws4_request"
+
+        canonical_uri = quote(f"/{self.bucket}/{key}", safe="/~")
+        params = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key_id}/{credential_scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": signed_headers,
+        }
+        canonical_query = "&".join(
+            f"{quote(k, safe='~')}={quote(v, safe='~')}" for k, v in sorted(params.items())
+        )
+        canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in sorted(signed))
+        canonical_request = "\n".join([
+            method, canonical_uri, canonical_query, canonical_headers, signed_headers, "UNSIGNED-PAYLOAD"
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, credential_scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = hmac.new(self._signing_key(datestamp), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return f"{endpoint}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+    async def save(self, key: str, fileobj: BinaryIO, content_type: str) -> int:
+        data = await anyio.to_thread.run_sync(fileobj.read)
+        response = await self.client.put(self.presign("PUT", key), content=data, headers={"Content-Type": content_type})
+        if response.status_code >= 300:
+            raise StorageError(f"S3 PUT failed ({response.status_code}): {response.text[:200]}")
+        return len(data)
+
+    async def size(self, key: str) -> Optional[int]:
+        response = await self.client.head(self.presign("HEAD", key))
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 300:
+            raise StorageError(f"S3 HEAD failed ({response.status_code})")
+        return int(response.headers.get("content-length", 0))
+
+    async def delete(self, key: str) -> None:
+        response = await self.client.delete(self.presign("DELETE", key))
+        if response.status_code >= 300 and response.status_code != 404:
+            raise StorageError(f"S3 DELETE failed ({response.status_code})")
+
+    def presign_put(self, key: str, content_type: str, content_length: int,
+                    expires: int = PRESIGN_EXPIRES_SECONDS) -> Tuple[str, Dict[str, str]]:
+        # Browsers set Content-Length from the body themselves; it can't be passed along
+        signed = {"Content-Type": content_type, "Content-Length": str(content_length)}
+        return self.presign("PUT", key, expires, public=True, headers=signed), {"Content-Type": content_type}
+
+    def presign_get(self, key: str, expires: int = PRESIGN_EXPIRES_SECONDS) -> Optional[str]:
+        return self.presign("GET", key, expires, public=True)
+
+    async def _download(self, key: str, path: str) -> None:
+        async with self.client.stream("GET", self.presign("GET", key)) as response:
+            if response.status_code >= 300:
+                raise StorageError(f"S3 GET failed ({response.status_code})")
+            with open(path, "wb") as out:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    out.write(chunk)
+
+    async def _build_derivatives(self, key: str, missing: Dict[str, str]) -> None:
+        # Pull the blob into a scratch dir, render in the process pool, push derivatives back
+        with tempfile.TemporaryDirectory() as scratch:
+            source = os.path.join(scratch, os.path.basename(key))
+            await self._download(key, source)
+            rendered = await thumbnails.ensure_derivatives(source)
+            for variant, derivative_key in missing.items():
+                with open(rendered[variant], "rb") as f:
+                    await self.save(derivative_key, f, f"image/{thumbnails.THUMBNAIL_FORMAT}")
+                self._built.add(derivative_key)
+
+    async def ensure_derivatives(self, key: str) -> Dict[str, str]:
+        keys = {v: thumbnails.derivative_path(key, v) for v in thumbnails.THUMBNAIL_VARIANTS}
+        missing = {}
+        for variant, derivative_key in keys.items():
+            if derivative_key in self._built:
+                continue
+            if await self.size(derivative_key) is not None:
+                self._built.add(derivative_key)
+                continue
+            missing[variant] = derivative_key
+
+        if missing:
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._build_derivatives(key, missing))
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            await asyncio.shield(future)
+        return keys
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_backends: Dict[str, StorageBackend] = {}
+# Strong references to fire-and-forget tasks
+_tasks: set = set()
+
+
+def get_storage(name: Optional[str] = None) -> StorageBackend:
+    name = name or STORAGE_BACKEND
+    if name not in _backends:
+        if name == "local":
+            _backends[name] = LocalStorage()
+        elif name == "s3":
+            _backends[name] = S3Storage()
+        else:
+            raise StorageError(f"Unknown storage backend: {name}")
+    return _backends[name]
+
+
+def resolve(file_path: str) -> Tuple[StorageBackend, str]:
+    """Map an Attachment.file_path to (backend, key).
+
+    "/static/..." paths always live on local disk, so switching the default
+    backend does not orphan existing uploads.
+    """
+    if file_path.startswith(LOCAL_URL_PREFIX):
+        return get_storage("local"), file_path[len(LOCAL_URL_PREFIX):]
+    return get_storage(), file_path
+
+
+def schedule_derivatives(backend: StorageBackend, key: str) -> None:
+    """Fire-and-forget derivative generation after an upload"""
+
+    async def _run():
+        try:
+            await backend.ensure_derivatives(key)
+        except Exception:
+            log.exception("thumbnail_failed", key=key)
+
+    task = asyncio.create_task(_run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def close() -> None:
+    for backend in _backends.values():
+        if isinstance(backend, S3Storage):
+            await backend.close()
@@ -0,0 +1,143 @@
+"""App tests: the ASGI app in-process against a migrated SQLite database.
+
+    python -m pytest          # from backend/
+
+No server and no Redis: the message cache stays off and jobs run on the
+in-process queue. Tests of the Redis paths take `redis_server`/`redis_client`,
+a private in-process fakeredis (with Lua, for the scripts). One database and
+one event loop serve the whole session, so every test makes its own users and
+workspaces (names from `unique`).
+"""
+import os
+import tempfile
+import uuid
+from typing import NamedTuple
+
+# Must be set before the app (and database engine) is imported
+_DB_DIR = tempfile.mkdtemp(prefix="diligental-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_DB_DIR, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_DB_DIR, "uploads")
+os.environ["JOBS_BACKEND"] = "local"
+os.environ["SQL_INSTRUMENTATION"] = "false"
+os.environ["TRACING_SAMPLE_RATIO"] = "0"
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import database  # noqa: E402
+import jobs  # noqa: E402
+import main  # noqa: E402
+import migrations  # noqa: E402
+
+
+class Member(NamedTuple):
+    id: str
+    username: str
+    headers: dict
+
+
+def unique(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(anyio_backend):
+    await migrations.upgrade(database.engine)
+    await jobs.start()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+    await jobs.stop()
+    await database.dispose()
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+async def redis_client(redis_server):
+    client = fakeredis.FakeAsyncRedis(server=redis_server)
+    yield client
+    await client.aclose()
+
+
+class Api:
+    """Shortcuts for the setup most tests share"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def register(self, prefix: str = "user") -> Member:
+        username = unique(prefix)
+        response = await self.client.post(
+            "/auth/register", json={"email": f"{username}@example.com", "username": username, "password": "secret"}
+        )
+        assert response.status_code == 200, response.text
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        me = (await self.client.get("/users/me", headers=headers)).json()
+        return Member(me["id"], username, headers)
+
+    async def login(self, username: str, password: str) -> dict:
+        response = await self.client.post("/auth/token", data={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def workspace(self, owner: Member, *members: Member) -> str:
+        response = await self.client.post("/workspaces/", json={"name": unique("ws")}, headers=owner.headers)
+        assert response.status_code == 200, response.text
+        workspace_id = response.json()["id"]
+        for member in members:
+            await self.join(member, workspace_id, owner)
+        return workspace_id
+
+    async def join(self, member: Member, workspace_id: str, inviter: Member) -> None:
+        invite = (await self.client.get(f"/workspaces/{workspace_id}/invite", headers=inviter.headers)).json()
+        response = await self.client.post("/workspaces/join", json=invite, headers=member.headers)
+        assert response.status_code == 200, response.text
+
+    async def channel(self, owner: Member, workspace_id: str, type: str = "public") -> dict:
+        response = await self.client.post(
+            "/channels/", json={"name": unique("ch"), "type": type, "workspace_id": workspace_id}, headers=owner.headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    async def dm(self, member: Member, workspace_id: str, other: Member) -> dict:
+        response = await self.client.post(
+            "/channels/dm", json={"workspace_id": workspace_id, "target_user_id": other.id}, headers=member.headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    async def post(self, member: Member, channel_id: str, content: str, **fields) -> dict:
+        response = await self.client.post(
+            f"/channels/{channel_id}/messages",
+            json={"content": content, "channel_id": channel_id, **fields}, headers=member.headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    async def boot(self, member: Member, workspace_id: str, **params) -> dict:
+        response = await self.client.get("/boot", params={"workspace_id": workspace_id, **params}, headers=member.headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    async def sync(self, member: Member, workspace_id: str, since: int, **params) -> dict:
+        response = await self.client.get(
+            "/sync", params={"workspace_id": workspace_id, "since": since, **params}, headers=member.headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+
+@pytest.fixture
+def api(client):
+    return Api(client)
@@ -0,0 +1,165 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+import database
+import deletions
+import jobs
+import models
+from ws_manager import manager
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Deletion jobs held back, so a test sees the pending state and runs them itself"""
+    held = []
+    enqueue = jobs.enqueue
+
+    async def hold(name, payload):
+        if name == "deletions.run":
+            held.append(json.loads(json.dumps(payload, default=str)))  # What a worker gets
+        else:
+            await enqueue(name, payload)
+
+    monkeypatch.setattr(jobs, "enqueue", hold)
+    return held
+
+
+class _Socket:
+    """Stands in for an open WebSocket in the connection manager"""
+    def __init__(self):
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def _run(api, headers: dict, queued) -> None:
+    """Run the held deletion job and check it finished"""
+    [payload] = queued
+    await deletions.run(payload)
+    response = await api.client.get(f"/deletions/{payload['deletion_id']}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "done"
+    assert response.json()["rows_deleted"] == response.json()["rows_total"]
+
+
+async def _count(model, **filters) -> int:
+    table = getattr(model, "__table__", model)
+    async with database.async_session_maker() as db:
+        query = select(func.count()).select_from(table)
+        for column, value in filters.items():
+            query = query.filter(table.c[column] == uuid.UUID(value))
+        return (await db.execute(query)).scalar_one()
+
+
+async def test_deleted_channel_is_hidden_until_its_rows_are_gone(api, queued):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    parent = await api.post(alice, channel["id"], f"@{bob.username} first")
+    await api.post(bob, channel["id"], "a reply", parent_id=parent["id"])
+    cursor = (await api.boot(bob, workspace_id, limit=0))["cursor"]
+
+    response = await api.client.delete(f"/channels/{channel['id']}", headers=alice.headers)
+    assert response.status_code == 202, response.text
+    assert response.json()["status"] == "pending"
+
+    # Pending: the rows are still there but nobody sees them
+    assert await _count(models.Message, channel_id=channel["id"]) == 2
+    response = await api.client.get(f"/channels/{channel['id']}/messages", headers=bob.headers)
+    assert response.status_code == 404
+    channels = await api.client.get("/channels/", params={"workspace_id": workspace_id}, headers=bob.headers)
+    assert channel["id"] not in [item["id"] for item in channels.json()]
+    assert (await api.client.get("/users/me/mentions", headers=bob.headers)).json() == []
+    sync = await api.sync(bob, workspace_id, cursor)
+    assert sync["removed_channels"] == [channel["id"]]
+
+    await _run(api, alice.headers, queued)
+    assert await _count(models.Message, channel_id=channel["id"]) == 0
+    assert await _count(models.Channel, id=channel["id"]) == 0
+
+
+async def test_deleted_user_is_hidden_until_their_rows_are_gone(api, queued):
+    admin = await api.login("admin", "admin123")
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    await api.post(bob, channel["id"], "soon gone")
+    await api.post(alice, channel["id"], f"@{bob.username} still here")
+
+    response = await api.client.delete(f"/users/{bob.id}", headers=admin)
+    assert response.status_code == 202, response.text
+
+    # Pending: signed out, out of member lists, name free again
+    assert (await api.client.get("/users/me", headers=bob.headers)).status_code == 401
+    members = await api.client.get(f"/workspaces/{workspace_id}/members", headers=alice.headers)
+    assert bob.id not in [item["user_id"] for item in members.json()]
+    response = await api.client.post(
+        "/auth/register", json={"email": f"{bob.username}@example.com", "username": bob.username, "password": "x"}
+    )
+    assert response.status_code == 200, response.text
+    assert await _count(models.Message, user_id=bob.id) == 1
+
+    await _run(api, admin, queued)
+    assert await _count(models.Message, user_id=bob.id) == 0
+    assert await _count(models.message_mentions, user_id=bob.id) == 0
+    assert await _count(models.User, id=bob.id) == 0
+
+
+async def test_deleted_workspace_is_hidden_until_its_rows_are_gone(api, queued):
+    alice, bob, carol = await api.register("alice"), await api.register("bob"), await api.register("carol")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    await api.post(bob, channel["id"], "hello")
+    invite = (await api.client.get(f"/workspaces/{workspace_id}/invite", headers=alice.headers)).json()
+
+    # Members can't, the creator (an admin) can
+    assert (await api.client.delete(f"/workspaces/{workspace_id}", headers=bob.headers)).status_code == 403
+    response = await api.client.delete(f"/workspaces/{workspace_id}", headers=alice.headers)
+    assert response.status_code == 202, response.text
+
+    # Pending: gone from every read
+    assert (await api.client.get(f"/workspaces/{workspace_id}", headers=bob.headers)).status_code == 403
+    workspaces = (await api.client.get("/workspaces/", headers=bob.headers)).json()
+    assert workspace_id not in [item["id"] for item in workspaces]
+    assert (await api.client.get(f"/channels/{channel['id']}/messages", headers=bob.headers)).status_code == 404
+    assert (await api.client.post("/workspaces/join", json=invite, headers=carol.headers)).status_code == 404
+    assert await _count(models.Channel, workspace_id=workspace_id) == 1
+
+    await _run(api, alice.headers, queued)
+    assert await _count(models.Message, channel_id=channel["id"]) == 0
+    assert await _count(models.Channel, workspace_id=workspace_id) == 0
+    assert await _count(models.WorkspaceMember, workspace_id=workspace_id) == 0
+    assert await _count(models.Workspace, id=workspace_id) == 0
+
+
+async def test_deletion_closes_open_sockets(api, queued):
+    admin = await api.login("admin", "admin123")
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel, other = await api.channel(alice, workspace_id), await api.channel(alice, workspace_id)
+    alice_socket, bob_socket, bob_elsewhere, bob_notifications = _Socket(), _Socket(), _Socket(), _Socket()
+    await manager.connect(alice_socket, channel["id"], alice.id)
+    await manager.connect(bob_socket, channel["id"], bob.id)
+    await manager.connect(bob_elsewhere, other["id"], bob.id)
+    await manager.connect_user(bob_notifications, bob.id)
+
+    response = await api.client.delete(f"/channels/{channel['id']}", headers=alice.headers)
+    assert response.status_code == 202, response.text
+    assert alice_socket.closed_with == bob_socket.closed_with == 4004
+    assert channel["id"] not in manager.active_connections
+    assert bob_elsewhere.closed_with is None
+
+    response = await api.client.delete(f"/users/{bob.id}", headers=admin)
+    assert response.status_code == 202, response.text
+    assert bob_elsewhere.closed_with == bob_notifications.closed_with == 4003
+    assert other["id"] not in manager.active_connections and bob.id not in manager.user_connections
+    assert manager.get_user_channel(bob.id) is None
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+import jobs
+
+pytestmark = pytest.mark.anyio
+
+_attempts = {}
+_gates = {}
+
+
+@jobs.job("tests.flaky")
+async def flaky(payload: dict) -> None:
+    """Fails until its attempt number reaches payload["succeed_on"] (0: always fails)"""
+    key = payload["key"]
+    _attempts[key] = _attempts.get(key, 0) + 1
+    if payload["succeed_on"] == 0 or _attempts[key] < payload["succeed_on"]:
+        raise RuntimeError(f"attempt {_attempts[key]} failed")
+
+
+@jobs.job("tests.gated")
+async def gated(payload: dict) -> None:
+    """Runs until the test opens its gate"""
+    started, release = _gates[payload["key"]]
+    started.set()
+    await release.wait()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(jobs, "JOBS_MAX_ATTEMPTS", 3)
+
+
+async def _eventually(predicate, timeout: float = 5) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+# --- In-process queue (the suite's backend) ---------------------------------------
+
+async def test_local_job_is_retried_until_it_succeeds(client):
+    key = str(uuid.uuid4())
+    await jobs.enqueue("tests.flaky", {"key": key, "succeed_on": 3})
+    await _eventually(lambda: _attempts.get(key) == 3)
+    await asyncio.sleep(0.1)
+    assert _attempts[key] == 3
+    assert key not in json.dumps((await jobs.stats())["local"]["recent_dead"])
+
+
+async def test_local_job_is_dead_lettered_after_the_last_attempt(client):
+    key = str(uuid.uuid4())
+    await jobs.enqueue("tests.flaky", {"key": key, "succeed_on": 0})
+
+    def dead():
+        return [job for job in jobs._local_dead if job["payload"]["key"] == key]
+
+    await _eventually(dead)
+    [job] = dead()
+    assert job["attempts"] == 3 and job["error"] == "RuntimeError: attempt 3 failed"
+    assert _attempts[key] == 3
+
+
+async def test_payload_arrives_as_json(client):
+    key, received = str(uuid.uuid4()), []
+
+    @jobs.job("tests.echo")
+    async def echo(payload: dict) -> None:
+        received.append(payload)
+
+    await jobs.enqueue("tests.echo", {"key": key, "id": uuid.UUID(key)})
+    await _eventually(lambda: received)
+    assert received == [{"key": key, "id": key}]
+
+
+# --- Redis Streams queue ----------------------------------------------------------
+
+@pytest.fixture
+async def stream(redis_client, monkeypatch):
+    """jobs on a private fakeredis, driven step by step (no worker loops)"""
+    await jobs._create_group(redis_client)
+    monkeypatch.setattr(jobs, "_redis", redis_client)
+    return redis_client
+
+
+async def _claim(stream, consumer: str = jobs._CONSUMER) -> list:
+    """What a worker's XREADGROUP hands out"""
+    entries = await stream.xreadgroup(jobs._GROUP, consumer, {jobs.JOBS_STREAM: ">"}, count=10)
+    return [message for _, messages in entries or () for message in messages]
+
+
+async def _promote(stream) -> None:
+    await asyncio.sleep(0.05)  # Past the (shortened) retry delay
+    await jobs._promote_due_retries()
+
+
+async def _pending(stream) -> list:
+    return await stream.xpending_range(jobs.JOBS_STREAM, jobs._GROUP, "-", "+", 10)
+
+
+async def test_redis_job_is_retried_with_its_attempt_count(stream):
+    key = str(uuid.uuid4())
+    await jobs.enqueue("tests.flaky", {"key": key, "succeed_on": 2})
+    [entry] = await _claim(stream)
+    await jobs._run_entry(*entry)
+
+    # Failed: acked and deleted, its retry waiting in the delayed set
+    assert await stream.xlen(jobs.JOBS_STREAM) == 0 and await _pending(stream) == []
+    assert await stream.zcard(jobs._DELAYED_KEY) == 1
+
+    await _promote(stream)
+    [entry] = await _claim(stream)
+    assert jobs._decode(*entry).attempts == 1
+    await jobs._run_entry(*entry)
+    assert _attempts[key] == 2
+    assert await stream.xlen(jobs.JOBS_STREAM) == 0 and await _pending(stream) == []
+    assert await stream.zcard(jobs._DELAYED_KEY) == 0 and await stream.xlen(jobs._DEAD_KEY) == 0
+
+
+async def test_redis_job_is_dead_lettered_after_the_last_attempt(stream):
+    key = str(uuid.uuid4())
+    await jobs.enqueue("tests.flaky", {"key": key, "succeed_on": 0})
+    for _ in range(3):
+        [entry] = await _claim(stream)
+        await jobs._run_entry(*entry)
+        await _promote(stream)
+
+    assert await _claim(stream) == [] and await stream.zcard(jobs._DELAYED_KEY) == 0
+    [dead] = (await jobs.stats())["redis"]["recent_dead"]
+    assert dead["name"] == "tests.flaky" and dead["attempts"] == "3"
+    assert json.loads(dead["payload"])["key"] == key
+    assert dead["error"] == "RuntimeError: attempt 3 failed"
+
+
+async def test_expired_lease_is_reclaimed_as_a_failed_attempt(stream, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_LEASE_SECONDS", 0.05)
+    key = str(uuid.uuid4())
+    await jobs.enqueue("tests.flaky", {"key": key, "succeed_on": 1})
+    [entry] = await _claim(stream, consumer="crashed-worker")
+
+    await jobs._reclaim_expired()  # Still within its lease
+    assert [item["consumer"] for item in await _pending(stream)] == [b"crashed-worker"]
+
+    await asyncio.sleep(0.1)
+    await jobs._reclaim_expired()  # XAUTOCLAIM takes it over and counts the attempt
+    assert await _pending(stream) == [] and await stream.xlen(jobs.JOBS_STREAM) == 0
+    await _promote(stream)
+    [retry] = await _claim(stream)
+    assert jobs._decode(*retry).attempts == 1
+    await jobs._run_entry(*retry)
+    assert _attempts[key] == 1
+
+
+async def test_running_job_keeps_its_lease_until_it_is_taken(stream, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_LEASE_SECONDS", 0.06)  # Renewed every 20ms
+    key = str(uuid.uuid4())
+    _gates[key] = started, release = asyncio.Event(), asyncio.Event()
+    await jobs.enqueue("tests.gated", {"key": key})
+    [entry] = await _claim(stream)
+    entry_id = entry[0]
+    task = asyncio.create_task(jobs._run_entry(*entry))
+    await started.wait()
+
+    # Renewals keep it from being reclaimed while it runs
+    await asyncio.sleep(0.15)
+    await jobs._reclaim_expired()
+    assert [item["consumer"] for item in await _pending(stream)] == [jobs._CONSUMER.encode()]
+
+    # Taken over after a stall: this worker must not ack or retry it when it finishes
+    await stream.xclaim(jobs.JOBS_STREAM, jobs._GROUP, "other-worker", 0, [entry_id], justid=True)
+    await asyncio.sleep(0.05)
+    release.set()
+    await task
+    assert [item["consumer"] for item in await _pending(stream)] == [b"other-worker"]
+    assert await stream.zcard(jobs._DELAYED_KEY) == 0
@@ -0,0 +1,77 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _mentions(api, member, **params) -> list:
+    response = await api.client.get("/users/me/mentions", params=params, headers=member.headers)
+    assert response.status_code == 200, response.text
+    return [item["id"] for item in response.json()]
+
+
+async def test_mentions_page_with_before(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    posted = [(await api.post(alice, channel["id"], f"@{bob.username} number {i}"))["id"] for i in range(5)]
+    await api.post(alice, channel["id"], "no mention here")
+
+    everything = await _mentions(api, bob)
+    assert sorted(everything) == sorted(posted)
+
+    pages, before = [], None
+    while True:
+        page = await _mentions(api, bob, limit=2, **({"before": before} if before else {}))
+        if not page:
+            break
+        assert len(page) <= 2
+        pages.append(page)
+        before = page[-1]
+    assert [item for page in pages for item in page] == everything
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+async def test_mentions_before_an_unknown_message_is_empty(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    other = await api.post(alice, channel["id"], "not a mention")
+    await api.post(alice, channel["id"], f"@{bob.username} hi")
+    assert await _mentions(api, bob, before=other["id"]) == []
+
+
+async def test_mentions_leave_out_channels_the_user_cannot_see(api):
+    alice, bob, carol = await api.register("alice"), await api.register("bob"), await api.register("carol")
+    workspace_id = await api.workspace(alice, bob, carol)
+    public = await api.channel(alice, workspace_id)
+    dm = await api.dm(alice, workspace_id, carol)
+    visible = await api.post(alice, public["id"], f"@{bob.username} in public")
+    await api.post(alice, dm["id"], f"@{bob.username} behind bob's back")
+
+    assert await _mentions(api, bob) == [visible["id"]]
+
+
+async def test_mentions_filter_by_workspace(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    first, second = await api.workspace(alice, bob), await api.workspace(alice, bob)
+    in_first = await api.post(alice, (await api.channel(alice, first))["id"], f"@{bob.username} one")
+    in_second = await api.post(alice, (await api.channel(alice, second))["id"], f"@{bob.username} two")
+
+    assert await _mentions(api, bob, workspace_id=first) == [in_first["id"]]
+    assert await _mentions(api, bob, workspace_id=second) == [in_second["id"]]
+
+
+async def test_each_user_is_mentioned_once_and_never_the_author(api):
+    alice, bob, carol = await api.register("alice"), await api.register("bob"), await api.register("carol")
+    workspace_id = await api.workspace(alice, bob, carol)
+    channel = await api.channel(alice, workspace_id)
+    parsed = await api.post(alice, channel["id"], f"@{bob.username} @{bob.username} @{alice.username} @{carol.username}")
+    explicit = await api.post(alice, channel["id"], "hi", mentioned_user_ids=[bob.id, bob.id, alice.id])
+
+    assert sorted(user["id"] for user in parsed["mentioned_users"]) == sorted([bob.id, carol.id])
+    assert [user["id"] for user in explicit["mentioned_users"]] == [bob.id]
+    assert sorted(await _mentions(api, bob)) == sorted([parsed["id"], explicit["id"]])
+    assert await _mentions(api, carol) == [parsed["id"]]
+    assert await _mentions(api, alice) == []
+    notifications = (await api.client.get("/notifications/", headers=bob.headers)).json()
+    assert sorted(item["related_id"] for item in notifications) == sorted([parsed["id"], explicit["id"]])
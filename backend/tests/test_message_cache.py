@@ -0,0 +1,132 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import fakeredis
+import pytest
+from sqlalchemy import update
+
+import database
+import message_cache
+import models
+
+pytestmark = pytest.mark.anyio
+
+PAGE = 3
+
+
+@pytest.fixture
+def cache(redis_client, monkeypatch):
+    monkeypatch.setattr(message_cache, "MESSAGE_CACHE_SIZE", PAGE)
+    message_cache.init(redis_client)
+    yield redis_client
+    message_cache.init(None)
+
+
+async def _spread(messages: list) -> None:
+    """Distinct created_at, a minute apart and oldest first (SQLite keeps whole seconds)"""
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    async with database.async_session_maker() as db:
+        for i, message in enumerate(messages):
+            await db.execute(
+                update(models.Message).filter(models.Message.id == uuid.UUID(message["id"]))
+                .values(created_at=start + timedelta(minutes=i))
+            )
+        await db.commit()
+
+
+async def _page(api, member, channel_id: str, **params) -> list:
+    response = await api.client.get(f"/channels/{channel_id}/messages", params=params, headers=member.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _ids(messages: list) -> list:
+    return [message["id"] for message in messages]
+
+
+async def _cached(cache, channel_id: str) -> list:
+    body = await cache.get(message_cache._page_key(channel_id))
+    return None if body is None else json.loads(body)
+
+
+async def test_first_page_is_the_newest_messages_and_writes_through(api, cache):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    posted = [await api.post(alice, channel["id"], f"message {i}") for i in range(5)]
+    await _spread(posted)
+
+    assert _ids(await _page(api, alice, channel["id"], limit=PAGE)) == _ids(posted[2:])  # Miss, fills
+    assert _ids(await _cached(cache, channel["id"])) == _ids(posted[2:])
+    hits = message_cache.stats["hits"]
+    assert _ids(await _page(api, alice, channel["id"], limit=PAGE)) == _ids(posted[2:])
+    assert message_cache.stats["hits"] == hits + 1
+
+    # A new message is appended and the oldest trimmed off
+    newest = await api.post(alice, channel["id"], "message 5")
+    expected = _ids(posted[3:]) + [newest["id"]]
+    assert _ids(await _cached(cache, channel["id"])) == expected
+    assert _ids(await _page(api, alice, channel["id"], limit=PAGE)) == expected
+    assert _ids(await _page(api, alice, channel["id"], limit=2)) == expected[1:]
+    # Older pages count back from the newest, from the database
+    assert _ids(await _page(api, alice, channel["id"], skip=PAGE, limit=PAGE)) == _ids(posted[:3])
+
+    # A reply bumps its parent's count in place
+    await api.post(alice, channel["id"], "a reply", parent_id=posted[4]["id"])
+    counts = {item["id"]: item["reply_count"] for item in await _cached(cache, channel["id"])}
+    assert counts == {posted[3]["id"]: 0, posted[4]["id"]: 1, newest["id"]: 0}
+
+
+async def test_write_through_retries_when_the_page_changes_under_it(cache, redis_server):
+    channel_id = uuid.uuid4()
+    key = message_cache._page_key(channel_id)
+    await cache.set(key, json.dumps([{"id": "first"}]), ex=60)
+    other = fakeredis.FakeRedis(server=redis_server)  # Another worker
+    interfered = []
+
+    def mutate(page):
+        if not interfered:
+            interfered.append(True)
+            other.set(key, json.dumps(page + [{"id": "theirs"}]), ex=60)
+        return page + [{"id": "mine"}]
+
+    await message_cache._update_page(channel_id, mutate)
+    assert _ids(await _cached(cache, channel_id)) == ["first", "theirs", "mine"]
+
+    # Losing every time drops the page rather than serve a stale one
+    def always_interfere(page):
+        other.set(key, json.dumps(page), ex=60)
+        return page + [{"id": "mine"}]
+
+    await message_cache._update_page(channel_id, always_interfere)
+    assert await _cached(cache, channel_id) is None
+
+
+async def test_fill_is_skipped_when_a_write_came_after_the_snapshot(api, cache):
+    alice = await api.register("alice")
+    channel = await api.channel(alice, await api.workspace(alice))
+    version = await message_cache.snapshot_version(channel["id"])
+    await api.post(alice, channel["id"], "written while a reader queried")
+
+    await message_cache.fill(channel["id"], b"[]", version)
+    assert await _cached(cache, channel["id"]) is None
+    await message_cache.fill(channel["id"], b"[]", await message_cache.snapshot_version(channel["id"]))
+    assert await _cached(cache, channel["id"]) == []
+
+
+async def test_hiding_a_channel_drops_its_page(api, cache):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    await api.post(alice, channel["id"], "hello")
+    await _page(api, alice, channel["id"], limit=PAGE)
+    version = await message_cache.snapshot_version(channel["id"])
+    assert await _cached(cache, channel["id"]) is not None
+
+    response = await api.client.delete(f"/channels/{channel['id']}", headers=alice.headers)
+    assert response.status_code == 202, response.text
+    assert await _cached(cache, channel["id"]) is None
+    assert await message_cache.snapshot_version(channel["id"]) != version  # A reader from before can't refill it
+    response = await api.client.get(f"/channels/{channel['id']}/messages", params={"limit": PAGE}, headers=alice.headers)
+    assert response.status_code == 404
@@ -0,0 +1,37 @@
+import pytest
+
+import main
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def scrape(api, redis_client, monkeypatch):
+    monkeypatch.setattr(main.app.state, "redis", redis_client, raising=False)
+
+    async def scrape(**headers):
+        return await api.client.get("/metrics", headers=headers)
+    return scrape
+
+
+async def test_metrics_are_off_without_a_token(scrape, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics, "METRICS_PUBLIC", False)
+    assert (await scrape()).status_code == 404
+
+
+async def test_metrics_need_the_token_when_one_is_set(scrape, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "scrape-me")
+    monkeypatch.setattr(metrics, "METRICS_PUBLIC", True)  # A token wins over METRICS_PUBLIC
+    assert (await scrape()).status_code == 401
+    assert (await scrape(Authorization="Bearer wrong")).status_code == 401
+    response = await scrape(Authorization="Bearer scrape-me")
+    assert response.status_code == 200
+    assert f'worker="{metrics.WORKER_ID}"' in response.text
+
+
+async def test_metrics_can_be_made_public(scrape, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics, "METRICS_PUBLIC", True)
+    assert (await scrape()).status_code == 200
@@ -0,0 +1,101 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+import database
+import models
+
+pytestmark = pytest.mark.anyio
+
+
+async def _notifications(api, member) -> list:
+    response = await api.client.get("/notifications/", headers=member.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _broadcasts(api, member, message_id: str) -> list:
+    return [item for item in await _notifications(api, member) if item["related_id"] == message_id]
+
+
+async def test_channel_mention_reaches_members_but_not_the_sender(api):
+    alice, bob, carol = await api.register("alice"), await api.register("bob"), await api.register("carol")
+    workspace_id = await api.workspace(alice, bob, carol)
+    channel = await api.channel(alice, workspace_id)
+    message = await api.post(alice, channel["id"], "@channel standup in five")
+
+    for member in (bob, carol):
+        [notification] = await _broadcasts(api, member, message["id"])
+        assert notification["user_id"] == member.id
+        assert notification["content"] == f"@channel in #{channel['name']}"
+        assert not notification["is_read"]
+    assert await _broadcasts(api, alice, message["id"]) == []
+
+
+async def test_channel_mention_read_state_is_per_user(api):
+    alice, bob, carol = await api.register("alice"), await api.register("bob"), await api.register("carol")
+    workspace_id = await api.workspace(alice, bob, carol)
+    channel = await api.channel(alice, workspace_id)
+    message = await api.post(alice, channel["id"], "@channel release is out")
+    assert (await api.boot(bob, workspace_id, limit=0))["unread_notifications"] == 1
+
+    [notification] = await _broadcasts(api, bob, message["id"])
+    response = await api.client.post(f"/notifications/{notification['id']}/read", headers=bob.headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["is_read"]
+
+    assert [item["is_read"] for item in await _broadcasts(api, bob, message["id"])] == [True]
+    assert [item["is_read"] for item in await _broadcasts(api, carol, message["id"])] == [False]
+    assert (await api.boot(bob, workspace_id, limit=0))["unread_notifications"] == 0
+    assert (await api.boot(carol, workspace_id, limit=0))["unread_notifications"] == 1
+
+    # Someone the mention never reached can't mark it
+    outsider = await api.register("outsider")
+    response = await api.client.post(f"/notifications/{notification['id']}/read", headers=outsider.headers)
+    assert response.status_code == 404
+
+
+async def test_here_mention_is_not_listed(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    message = await api.post(alice, channel["id"], "@here anyone around?")
+    assert await _broadcasts(api, bob, message["id"]) == []
+    assert (await api.boot(bob, workspace_id, limit=0))["unread_notifications"] == 0
+
+
+async def test_channel_mention_skips_members_who_joined_later(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    message = await api.post(alice, channel["id"], "@channel before bob's time")
+    # Timestamps have second resolution on SQLite: move the mention clearly into the past
+    async with database.async_session_maker() as db:
+        await db.execute(
+            update(models.BroadcastMention).filter(models.BroadcastMention.message_id == uuid.UUID(message["id"]))
+            .values(created_at=datetime.now(timezone.utc) - timedelta(hours=1))
+        )
+        await db.commit()
+
+    await api.join(bob, workspace_id, alice)
+    assert await _broadcasts(api, bob, message["id"]) == []
+
+
+async def test_channel_mention_arrives_through_sync(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    cursor = (await api.boot(bob, workspace_id, limit=0))["cursor"]
+
+    message = await api.post(alice, channel["id"], "@channel lunch")
+    sync = await api.sync(bob, workspace_id, cursor)
+    assert [item["related_id"] for item in sync["notifications"]] == [message["id"]]
+    assert sync["unread_notifications"] == 1
+
+    # Marking it read is a change of its own
+    await api.client.post(f"/notifications/{sync['notifications'][0]['id']}/read", headers=bob.headers)
+    sync = await api.sync(bob, workspace_id, sync["cursor"])
+    assert [item["is_read"] for item in sync["notifications"]] == [True]
+    assert sync["unread_notifications"] == 0
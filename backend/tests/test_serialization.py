@@ -0,0 +1,148 @@
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+import crud
+import database
+import fastjson
+import message_cache
+import models
+import schemas
+
+pytestmark = pytest.mark.anyio
+
+
+async def _get(api, member, path: str, **params):
+    response = await api.client.get(path, params=params, headers=member.headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def _conversation(api) -> tuple:
+    """Two users, a message with an attachment, a mention and reactions from
+    both, a thread reply and a plain message"""
+    alice, bob = await api.register("alice"), await api.register("bob")
+    channel = await api.channel(alice, await api.workspace(alice, bob))
+    upload = (await api.client.post(
+        "/uploads", json={"filename": "note.txt", "file_type": "text/plain", "file_size": 5}, headers=alice.headers
+    )).json()
+    await api.client.put(upload["upload_url"], content=b"hello", headers=upload["headers"])
+    await api.client.post(f"/uploads/{upload['attachment']['id']}/complete", headers=alice.headers)
+
+    first = await api.post(alice, channel["id"], f"@{bob.username} see this", attachment_ids=[upload["attachment"]["id"]])
+    for member, emoji in ((alice, "👍"), (bob, "👍"), (bob, "🎉")):
+        response = await api.client.post(
+            f"/channels/{channel['id']}/messages/{first['id']}/reactions", params={"emoji": emoji}, headers=member.headers
+        )
+        assert response.status_code == 200, response.text
+    await api.post(bob, channel["id"], "a reply", parent_id=first["id"])
+    await api.post(bob, channel["id"], "and another thing")
+    return alice, bob, channel, first
+
+
+def _assert_expands_to(compact: list, users: dict, full: list) -> None:
+    """Compact messages carry what the full ones do once users are looked up and
+    reactions spread back out (the frontend's expandMessages)"""
+    assert len(compact) == len(full)
+    for item, expected in zip(compact, full):
+        item, expected = dict(item), dict(expected)
+        assert users[item["user_id"]] == expected.pop("user")
+        summary, reactions = item.pop("reactions"), expected.pop("reactions")
+        assert all(entry["count"] == len(entry["user_ids"]) for entry in summary)
+        assert sorted((entry["emoji"], user_id) for entry in summary for user_id in entry["user_ids"]) == \
+            sorted((reaction["emoji"], reaction["user_id"]) for reaction in reactions)
+        assert all(users[reaction["user_id"]] == reaction["user"] for reaction in reactions)
+        assert item == expected
+
+
+async def _assert_history_equivalent(api, member, channel_id: str, **params) -> list:
+    path = f"/channels/{channel_id}/messages"
+    full = await _get(api, member, path, **params)
+    compact = await _get(api, member, path, format="compact", **params)
+    assert set(compact) == {"users", "messages"}
+    _assert_expands_to(compact["messages"], compact["users"], full)
+    return full
+
+
+async def test_compact_history_expands_to_the_full_format(api):
+    alice, _, channel, first = await _conversation(api)
+
+    newest = await _assert_history_equivalent(api, alice, channel["id"])  # First page
+    assert len(newest) == 2 and first["id"] in [item["id"] for item in newest]
+    assert len(await _assert_history_equivalent(api, alice, channel["id"], skip=1, limit=1)) == 1
+    assert len(await _assert_history_equivalent(api, alice, channel["id"], parent_id=first["id"])) == 1
+
+
+async def test_compact_first_page_from_the_cache_expands_to_the_full_format(api, redis_client):
+    message_cache.init(redis_client)
+    try:
+        alice, _, channel, _ = await _conversation(api)
+        await _assert_history_equivalent(api, alice, channel["id"])  # Fills the cache
+        hits = message_cache.stats["hits"]
+        await _assert_history_equivalent(api, alice, channel["id"])
+        assert message_cache.stats["hits"] == hits + 2
+    finally:
+        message_cache.init(None)
+
+
+async def test_compact_thread_and_mentions_expand_to_the_full_format(api):
+    alice, bob, channel, first = await _conversation(api)
+
+    path = f"/channels/{channel['id']}/threads/{first['id']}"
+    full, compact = await _get(api, alice, path), await _get(api, alice, path, format="compact")
+    assert compact["reply_count"] == full["reply_count"] == 1
+    _assert_expands_to([compact["parent"]], compact["users"], [full["parent"]])
+    _assert_expands_to(compact["replies"], compact["users"], full["replies"])
+
+    full = await _get(api, bob, "/users/me/mentions")
+    compact = await _get(api, bob, "/users/me/mentions", format="compact")
+    assert [item["id"] for item in full] == [first["id"]]
+    _assert_expands_to(compact["messages"], compact["users"], full)
+
+
+def _assert_dumps_like_pydantic(row, schema) -> None:
+    """fastjson's output for a row is what response_model validation would send
+    (FastAPI validates with from_attributes, nested models included)"""
+    expected = schema.model_validate(row, from_attributes=True).model_dump(mode="json")
+    assert json.loads(fastjson.dumps(fastjson.dump(row, schema))) == expected
+
+
+async def test_fast_json_matches_the_response_models(api):
+    alice, bob, channel, first = await _conversation(api)
+    workspace_id, channel_id = uuid.UUID(channel["workspace_id"]), uuid.UUID(channel["id"])
+    message_id = uuid.UUID(first["id"])
+    await api.dm(alice, channel["workspace_id"], bob)
+
+    async with database.async_session_maker() as db:
+        history = await crud.get_messages(db, channel_id=channel_id)
+        counts = await crud.get_thread_replies_counts(db, [message.id for message in history])
+        for message in history:
+            message.reply_count = counts.get(message.id, 0)
+        replies = await crud.get_messages(db, channel_id=channel_id, parent_id=message_id)
+        parent = await crud.get_message_with_user(db, message_id)
+        mentions = await crud.get_mentions(db, uuid.UUID(bob.id))
+        channels = await crud.get_channels(db, workspace_id=workspace_id, user_id=uuid.UUID(alice.id))
+
+        assert len(history) == 2 and replies and mentions and len(channels) == 2
+        for message in [*history, *replies, parent]:
+            _assert_dumps_like_pydantic(message, schemas.Message)
+        for message in mentions:
+            _assert_dumps_like_pydantic(message, schemas.MentionOut)
+        assert any(channel.members for channel in channels)  # The DM lists its members
+        for channel in channels:
+            _assert_dumps_like_pydantic(channel, schemas.Channel)
+
+
+def test_fast_json_writes_datetimes_like_pydantic():
+    aware = datetime(2025, 12, 1, 12, 30, 45, 123456, tzinfo=timezone.utc)
+    naive = datetime(2025, 12, 1, 12, 30, 45)  # What SQLite hands back
+    user = models.User(id=uuid.uuid4(), email="alice@example.com", username="alice", role="user", created_at=naive)
+    message = models.Message(
+        id=uuid.uuid4(), content="hi", channel_id=uuid.uuid4(), user_id=user.id, user=user, created_at=aware,
+        reactions=[models.Reaction(id=uuid.uuid4(), message_id=uuid.uuid4(), user_id=user.id, emoji="👍",
+                                   created_at=aware.replace(microsecond=0), user=user)],
+    )
+    _assert_dumps_like_pydantic(message, schemas.Message)
+    assert json.loads(fastjson.dumps(fastjson.dump(message, schemas.Message)))["created_at"] == "2025-12-01T12:30:45.123456Z"
@@ -0,0 +1,65 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+import database
+import models
+import slack_import
+from conftest import unique
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def export(tmp_path):
+    """A one-channel, one-day Slack export directory"""
+    users = [{"id": slack_id, "name": unique(slack_id.lower()), "profile": {"email": f"{unique('slack')}@example.com"}}
+             for slack_id in ("U1", "U2")]
+    files = {
+        "users.json": users,
+        "channels.json": [{"id": "C1", "name": "general", "creator": "U1", "members": ["U1", "U2"], "created": 0}],
+        "general/2024-01-01.json": [
+            {"type": "message", "user": "U1", "ts": "1704100000.000100", "text": "hello <@U2>", "reactions": [
+                {"name": "+1", "users": ["U1", "U2"]}, {"name": "thumbsup", "users": ["U2"]},
+                {"name": "thumbsup::skin-tone-2", "users": ["U2"]}, {"name": "cat", "users": ["U2"]},
+            ]},
+        ],
+    }
+    for name, content in files.items():
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text(json.dumps(content))
+    return tmp_path
+
+
+async def _import(export, owner, **options) -> dict:
+    return await slack_import.run_import(str(export), workspace_name=unique("slack"), owner=owner.username, **options)
+
+
+async def test_finished_import_is_not_repeated_without_force(api, export):
+    owner = await api.register("owner")
+    first = await _import(export, owner)
+    assert (first["messages"], first["mentions"]) == (1, 1)
+
+    with pytest.raises(SystemExit, match="already imported"):
+        await _import(export, owner)
+
+    again = await _import(export, owner, force=True)
+    assert again["workspace_id"] != first["workspace_id"] and again["messages"] == 1
+    async with database.async_session_maker() as db:
+        result = await db.execute(select(models.Import.workspace_id).filter(models.Import.source == str(export)))
+        assert sorted(map(str, result.scalars())) == sorted([first["workspace_id"], again["workspace_id"]])
+
+
+async def test_reaction_names_for_the_same_emoji_become_one_reaction(api, export):
+    summary = await _import(export, await api.register("owner"))
+    assert summary["reactions"] == 3
+    async with database.async_session_maker() as db:
+        result = await db.execute(
+            select(models.Reaction.user_id, models.Reaction.emoji).join(models.Message)
+            .join(models.Channel).filter(models.Channel.workspace_id == uuid.UUID(summary["workspace_id"]))
+        )
+        rows = list(result)
+    assert len(rows) == len(set(rows)) == 3
+    assert sorted(emoji for _, emoji in rows) == sorted(["👍", "👍", ":cat:"])
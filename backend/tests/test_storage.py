@@ -0,0 +1,134 @@
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import storage
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2025, 12, 1, 12, 30, 45, tzinfo=timezone.utc)
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _botocore_presign(method: str, url: str, headers: dict, expires: int) -> str:
+    """The same request presigned by botocore, the reference SigV4 signer"""
+    from botocore.auth import S3SigV4QueryAuth
+    from botocore.awsrequest import AWSRequest
+    from botocore.credentials import Credentials
+
+    request = AWSRequest(method=method, url=url, headers=headers)
+    auth = S3SigV4QueryAuth(Credentials("AKIDEXAMPLE", "secret/KEY+example"), "s3", "eu-west-1", expires)
+    auth.add_auth(request)
+    return request.url
+
+
+def _query(url: str) -> dict:
+    return {name: values[0] for name, values in parse_qs(urlsplit(url).query).items()}
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    botocore_auth = pytest.importorskip("botocore.auth")
+    monkeypatch.setattr(storage, "datetime", _FrozenDatetime)
+    monkeypatch.setattr(botocore_auth, "get_current_datetime", lambda: NOW.replace(tzinfo=None))
+    return storage.S3Storage(
+        endpoint_url="http://minio:9000", public_endpoint_url="https://files.example.com", bucket="attachments",
+        region="eu-west-1", access_key_id="AKIDEXAMPLE", secret_access_key="secret/KEY+example",
+    )
+
+
+def test_s3_presigned_put_matches_sigv4(s3):
+    key = "2025/12/a file+name~.png"
+    url, headers = s3.presign_put(key, "image/png", 1234, expires=900)
+    assert headers == {"Content-Type": "image/png"}
+    assert url.startswith("https://files.example.com/attachments/2025/12/a%20file%2Bname~.png?")
+
+    expected = _botocore_presign(
+        "PUT", url.split("?")[0], {"Content-Type": "image/png", "Content-Length": "1234"}, 900
+    )
+    assert _query(url) == _query(expected)
+    assert _query(url)["X-Amz-SignedHeaders"] == "content-length;content-type;host"
+
+
+def test_s3_presigned_get_matches_sigv4(s3):
+    url = s3.presign_get("2025/12/report.pdf", expires=60)
+    assert _query(url) == _query(_botocore_presign("GET", url.split("?")[0], {}, 60))
+    # Server-side calls sign for the internal endpoint
+    assert s3.presign("HEAD", "2025/12/report.pdf").startswith("http://minio:9000/attachments/")
+
+
+def test_s3_signature_covers_the_signed_headers(s3):
+    url, _ = s3.presign_put("k.png", "image/png", 10)
+    assert _query(url)["X-Amz-Signature"] != _query(s3.presign_put("k.png", "image/png", 11)[0])["X-Amz-Signature"]
+    assert _query(url)["X-Amz-Signature"] != _query(s3.presign_put("k.png", "text/html", 10)[0])["X-Amz-Signature"]
+
+
+def test_attachment_links_verify_only_unchanged_and_unexpired():
+    url = storage.attachment_url("1b4e28ba-2fa1-11d2-883f-0016d3cca427")
+    params = _query(url)
+    expires, signature = int(params["expires"]), params["signature"]
+    assert expires - time.time() >= storage.ATTACHMENT_URL_EXPIRES_SECONDS  # At least one full window
+    assert storage.verify_attachment_url("1b4e28ba-2fa1-11d2-883f-0016d3cca427", expires, signature)
+    assert not storage.verify_attachment_url("1b4e28ba-2fa1-11d2-883f-0016d3cca428", expires, signature)
+    assert not storage.verify_attachment_url("1b4e28ba-2fa1-11d2-883f-0016d3cca427", expires + 1, signature)
+
+    past = int(time.time()) - 1
+    signature = storage._sign("GET", "attachments/1b4e28ba-2fa1-11d2-883f-0016d3cca427", past)
+    assert not storage.verify_attachment_url("1b4e28ba-2fa1-11d2-883f-0016d3cca427", past, signature)
+
+
+async def _reserve(api, member, size: int, file_type: str = "text/plain") -> dict:
+    response = await api.client.post(
+        "/uploads", json={"filename": "note.txt", "file_type": file_type, "file_size": size}, headers=member.headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_local_presigned_upload_round_trip(api):
+    alice = await api.register("alice")
+    upload = await _reserve(api, alice, 5)
+
+    response = await api.client.put(upload["upload_url"], content=b"hello", headers=upload["headers"])
+    assert response.status_code == 204, response.text
+    # Stored files are immutable: the URL can't be replayed
+    response = await api.client.put(upload["upload_url"], content=b"HELLO", headers=upload["headers"])
+    assert response.status_code == 409
+
+    response = await api.client.post(f"/uploads/{upload['attachment']['id']}/complete", headers=alice.headers)
+    assert response.status_code == 200, response.text
+    link = response.json()["url"]
+    response = await api.client.get(link)
+    assert response.status_code == 200 and response.content == b"hello"
+
+    # The signed link is bound to its expiry and signature
+    tampered = link.replace(f"expires={_query(link)['expires']}", f"expires={int(_query(link)['expires']) + 60}")
+    assert (await api.client.get(tampered)).status_code == 403
+    assert (await api.client.get(link[:-4] + "0000")).status_code == 403
+
+
+async def test_local_presigned_upload_refuses_what_was_not_signed(api):
+    alice = await api.register("alice")
+    upload = await _reserve(api, alice, 5)
+    url, headers = upload["upload_url"], upload["headers"]
+
+    wrong_type = await api.client.put(url, content=b"hello", headers={"Content-Type": "text/html"})
+    assert wrong_type.status_code == 403
+    other_size = url.replace("size=5", "size=6")
+    assert (await api.client.put(other_size, content=b"hello!", headers=headers)).status_code == 403
+    assert (await api.client.put(url, content=b"hello!", headers=headers)).status_code == 400
+    assert (await api.client.put(url, content=b"hell", headers=headers)).status_code == 400
+
+    key = urlsplit(url).path.removeprefix("/uploads/local/")
+    expired, headers = storage.get_storage("local").presign_put(key, "text/plain", 5, expires=-1)
+    assert (await api.client.put(expired, content=b"hello", headers=headers)).status_code == 403
+
+    # Nothing was stored by the refused attempts; the real one still goes through
+    assert (await api.client.put(url, content=b"hello", headers=headers)).status_code == 204
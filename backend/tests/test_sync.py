@@ -0,0 +1,117 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete, func, select, update
+
+import changes
+import database
+import models
+
+pytestmark = pytest.mark.anyio
+
+
+async def _last_change_id() -> int:
+    async with database.async_session_maker() as db:
+        return (await db.execute(select(func.max(models.Change.id)))).scalar()
+
+
+async def test_sync_returns_changes_after_the_boot_cursor(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    channel = await api.channel(alice, workspace_id)
+    cursor = (await api.boot(bob, workspace_id, limit=0))["cursor"]
+
+    message = await api.post(alice, channel["id"], "hello")
+    sync = await api.sync(bob, workspace_id, cursor, channel_id=channel["id"])
+    assert not sync["reset"]
+    assert sync["cursor"] > cursor
+    assert [item["id"] for item in sync["channels"]] == [channel["id"]]
+    assert [item["id"] for item in sync["messages"]] == [message["id"]]
+
+    again = await api.sync(bob, workspace_id, sync["cursor"], channel_id=channel["id"])
+    assert again["cursor"] == sync["cursor"]
+    assert again["channels"] == [] and again["messages"] == []
+
+
+async def test_sync_leaves_out_other_workspaces_and_unopened_channels(api):
+    alice, bob = await api.register("alice"), await api.register("bob")
+    workspace_id = await api.workspace(alice, bob)
+    other_workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    elsewhere = await api.channel(alice, other_workspace_id)
+    cursor = (await api.boot(bob, workspace_id, limit=0))["cursor"]
+
+    await api.post(alice, elsewhere["id"], "not for bob")
+    await api.post(alice, channel["id"], "for bob")
+    sync = await api.sync(bob, workspace_id, cursor)
+    assert [item["id"] for item in sync["channels"]] == [channel["id"]]
+    assert sync["messages"] == []  # No channel_id: the sidebar only
+
+
+async def test_sync_holds_the_cursor_below_a_recent_gap(api):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    cursor = (await api.boot(alice, workspace_id, limit=0))["cursor"]
+    before_gap = await _last_change_id()
+
+    # An id handed out to a write that hasn't committed yet: the row after it is visible first
+    async with database.async_session_maker() as db:
+        channel_id = uuid.UUID(channel["id"])
+        db.add(models.Change(id=before_gap + 2, kind="channel", entity_id=channel_id,
+                             workspace_id=uuid.UUID(workspace_id), channel_id=channel_id, deleted=False))
+        await db.commit()
+
+    sync = await api.sync(alice, workspace_id, cursor)
+    assert sync["cursor"] == before_gap
+    assert [item["id"] for item in sync["channels"]] == [channel["id"]]
+    # Still in flight: the row past the gap comes again
+    assert [item["id"] for item in (await api.sync(alice, workspace_id, sync["cursor"]))["channels"]] == [channel["id"]]
+
+    # Past the grace period the gap counts as a rolled back write
+    async with database.async_session_maker() as db:
+        await db.execute(
+            update(models.Change).filter(models.Change.id == before_gap + 2)
+            .values(created_at=datetime.now(timezone.utc) - timedelta(seconds=changes.SYNC_GAP_GRACE_SECONDS + 60))
+        )
+        await db.commit()
+    sync = await api.sync(alice, workspace_id, sync["cursor"])
+    assert sync["cursor"] >= before_gap + 2
+
+
+async def test_sync_asks_for_a_reload_when_the_cursor_is_unknown(api):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    last = await _last_change_id()
+    sync = await api.sync(alice, workspace_id, last + 1000)
+    assert sync["reset"] and sync["cursor"] == last + 1000
+
+
+async def test_sync_asks_for_a_reload_when_too_much_changed(api, monkeypatch):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    cursor = (await api.boot(alice, workspace_id, limit=0))["cursor"]
+    monkeypatch.setattr(changes, "SYNC_MAX_CHANGES", 2)
+    for i in range(3):
+        await api.post(alice, channel["id"], f"message {i}")
+    assert (await api.sync(alice, workspace_id, cursor))["reset"]
+
+
+async def test_sync_asks_for_a_reload_when_the_cursor_was_pruned(api):
+    alice = await api.register("alice")
+    workspace_id = await api.workspace(alice)
+    channel = await api.channel(alice, workspace_id)
+    cursor = (await api.boot(alice, workspace_id, limit=0))["cursor"]
+    await api.post(alice, channel["id"], "one")
+    await api.post(alice, channel["id"], "two")
+
+    # What prune() leaves: everything up to some point gone, the newest row kept
+    async with database.async_session_maker() as db:
+        await db.execute(delete(models.Change).filter(models.Change.id <= cursor + 1))
+        await db.commit()
+    sync = await api.sync(alice, workspace_id, cursor)
+    assert sync["reset"]
+    # A cursor from a fresh boot works again
+    assert not (await api.sync(alice, workspace_id, (await api.boot(alice, workspace_id, limit=0))["cursor"]))["reset"]
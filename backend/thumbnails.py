@@ -0,0 +1,100 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set
+
+# Derivative sizes (longest edge in pixels). "thumb" covers the inline chat
+# preview (max-w-xs at 1.5x), "preview" is used by the image modal.
+THUMBNAIL_VARIANTS = {
+    "thumb": 480,
+    "preview": 1600,
+}
+THUMBNAIL_FORMAT = "webp"
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", min(2, os.cpu_count() or 1)))
+
+# Pillow can decode these; anything else (svg, heic, ...) is served as-is.
+SUPPORTED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Bounds the number of images waiting on the pool so a burst of uploads
+# queues here instead of piling decoded work into the executor.
+_slots: Optional[asyncio.Semaphore] = None
+# Derivative paths known to exist on disk (skips the stat on repeat calls)
+_built: Set[str] = set()
+# Source path -> in-flight render, so concurrent callers share one build
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def is_supported(file_type: Optional[str]) -> bool:
+    return (file_type or "").lower() in SUPPORTED_IMAGE_TYPES
+
+
+def derivative_path(path: str, variant: str) -> str:
+    """Path of a derivative, stored next to the original blob"""
+    base, _ = os.path.splitext(path)
+    return f"{base}.{variant}.{THUMBNAIL_FORMAT}"
+
+
+def _render_derivatives(source: str, targets: Dict[str, int]) -> None:
+    # Runs inside the process pool: decode once, then downscale from the
+    # largest derivative to the smallest.
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+        for target, size in sorted(targets.items(), key=lambda item: -item[1]):
+            img.thumbnail((size, size), Image.LANCZOS)
+            tmp_path = f"{target}.tmp"
+            img.save(tmp_path, format=THUMBNAIL_FORMAT.upper(), quality=THUMBNAIL_QUALITY, method=4)
+            # Atomic rename so a half-written derivative is never served
+            os.replace(tmp_path, target)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _slots
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        _slots = asyncio.Semaphore(THUMBNAIL_WORKERS * 4)
+    return _pool
+
+
+async def ensure_derivatives(source: str) -> Dict[str, str]:
+    """Build any missing derivatives for an image on disk. Each derivative is built once."""
+    targets = {derivative_path(source, v): size for v, size in THUMBNAIL_VARIANTS.items()}
+    missing = {}
+    for target, size in targets.items():
+        if target in _built:
+            continue
+        if os.path.exists(target):
+            _built.add(target)
+            continue
+        missing[target] = size
+
+    if missing:
+        future = _inflight.get(source)
+        if future is None:
+            future = asyncio.ensure_future(_build(source, missing))
+            _inflight[source] = future
+            future.add_done_callback(lambda _: _inflight.pop(source, None))
+        await asyncio.shield(future)
+
+    return {v: derivative_path(source, v) for v in THUMBNAIL_VARIANTS}
+
+
+async def _build(source: str, missing: Dict[str, int]) -> None:
+    pool = _get_pool()
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(pool, _render_derivatives, source, missing)
+    _built.update(missing)
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,365 @@
+import asyncio
+import functools
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+
+import logs
+
+log = logs.get_logger("tracing")
+
+# Lightweight tracing: one trace per REST request / WS frame, with child spans
+# for SQL statements, Redis commands, fan-out and selected crud calls. Spans
+# are buffered in-process and exported in batches by a background task, as
+# JSON lines to a file or as OTLP/HTTP JSON to a collector.
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", 0))  # 0 disables tracing
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")  # file | otlp
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "diligental-backend")
+# Sampled traces slower than this also get a per-step breakdown logged
+TRACING_SLOW_MS = float(os.getenv("TRACING_SLOW_MS", 500))
+# An inbound traceparent always joins the caller's trace, but its sampled flag
+# only decides sampling when the header comes from a trusted proxy/gateway;
+# otherwise any client could force (or suppress) tracing of its requests.
+TRACING_TRUST_TRACEPARENT = os.getenv("TRACING_TRUST_TRACEPARENT", "false").lower() == "true"
+TRACING_ENABLED = TRACING_SAMPLE_RATIO > 0
+
+_FLUSH_INTERVAL = 2.0
+_MAX_BUFFERED = 10000
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "_trace")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], trace: list, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._trace = trace  # All spans of this trace, exported when the root ends
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+_buffer: List[Span] = []
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def _parse_traceparent(header: Optional[str]):
+    """W3C traceparent -> (trace_id, parent_span_id, sampled) or None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+@contextmanager
+def trace(name: str, traceparent: Optional[str] = None, **attributes):
+    """Start a root span, sampled by TRACING_SAMPLE_RATIO (or by the caller's
+    traceparent flag when TRACING_TRUST_TRACEPARENT is set)"""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    parent = _parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        if not TRACING_TRUST_TRACEPARENT:
+            sampled = random.random() < TRACING_SAMPLE_RATIO
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACING_SAMPLE_RATIO
+    if not sampled:
+        yield None
+        return
+    span = Span(name, trace_id, parent_id, [], attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        span.end_ns = time.time_ns()
+        _finish_trace(span)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current span; a no-op outside a sampled trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, parent._trace, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end_ns = time.time_ns()
+        _record(child)
+
+
+def traced(name: str):
+    """Decorator wrapping an async function in a child span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(child: Span) -> None:
+    if child._trace is None:
+        _enqueue([child]) # Root already exported (e.g. span from a spawned task)
+    else:
+        child._trace.append(child)
+
+
+def _finish_trace(root: Span) -> None:
+    spans = root._trace + [root]
+    root._trace = None
+    for child in spans:
+        child._trace = None
+    if root.duration_ms >= TRACING_SLOW_MS:
+        _log_breakdown(root, spans)
+    _enqueue(spans)
+
+
+def _log_breakdown(root: Span, spans: List[Span]) -> None:
+    steps: Dict[str, List[float]] = {}
+    for child in spans:
+        if child is not root:
+            name = "redis" if child.name.startswith("redis ") else child.name
+            step = steps.setdefault(name, [0, 0.0])
+            step[0] += 1
+            step[1] += child.duration_ms
+    breakdown = ", ".join(
+        f"{name}={total:.1f}ms/{count}" for name, (count, total) in sorted(steps.items(), key=lambda item: -item[1][1])
+    )
+    log.info("slow_trace", trace_id=root.trace_id, root=root.name, ms=round(root.duration_ms, 1), steps=breakdown)
+
+
+def _enqueue(spans: List[Span]) -> None:
+    if len(_buffer) < _MAX_BUFFERED:
+        _buffer.extend(spans)
+
+
+# --- Exporters --------------------------------------------------------------
+
+def _write_file(lines: List[str]) -> None:
+    with open(TRACING_FILE, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans: List[Span]) -> dict:
+    """OTLP/HTTP JSON encoding (ExportTraceServiceRequest)"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "diligental.tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": 2 if s.parent_id is None else 1,  # SERVER for roots, INTERNAL otherwise
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+            } for s in spans],
+        }],
+    }]}
+
+
+async def _export(spans: List[Span], client: Optional[httpx.AsyncClient]) -> None:
+    if TRACING_EXPORTER == "otlp":
+        await client.post(TRACING_OTLP_ENDPOINT, json=_otlp_payload(spans))
+    else:
+        lines = [json.dumps(s.to_dict(), default=str) + "\n" for s in spans]
+        await asyncio.get_running_loop().run_in_executor(None, _write_file, lines)
+
+
+async def run_exporter() -> None:
+    """Background task: flush buffered spans every couple of seconds"""
+    client = httpx.AsyncClient(timeout=5.0) if TRACING_EXPORTER == "otlp" else None
+    try:
+        while True:
+            await asyncio.sleep(_FLUSH_INTERVAL)
+            await flush(client)
+    finally:
+        if _buffer:
+            await flush(client)
+        if client is not None:
+            await client.aclose()
+
+
+async def flush(client: Optional[httpx.AsyncClient] = None) -> None:
+    if not _buffer:
+        return
+    spans = _buffer[:]
+    del _buffer[:len(spans)]
+    try:
+        await _export(spans, client)
+    except Exception as e:
+        log.warning("trace_export_failed", dropped=len(spans), error=str(e))
+
+
+# --- Integrations -----------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current.get()
+    if parent is None:
+        return
+    child = Span("sql", parent.trace_id, parent.span_id, parent._trace, {"db.statement": statement[:500]})
+    conn.info.setdefault("trace_spans", []).append(child)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("trace_spans")
+    if not stack:
+        return
+    child = stack.pop()
+    child.end_ns = time.time_ns()
+    _record(child)
+
+
+def _handle_error(context):
+    """A failed statement never reaches after_cursor_execute: end its span here"""
+    stack = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if not stack:
+        return
+    child = stack.pop()
+    child.end_ns = time.time_ns()
+    child.error = repr(context.original_exception)
+    _record(child)
+
+
+def install(engine) -> None:
+    """Attach SQL span listeners to an (async) engine; no-op unless tracing is enabled"""
+    if not TRACING_ENABLED:
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def instrument_redis(client) -> None:
+    """Wrap a redis.asyncio client so commands (and pipeline executes) become spans"""
+    if not TRACING_ENABLED:
+        return
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    async def traced_execute_command(*args, **options):
+        if _current.get() is None:
+            return await execute_command(*args, **options)
+        with span(f"redis {args[0]}"):
+            return await execute_command(*args, **options)
+
+    def traced_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def traced_execute(*a, **kw):
+            with span("redis PIPELINE", commands=len(pipe.command_stack)):
+                return await execute(*a, **kw)
+
+        pipe.execute = traced_execute
+        return pipe
+
+    client.execute_command = traced_execute_command
+    client.pipeline = traced_pipeline
+
+
+class TracingMiddleware:
+    """ASGI middleware: one (sampled) trace per HTTP request; joins a W3C traceparent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with trace(f"HTTP {scope['method']}", traceparent) as root:
+            if root is None:
+                return await self.app(scope, receive, send)
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-trace-id", root.trace_id.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = scope.get("route")
+                root.name = f"HTTP {scope['method']} {route.path if route is not None else 'unmatched'}"
@@ -1,6 +1,10 @@
 from typing import List, Dict
 from fastapi import WebSocket
 import json
+import time
+
+import metrics
+import tracing
 
 class ConnectionManager:
     def __init__(self):
@@ -10,6 +14,8 @@ class ConnectionManager:
         self.user_connections: Dict[str, List[WebSocket]] = {}
         # Track which channel each user is currently viewing (for call routing)
         self.user_locations: Dict[str, str] = {}  # user_id -> channel_id
+        # Who opened each channel socket, so a deleted user's can be closed
+        self.socket_users: Dict[WebSocket, str] = {}
 
     async def connect(self, websocket: WebSocket, channel_id: str, user_id: str = None):
         await websocket.accept()
@@ -20,6 +26,7 @@ class ConnectionManager:
         # Track user location if user_id provided
         if user_id:
             self.user_locations[user_id] = channel_id
+            self.socket_users[websocket] = user_id
 
     def disconnect(self, websocket: WebSocket, channel_id: str, user_id: str = None):
         if channel_id in self.active_connections:
@@ -27,6 +34,7 @@ class ConnectionManager:
                 self.active_connections[channel_id].remove(websocket)
             if not self.active_connections[channel_id]:
                 del self.active_connections[channel_id]
+        self.socket_users.pop(websocket, None)
         
         # Remove user location tracking if provided
         if user_id and user_id in self.user_locations:
@@ -38,14 +46,19 @@ class ConnectionManager:
             # Iterate over a copy to avoid modification during iteration issues, 
             # though disconnect handles removal safely.
             # Using simple text send for now (JSON stringified)
+            start = time.perf_counter()
             message_str = json.dumps(message, default=str)
-            for connection in self.active_connections[channel_id]:
-                try:
-                    await connection.send_text(message_str)
-                except Exception:
-                    # Handle broken pipe or closed connection gracefully if needed
-                    # ideally disconnect() is called on close
-                    pass
+            connections = self.active_connections[channel_id]
+            with tracing.span("broadcast", channel_id=channel_id, recipients=len(connections)):
+                for connection in connections:
+                    try:
+                        await connection.send_text(message_str)
+                    except Exception:
+                        # Handle broken pipe or closed connection gracefully if needed
+                        # ideally disconnect() is called on close
+                        pass
+            metrics.BROADCAST_LATENCY.observe(time.perf_counter() - start, "channel")
+            metrics.BROADCAST_RECIPIENTS.observe(len(connections), "channel")
     
     async def connect_user(self, websocket: WebSocket, user_id: str):
         await websocket.accept()
@@ -62,12 +75,15 @@ class ConnectionManager:
 
     async def send_personal_message(self, message: dict, user_id: str):
         if user_id in self.user_connections:
+            start = time.perf_counter()
             message_str = json.dumps(message, default=str)
-            for connection in self.user_connections[user_id]:
-                try:
-                    await connection.send_text(message_str)
-                except Exception:
-                    pass
+            with tracing.span("send_personal", user_id=user_id):
+                for connection in self.user_connections[user_id]:
+                    try:
+                        await connection.send_text(message_str)
+                    except Exception:
+                        pass
+            metrics.BROADCAST_LATENCY.observe(time.perf_counter() - start, "personal")
     
     async def send_call_signal(self, message: dict, target_user_id: str):
         """Send call signals to user's notification WebSocket (cross-channel)"""
@@ -83,4 +99,27 @@ class ConnectionManager:
         """Get the channel a user is currently viewing"""
         return self.user_locations.get(user_id)
 
+    async def close_channel(self, channel_id: str, code: int = 4004):
+        """Close and forget every socket open on a deleted channel"""
+        for websocket in list(self.active_connections.get(channel_id, [])):
+            self.disconnect(websocket, channel_id, self.socket_users.get(websocket))
+            await self._close(websocket, code)
+
+    async def close_user(self, user_id: str, code: int = 4003):
+        """Close and forget a deleted user's channel and notification sockets"""
+        for websocket in list(self.user_connections.get(user_id, [])):
+            self.disconnect_user(websocket, user_id)
+            await self._close(websocket, code)
+        for channel_id, connections in list(self.active_connections.items()):
+            for websocket in [ws for ws in connections if self.socket_users.get(ws) == user_id]:
+                self.disconnect(websocket, channel_id, user_id)
+                await self._close(websocket, code)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            # Already closed by the client
+            pass
+
 manager = ConnectionManager()
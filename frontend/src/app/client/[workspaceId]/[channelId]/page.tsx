@@ -170,10 +170,12 @@ export default function ChannelPage({
     useEffect(() => {
         const fetchData = async () => {
             try {
-                const user = await api.getMe();
+                // User, channel and its first page in one round trip
+                const boot = await api.boot(workspaceId, channelId);
+                const user = boot.user;
                 setCurrentUser(user);
 
-                const ch = await api.getChannel(channelId);
+                const ch = boot.channels.find(c => c.id === channelId) ?? await api.getChannel(channelId);
                 setChannel(ch);
 
                 // Extract channel members for mention suggestions
@@ -209,7 +211,8 @@ export default function ChannelPage({
                     }
                 }
 
-                const hist = await api.getMessages(channelId);
+                const hist = boot.messages;
+                api.markChannelRead(channelId).catch(e => console.error("Failed to mark channel read", e));
                 // Ensure messages are sorted by date
                 const sorted = hist.sort((a: Message, b: Message) =>
                     new Date(a.created_at).getTime() - new Date(b.created_at).getTime()
@@ -748,17 +751,18 @@ export default function ChannelPage({
                                                             {att.file_type.startsWith('image/') ? (
                                                                 <div 
                                                                     className="relative rounded-lg overflow-hidden border border-white/10 cursor-pointer hover:border-white/30 transition-colors"
-                                                                    onClick={() => setSelectedImage({ src: `${process.env.NEXT_PUBLIC_API_URL}${att.file_path}`, alt: att.filename })}
+                                                                    onClick={() => setSelectedImage({ src: api.getAttachmentUrl(att, 'preview'), alt: att.filename })}
                                                                 >
                                                                     <img 
-                                                                        src={`${process.env.NEXT_PUBLIC_API_URL}${att.file_path}`} 
+                                                                        src={api.getAttachmentUrl(att, 'thumb')} 
+                                                                        loading="lazy" 
                                                                         alt={att.filename} 
                                                                         className="max-w-xs max-h-60 object-cover hover:opacity-80 transition-opacity"
                                                                     />
                                                                 </div>
                                                             ) : (
                                                                 <a 
-                                                                    href={`${process.env.NEXT_PUBLIC_API_URL}${att.file_path}`} 
+                                                                    href={api.getAttachmentUrl(att)} 
                                                                     target="_blank" 
                                                                     rel="noopener noreferrer"
                                                                     className="flex items-center gap-2 p-3 rounded-lg bg-white/5 border border-white/10 hover:bg-white/10 transition-colors"
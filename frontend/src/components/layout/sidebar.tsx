@@ -35,6 +35,7 @@ interface Channel {
     workspace_id: string;
     type?: 'public' | 'private' | 'dm' | 'voice';
     members?: { user: User }[];
+    unread?: boolean;
 }
 
 interface User {
@@ -54,20 +55,20 @@ function useSidebarLogic(currentWorkspaceId: string) {
     const [currentUser, setCurrentUser] = useState<User | null>(null);
     const [notifications, setNotifications] = useState<Notification[]>([]);
     const ws = useRef<WebSocket | null>(null);
+    const cursor = useRef<number | null>(null);
 
     const fetchData = async () => {
         try {
-            const [wsList, channelsList, userProfile] = await Promise.all([
-                api.getWorkspaces(),
-                api.getChannels(currentWorkspaceId),
-                api.getMe()
-            ]);
+            // One round trip; the channel page loads its own history
+            const boot = await api.boot(currentWorkspaceId, undefined, 0);
+            const wsList = boot.workspaces as Workspace[];
 
-            setWorkspaces(wsList as Workspace[]);
-            setChannels(channelsList as Channel[]);
-            setCurrentUser(userProfile as User);
+            setWorkspaces(wsList);
+            setChannels(boot.channels as Channel[]);
+            setCurrentUser(boot.user as User);
+            cursor.current = boot.cursor;
 
-            const current = (wsList as Workspace[]).find(w => w.id === currentWorkspaceId);
+            const current = wsList.find(w => w.id === currentWorkspaceId);
             if (current) setCurrentWorkspace(current);
         } catch (error) {
             console.error("Failed to fetch sidebar data", error);
@@ -80,6 +81,50 @@ function useSidebarLogic(currentWorkspaceId: string) {
         }
     }, [currentWorkspaceId]);
 
+    // Tab wake-up or back online: fetch only what changed since the last boot/sync
+    const syncData = async () => {
+        if (cursor.current === null || !currentWorkspaceId) return;
+        try {
+            const changes = await api.sync(currentWorkspaceId, cursor.current);
+            if (changes.reset) {
+                await fetchData();
+                return;
+            }
+            cursor.current = changes.cursor;
+            if (changes.channels.length || changes.removed_channels.length) {
+                setChannels(prev => {
+                    const changed = new Map(changes.channels.map(c => [c.id, c as Channel]));
+                    const kept = prev
+                        .filter(c => !changes.removed_channels.includes(c.id))
+                        .map(c => changed.get(c.id) ?? c);
+                    const known = new Set(prev.map(c => c.id));
+                    return [...kept, ...changes.channels.filter(c => !known.has(c.id)) as Channel[]];
+                });
+            }
+            if (changes.notifications.length) {
+                setNotifications(prev => {
+                    const changed = new Set(changes.notifications.map(n => n.id));
+                    return [...changes.notifications, ...prev.filter(n => !changed.has(n.id))]
+                        .sort((a, b) => b.created_at.localeCompare(a.created_at));
+                });
+            }
+        } catch (error) {
+            console.error("Failed to sync sidebar data", error);
+        }
+    };
+
+    useEffect(() => {
+        const onVisible = () => {
+            if (document.visibilityState === 'visible') syncData();
+        };
+        document.addEventListener('visibilitychange', onVisible);
+        window.addEventListener('online', syncData);
+        return () => {
+            document.removeEventListener('visibilitychange', onVisible);
+            window.removeEventListener('online', syncData);
+        };
+    }, [currentWorkspaceId]);
+
     // Notification Logic
     useEffect(() => {
         const fetchNotifs = async () => {
@@ -395,7 +440,7 @@ export function SidebarContent({
                                                 ) : (
                                                     <Hash className="w-4 h-4 mr-2" />
                                                 )}
-                                                <span className={cn("truncate font-normal text-[15px]", isActive && "font-semibold")}>
+                                                <span className={cn("truncate font-normal text-[15px]", (isActive || channel.unread) && "font-semibold", channel.unread && !isActive && "text-white")}>
                                                     {channel.name}
                                                 </span>
 
@@ -485,7 +530,7 @@ export function SidebarContent({
                                             <div className={cn("absolute -bottom-0.5 -right-0.5 w-2.5 h-2.5 rounded-full border-2 border-[#3f0e40] dark:border-[#2b2d31]", statusColor)} />
                                         </div>
 
-                                        <span className={cn("truncate font-normal text-[15px]", isActive && "font-semibold")}>
+                                        <span className={cn("truncate font-normal text-[15px]", (isActive || channel.unread) && "font-semibold", channel.unread && !isActive && "text-white")}>
                                             {displayName}
                                         </span>
                                     </Link>
@@ -34,6 +34,8 @@ export interface Channel {
     description?: string;
     type?: 'public' | 'private' | 'dm' | 'voice';
     members?: { user: User }[];
+    unread?: boolean;          // Sidebar (boot) only
+    last_message_at?: string | null;
 }
 
 export interface Reaction {
@@ -48,8 +50,10 @@ export interface Reaction {
 export interface Attachment {
     id: string;
     filename: string;
-    file_path: string;
     file_type: string;
+    url: string;
+    thumbnail_url?: string | null;
+    preview_url?: string | null;
 }
 
 export interface MentionedUser {
@@ -74,6 +78,32 @@ export interface Message {
     mentioned_users?: MentionedUser[];  // Users mentioned in this message
 }
 
+// Compact history (?format=compact): users listed once, reactions aggregated
+export interface CompactMessage extends Omit<Message, 'user' | 'reactions'> {
+    reactions: { emoji: string; count: number; user_ids: string[] }[];
+}
+
+export interface CompactPage {
+    users: Record<string, User>;
+    messages: CompactMessage[];
+}
+
+// Back to the full shape the views use (reactions get synthetic ids)
+export function expandMessages(page: CompactPage): Message[] {
+    return page.messages.map(({ reactions, ...message }) => ({
+        ...message,
+        user: page.users[message.user_id],
+        reactions: reactions.flatMap(r => r.user_ids.map(userId => ({
+            id: `${message.id}:${r.emoji}:${userId}`,
+            message_id: message.id,
+            user_id: userId,
+            emoji: r.emoji,
+            created_at: message.created_at,
+            user: page.users[userId],
+        }))),
+    }));
+}
+
 export type Notification = {
     id: string;
     content: string;
@@ -83,6 +113,29 @@ export type Notification = {
     related_id?: string;
 }
 
+// Everything the first render needs, from GET /boot in one round trip
+export interface Boot {
+    user: User;
+    workspaces: Workspace[];
+    workspace_id: string | null;
+    channels: Channel[];
+    channel_id: string | null;
+    unread_notifications: number;
+    messages: Message[];
+    cursor: number;            // For sync
+}
+
+// What changed since a cursor (GET /sync); reset means reload through boot
+export interface Sync {
+    cursor: number;
+    reset: boolean;
+    channels: Channel[];
+    removed_channels: string[];
+    messages: Message[];       // Of the channel passed in, if any
+    notifications: Notification[];
+    unread_notifications: number | null;
+}
+
 async function baseApiFetch<T>(method: string, endpoint: string, data?: any, options: FetchOptions = {}): Promise<T> {
     const { token: providedToken, headers, bodySerializer, ...rest } = options;
 
@@ -205,6 +258,9 @@ export const api = {
     }),
     register: (data: any) => api.post('/auth/register', data),
     getMe: () => api.get<User>('/users/me'),
+    // limit=0 skips the channel history
+    boot: (workspaceId?: string, channelId?: string, limit?: number) => baseApiFetch<Boot>('GET', '/boot', { workspace_id: workspaceId, channel_id: channelId, limit }),
+    sync: (workspaceId: string, since: number, channelId?: string) => baseApiFetch<Sync>('GET', '/sync', { workspace_id: workspaceId, since, channel_id: channelId }),
 
     // Workspaces
     createWorkspace: (name: string) => api.post<Workspace>('/workspaces/', { name }),
@@ -224,9 +280,10 @@ export const api = {
     deleteChannel: (channelId: string) => baseApiFetch<void>('DELETE', `/channels/${channelId}`, undefined, { headers: {} }).catch(e => { if (e.message !== "Unexpected end of JSON input") throw e; }),
     updateChannel: (channelId: string, name: string) => baseApiFetch<Channel>('PATCH', `/channels/${channelId}`, { name }),
     getChannel: (channelId: string) => api.get<Channel>(`/channels/${channelId}`),
+    markChannelRead: (channelId: string) => baseApiFetch<void>('POST', `/channels/${channelId}/read`, undefined, { headers: {} }).catch(e => { if (e.message !== "Unexpected end of JSON input") throw e; }),
 
     // Messages
-    getMessages: (channelId: string, parentId?: string) => baseApiFetch<Message[]>('GET', `/channels/${channelId}/messages`, { parent_id: parentId }),
+    getMessages: (channelId: string, parentId?: string) => baseApiFetch<CompactPage>('GET', `/channels/${channelId}/messages`, { parent_id: parentId, format: 'compact' }).then(expandMessages),
 
     // WebSocket
     getWebSocketUrl: (channelId: string) => {
@@ -262,19 +319,45 @@ export const api = {
     getNotifications: () => api.get<Notification[]>('/notifications/'),
     markNotificationRead: (id: string) => api.post<Notification>(`/notifications/${id}/read`),
 
+    // Attachments
+    // <img>/<a> tags can't send the Authorization header; the server hands out
+    // short-lived signed links instead
+    getAttachmentUrl: (att: Attachment, variant?: 'thumb' | 'preview') => {
+        const path = (variant === 'thumb' ? att.thumbnail_url : variant === 'preview' ? att.preview_url : null) || att.url;
+        return `${API_URL}${path}`;
+    },
+
     // File Upload
+    // Presigned flow: reserve the attachment, PUT the bytes straight to storage
+    // (object store or the API's local-disk target), then confirm.
     uploadFile: async (file: File) => {
-        const formData = new FormData();
-        formData.append('file', file);
-        
         const token = typeof window !== 'undefined' ? localStorage.getItem('token') : null;
-        
-        const response = await fetch(`${API_URL}/upload`, {
+        const authHeaders: Record<string, string> = token ? { Authorization: `Bearer ${token}` } : {};
+
+        const reserve = await fetch(`${API_URL}/uploads`, {
+            method: 'POST',
+            headers: { ...authHeaders, 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                filename: file.name,
+                file_type: file.type || 'application/octet-stream',
+                file_size: file.size
+            })
+        });
+        if (!reserve.ok) {
+             const errorData = await reserve.json().catch(() => ({}));
+             throw new Error(errorData.detail || 'Upload failed');
+        }
+        const { attachment, upload_url, method, headers } = await reserve.json();
+
+        const target = upload_url.startsWith('/') ? `${API_URL}${upload_url}` : upload_url;
+        const put = await fetch(target, { method, headers, body: file });
+        if (!put.ok) {
+            throw new Error('Upload failed');
+        }
+
+        const response = await fetch(`${API_URL}/uploads/${attachment.id}/complete`, {
             method: 'POST',
-            headers: {
-                ...(token ? { Authorization: `Bearer ${token}` } : {}),
-            },
-            body: formData
+            headers: authHeaders
         });
         
         if (!response.ok) {
@@ -286,8 +369,10 @@ export const api = {
         return {
             id: data.id,
             filename: data.filename,
-            file_path: data.file_path,
-            file_type: data.file_type
+            file_type: data.file_type,
+            url: data.url,
+            thumbnail_url: data.thumbnail_url,
+            preview_url: data.preview_url
         } as Attachment;
     },
 